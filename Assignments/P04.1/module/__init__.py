@@ -5,3 +5,4 @@ from module.timeconversion import convertTimeToSecondsNoDate
 from module.timeconversion import convertTimeToSeconds
 from module.timeconversion import convertTimeFromSeconds
 from module.timeconversion import convertDateToOtherDate
+from module.timeconversion import timeOfDaySeconds
@@ -13,6 +13,7 @@
 
 import time
 import datetime
+import functools
 
 """
 convertTimeToSecondsSimple
@@ -99,7 +100,22 @@ def convertDateToOtherDate(inTime):
     # Example return time: “27/10/22 12:12:07”
     tempString = str(inTime)
     rawString = str(tempString.replace(" ", "-")).split("-")
-    print(rawString)
     year = str(rawString[0][2::])
     return (rawString[2] + '/' + rawString[1] + '/' + year + ' ' + rawString[3])
-    
+
+
+# Most distinct "hour:minute:second" strings remembered by
+# timeOfDaySeconds between calls.
+timeCacheSize = 4096
+
+@functools.lru_cache(maxsize=timeCacheSize)
+def timeOfDaySeconds(inTime):
+    """
+    timeOfDaySeconds
+    Numeric, memoized version of convertTimeToSecondsSimple.
+    Parameters:         inTime: String containing a time code in the format of
+                                "hour:minute:second" without quotes
+    Returns:            timecode converted into plain seconds as a float.
+    """
+    tempTime2 = inTime.split(':')
+    return int(tempTime2[0]) * 3600 + int(tempTime2[1]) * 60 + float(tempTime2[2])
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Benchmarks fire broadcasts. Compares opening a new
+#              CommsSender for every message, the way the API used to,
+#              with the shared CommsPublisher in comms.py.
+#
+# Running Instructions:
+# - To use a real broker, start RabbitMQ locally with the default
+#   guest account and run "python3 benchmark_comms.py [messages] local".
+# - Without a broker, run "python3 benchmark_comms.py [messages]" to
+#   use an in-process stand-in that only simulates network delays.
+##############################################################################
+
+import json
+import sys
+import time
+
+import comms
+from comms import CommsSender, CommsPublisher
+
+localCreds = {
+    "exchange": "battleship",
+    "port": "5672",
+    "host": "localhost",
+    "user": "guest",
+    "password": "guest",
+}
+
+# Rough round trip costs for the stand-in broker, in seconds.
+connectDelay = 0.005
+publishDelay = 0.00005
+
+
+class StandInChannel(object):
+    """
+    StandInChannel
+    Pretends to be a pika channel. Publishing just sleeps.
+    """
+
+    def __init__(self):
+        self.is_closed = False
+
+    def exchange_declare(self, exchange, exchange_type):
+        time.sleep(connectDelay / 5)
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body):
+        time.sleep(publishDelay)
+
+
+class StandInConnection(object):
+    """
+    StandInConnection
+    Pretends to be a pika BlockingConnection. Connecting sleeps
+    for about as long as a TCP and AMQP handshake would.
+    """
+
+    def __init__(self, parameters):
+        time.sleep(connectDelay)
+        self.is_open = True
+        self.is_closed = False
+
+    def channel(self):
+        time.sleep(connectDelay / 5)
+        return StandInChannel()
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        self.is_open = False
+        self.is_closed = True
+
+
+def fireMessage(index):
+    """
+    fireMessage
+    Builds a fire message like the ones the API broadcasts.
+    """
+    return json.dumps({"lon": -98.0 + index * 0.0001, "lat": 34.0, "angle": 231.0, "kg": 1200})
+
+
+def timeMessages(label, sendAll, messages):
+    """
+    timeMessages
+    Times sending a number of messages and prints the rate.
+    """
+    start = time.perf_counter()
+    sendAll(messages)
+    elapsed = time.perf_counter() - start
+    rate = messages / elapsed
+    print(f"{label:<40} {rate:12.1f} messages/s")
+    return rate
+
+
+def sendPerMessage(messages):
+    """
+    sendPerMessage
+    Opens and closes a sender for each message.
+    """
+    for index in range(0, messages):
+        commsSender = CommsSender(**localCreds)
+        commsSender.sendCommand("benchmark.fire", fireMessage(index))
+        commsSender.closeConnection()
+
+
+def sendShared(confirmDelivery):
+    """
+    sendShared
+    Returns a function that sends every message through one publisher.
+    """
+    def sender(messages):
+        commsPublisher = CommsPublisher(confirmDelivery=confirmDelivery, **localCreds)
+        for index in range(0, messages):
+            commsPublisher.sendCommand("benchmark.fire", fireMessage(index))
+        commsPublisher.closeConnection()
+    return sender
+
+
+if __name__ == "__main__":
+    messages = 200
+    if len(sys.argv) > 1:
+        messages = int(sys.argv[1])
+
+    if len(sys.argv) > 2 and sys.argv[2] == "local":
+        print(f"Using RabbitMQ at {localCreds['host']}:{localCreds['port']}")
+    else:
+        comms.pika.BlockingConnection = StandInConnection
+        print("Using the in-process stand-in broker")
+    print(f"Messages: {messages}")
+
+    oldRate = timeMessages("New CommsSender per message", sendPerMessage, messages)
+    newRate = timeMessages("Shared CommsPublisher", sendShared(False), messages)
+    confirmRate = timeMessages("Shared CommsPublisher with confirms", sendShared(True), messages)
+
+    print(f"Speedup: {newRate / oldRate:.1f}x, with confirms: {confirmRate / oldRate:.1f}x")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Benchmarks hit detection. Fires a salvo of random shells
+#              across the bundled ships.json fleet and compares the
+#              original per-shell fleetHitDetection queries with the
+#              HitDetector, both one shell at a time and as one salvo.
+#
+# Running Instructions:
+# - Fill out .config.json the same way as for spatialapi.py.
+# - Run "python3 benchmark_hits.py [shells]" in this directory.
+# Warning: This resets the simulation tables just like the
+#          initializeSimulation route does.
+##############################################################################
+
+import asyncio
+import random
+import sys
+import time
+
+import spatialapi
+from spatialapi import DatabaseCursor, confPath
+from module import HitDetector
+
+# Original versions of the hit queries, kept only for comparison.
+legacyHitSQL = \
+"""
+    SELECT  ST_Centroid(ST_Intersection(ST_MakeLine(ST_SetSRID(ST_MakePoint({initX}, {initX}), 4326),
+                                    ST_SetSRID(ST_MakePoint({finalX}, {finalY}), 4326)),
+                            ST_Buffer(ship_polygon::geography, {buffer})::geometry(Polygon, 4326)))::jsonb,
+            ship_id
+    FROM ship_shapes
+    WHERE ST_Intersects(ST_MakeLine(ST_SetSRID(ST_MakePoint({initX}, {initX}), 4326),
+                                    ST_SetSRID(ST_MakePoint({finalX}, {finalY}), 4326)),
+                            ST_Buffer(ship_polygon::geography, {buffer})::geometry(Polygon, 4326))
+    ORDER BY ST_Distance(ST_SetSRID(ST_MakePoint({initX}, {initY}), 4326), ship_polygon) LIMIT 1;
+"""
+
+legacyClosestSQL = \
+"""
+    SELECT ST_Distance(ship_polygon::geography, ST_SetSRID(ST_MakePoint(0, 0), 4326)::geography)
+    FROM ship_shapes
+    ORDER BY ST_Distance(ship_polygon::geography, ST_SetSRID(ST_MakePoint(0, 0), 4326)::geography) ASC
+    LIMIT 1;
+"""
+
+
+def timeRun(label, function):
+    """
+    timeRun
+    Runs a function once and prints the time taken.
+    """
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed * 1000:10.2f} ms")
+    return elapsed, result
+
+
+def makeSalvo(shellCount):
+    """
+    makeSalvo
+    Builds random shell paths that start around the fleet and
+    end somewhere inside it, so a good share of them hit.
+    """
+    with DatabaseCursor(confPath) as cur:
+        cur.execute(
+            """
+                SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+                FROM (SELECT ST_Extent(ship_polygon) AS extent FROM ship_shapes) AS fleet_extent;
+            """)
+        minX, minY, maxX, maxY = cur.fetchone()
+
+    marginX = (maxX - minX) * 0.5
+    marginY = (maxY - minY) * 0.5
+    salvo = []
+    for index in range(0, shellCount):
+        salvo.append((
+            random.uniform(minX - marginX, maxX + marginX),
+            random.uniform(minY - marginY, maxY + marginY),
+            random.uniform(minX, maxX),
+            random.uniform(minY, maxY)))
+    return salvo
+
+
+def runLegacy(salvo):
+    """
+    runLegacy
+    Runs the original two queries for every shell.
+    """
+    def runner():
+        for initX, initY, finalX, finalY in salvo:
+            with DatabaseCursor(confPath) as cur:
+                cur.execute(legacyHitSQL.format(initX=initX, initY=initY,
+                    finalX=finalX, finalY=finalY, buffer=spatialapi.extraHitBuffer))
+                if cur.fetchone() == None:
+                    cur.execute(legacyClosestSQL)
+                    cur.fetchone()
+    return runner
+
+
+if __name__ == "__main__":
+    shellCount = 1000
+    if len(sys.argv) > 1:
+        shellCount = int(sys.argv[1])
+
+    # Load the local ships.json and bbox.json instead of the game server.
+    spatialapi.gameType = "offline"
+    spatialapi.gameName = "benchmark"
+    spatialapi.simulationDebugLevel = 0
+    asyncio.run(spatialapi.initializeSimulation())
+
+    random.seed(spatialapi.randSeed)
+    salvo = makeSalvo(shellCount)
+    hitDetector = HitDetector(lambda: DatabaseCursor(confPath))
+    print(f"Shells: {shellCount}")
+
+    oldTime, _ = timeRun("Original query per shell", runLegacy(salvo))
+    singleTime, _ = timeRun("HitDetector per shell",
+        lambda: [hitDetector.resolveSalvo([shell]) for shell in salvo])
+    salvoTime, results = timeRun("HitDetector whole salvo",
+        lambda: hitDetector.resolveSalvo(salvo))
+
+    hits = sum(1 for result in results if result["ship_id"] != None)
+    print(f"Hits: {hits} of {shellCount}")
+    print(f"Per shell speedup: {oldTime / singleTime:6.1f}x")
+    print(f"Salvo speedup:     {oldTime / salvoTime:6.1f}x")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Benchmarks the ship shape queries. Compares the original
+#              correlated subquery versions of updateShipShapes and
+#              updateShipShapesAlternate with the single join versions
+#              in spatialapi.py, using the bundled ships.json fleet.
+#
+# Running Instructions:
+# - Fill out .config.json the same way as for spatialapi.py.
+# - Run "python3 benchmark_shapes.py [repetitions]" in this directory.
+# Warning: This resets the simulation tables just like the
+#          initializeSimulation route does.
+##############################################################################
+
+import asyncio
+import sys
+import time
+
+import spatialapi
+from spatialapi import DatabaseCursor, confPath
+
+# Original versions of the shape queries, kept only for comparison.
+legacyShapeSQL = \
+"""
+    UPDATE ship_shapes 
+        SET ship_polygon = 
+            ST_SetSRID(ST_MakePolygon(
+                ST_AddPoint(
+                ST_AddPoint( 
+                ST_AddPoint( 
+                ST_MakeLine(
+                /* Bottom left point */
+                ST_Project
+                    (
+                        (
+                            ST_Project
+                            (
+                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) - (Pi() * 0.5)
+                            )::geometry (Point,4326)
+                        )::geography,
+                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + Pi()
+                    )::geometry (Point,4326),
+                /* Top left point */
+                ST_Project
+                    (
+                        (
+                            ST_Project
+                            (
+                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) - (Pi() * 0.5)
+                            )::geometry (Point,4326)
+                        )::geography,
+                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
+                    )::geometry (Point,4326)),
+                /* Top Right point */
+                ST_Project
+                    (
+                        (
+                            ST_Project
+                            (
+                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + (Pi() * 0.5)
+                            )::geometry (Point,4326)
+                        )::geography,
+                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
+                    )::geometry (Point,4326)),
+                /* Bottom right point */
+                ST_Project
+                    (
+                        (
+                            ST_Project
+                            (
+                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + (Pi() * 0.5)
+                            )::geometry (Point,4326)
+                        )::geography,
+                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + Pi()
+                    )::geometry (Point,4326)
+                ), 
+                /* Bottom left point */
+                ST_Project
+                    (
+                        (
+                            ST_Project
+                            (
+                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) - (Pi() * 0.5)
+                            )::geometry (Point,4326)
+                        )::geography,
+                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
+                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + Pi()
+                    )::geometry (Point,4326))
+            ), 4326);
+"""
+
+legacyShapeAlternateSQL = \
+"""
+    UPDATE ship_shapes 
+        SET ship_polygon = 
+            ST_SetSRID(ST_MakePolygon(
+                ST_AddPoint(
+                ST_AddPoint( 
+                ST_AddPoint( 
+                ST_MakeLine(
+                /* Bottom left point */
+                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
+                /* Top left point */
+                ST_Project
+                    (
+                        (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                        (SELECT ship_length FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
+                        (SELECT bearing FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
+                    )::geometry (Point,4326)),
+                /* Top Right point */
+                ST_Project
+                    (
+                        (
+                            ST_Project
+                            (
+                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                                (SELECT ship_width FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
+                                (SELECT bearing + (Pi() * 0.5) FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
+                            )::geometry (Point,4326)
+                        )::geography,
+                        (SELECT ship_length FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
+                        (SELECT bearing FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
+                    )::geometry (Point,4326)),
+                /* Bottom right point */
+                ST_Project
+                    (
+                        (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
+                        (SELECT ship_width FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
+                        (SELECT bearing + (Pi() * 0.5) FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
+                    )::geometry (Point,4326)
+                ), 
+                /* Bottom left point */
+                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1))
+            ), 4326);
+"""
+
+
+def timeRuns(label, function, repetitions):
+    """
+    timeRuns
+    Runs a function several times and prints the average time.
+    """
+    start = time.perf_counter()
+    for index in range(0, repetitions):
+        function()
+    elapsed = (time.perf_counter() - start) / repetitions
+    print(f"{label:<40} {elapsed * 1000:10.2f} ms")
+    return elapsed
+
+
+def runLegacy(sql):
+    """
+    runLegacy
+    Returns a function that runs one of the original shape queries.
+    """
+    def runner():
+        with DatabaseCursor(confPath) as cur:
+            cur.execute(sql)
+    return runner
+
+
+if __name__ == "__main__":
+    repetitions = 10
+    if len(sys.argv) > 1:
+        repetitions = int(sys.argv[1])
+
+    # Load the local ships.json and bbox.json instead of the game server.
+    spatialapi.gameType = "offline"
+    spatialapi.gameName = "benchmark"
+    spatialapi.simulationDebugLevel = 0
+    asyncio.run(spatialapi.initializeSimulation())
+
+    with DatabaseCursor(confPath) as cur:
+        cur.execute("SELECT COUNT(*), MIN(fleet_num) FROM fleet;")
+        shipCount, fleetNum = cur.fetchone()
+    print(f"Ships loaded: {shipCount}, repetitions: {repetitions}")
+
+    oldCenter = timeRuns("Original updateShipShapes", 
+        runLegacy(legacyShapeSQL), repetitions)
+    newCenter = timeRuns("Joined updateShipShapes", 
+        spatialapi.updateShipShapes, repetitions)
+    oneFleet = timeRuns("Joined updateShipShapes (one fleet)", 
+        lambda: spatialapi.updateShipShapes(fleetNums = [fleetNum]), repetitions)
+    oldAlternate = timeRuns("Original updateShipShapesAlternate", 
+        runLegacy(legacyShapeAlternateSQL), repetitions)
+    newAlternate = timeRuns("Joined updateShipShapesAlternate", 
+        spatialapi.updateShipShapesAlternate, repetitions)
+
+    print(f"Center speedup:    {oldCenter / newCenter:6.1f}x")
+    print(f"Alternate speedup: {oldAlternate / newAlternate:6.1f}x")
+
+    # Leave the shapes matching the normal center placement.
+    spatialapi.updateShipShapes()
@@ -49,12 +49,23 @@
     ```python
     commsSender.closeConnection()
     ```
+### Publisher:
+    A sender that stays connected. Use `getCommsPublisher` to share one connection and channel
+    per process, and `<team>.fire` messages sent close together are published back to back.
+
+    ```python
+    commsPublisher = getCommsPublisher(batchWindow=0.05, **creds)
+    commsPublisher.sendCommand("axis.fire","{'lon':dd.fffff,'lat':dd.fffff,'angle':dd.ff,'kg':dd.ff}")
+    ```
 ### Listener:
 
 """
+import functools
 import json
 import os
+import queue
 import sys
+import threading
 import time
 
 import pika
@@ -187,6 +198,112 @@ class CommsListener(Comms):
         #     json.dump(logDict, f, indent=4)
 
 
+class CommsConsumer(CommsListener):
+    def __init__(self, **kwargs):
+        """Extends CommsListener into a listener that hands messages to a
+        worker thread in small batches instead of handling them inside the
+        pika callback. Messages are only acked after `handler` returns, so a
+        batch is not lost if writing it fails. The broker never sends more
+        than `prefetch` unacked messages, which keeps the worker queue bounded.
+
+        Extra keyword arguments:
+            handler:     Called with a list of (routing_key, body) tuples.
+            prefetch:    Most unacked messages held at once. (Default 200)
+            batchSize:   Most messages handed to the handler at once. (Default 50)
+            batchWindow: Seconds to wait for a batch to fill. (Default 0.05)
+        """
+        self.handler = kwargs.get("handler", None)
+        self.prefetch = int(kwargs.get("prefetch", 200))
+        self.batchSize = int(kwargs.get("batchSize", 50))
+        self.batchWindow = float(kwargs.get("batchWindow", 0.05))
+
+        self.incoming = queue.Queue(maxsize=self.prefetch)
+        self.statsLock = threading.Lock()
+        self.received = 0
+        self.handled = 0
+        self.batches = 0
+        self.failedBatches = 0
+        self.startTime = time.monotonic()
+
+        super().__init__(**kwargs)
+        self.channel.basic_qos(prefetch_count=self.prefetch)
+
+        self.worker = threading.Thread(target=self.handleLoop, daemon=True)
+
+    def startConsuming(self):
+        self.channel.basic_consume(
+            queue=self.queue_name, on_message_callback=self.callback, auto_ack=False
+        )
+        self.worker.start()
+        self.channel.start_consuming()
+
+    def callback(self, ch, method, properties, body):
+        """Queues the message for the worker. Prefetch keeps the queue from
+        ever holding more than it can take, so this does not block.
+        """
+        with self.statsLock:
+            self.received += 1
+        self.incoming.put((method.delivery_tag, method.redelivered, method.routing_key, body))
+
+    def settle(self, batch, succeeded):
+        """Runs on the connection thread. Acks a handled batch at once, or
+        nacks a failed one. Failed messages are requeued once and dropped if
+        they fail again so one bad message can't block the queue forever.
+        """
+        if succeeded:
+            self.channel.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+            return
+        for deliveryTag, redelivered, routingKey, body in batch:
+            self.channel.basic_nack(delivery_tag=deliveryTag, requeue=not redelivered)
+
+    def handleLoop(self):
+        """Runs on the worker thread. Gathers up to `batchSize` messages or
+        whatever arrives within `batchWindow`, hands them to the handler,
+        then has the connection thread ack them.
+        """
+        while True:
+            batch = [self.incoming.get()]
+            deadline = time.monotonic() + self.batchWindow
+            while len(batch) < self.batchSize:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.incoming.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            succeeded = True
+            try:
+                if self.handler != None:
+                    self.handler([(message[2], message[3]) for message in batch])
+            except Exception as exception:
+                succeeded = False
+                print(f"Error: batch of {len(batch)} messages failed: {exception}")
+
+            with self.statsLock:
+                self.batches += 1
+                if succeeded:
+                    self.handled += len(batch)
+                else:
+                    self.failedBatches += 1
+            self.connection.add_callback_threadsafe(
+                functools.partial(self.settle, batch, succeeded)
+            )
+
+    def getStats(self):
+        with self.statsLock:
+            elapsed = time.monotonic() - self.startTime
+            return {
+                "received": self.received,
+                "handled": self.handled,
+                "queued": self.incoming.qsize(),
+                "batches": self.batches,
+                "failed_batches": self.failedBatches,
+                "messages_per_second": self.handled / elapsed if elapsed > 0 else 0.0,
+            }
+
+
 class CommsSender(Comms):
     def __init__(self, **kwargs):
         """Extends Comms and adds a "send" method which sends data to a
@@ -201,6 +318,149 @@ class CommsSender(Comms):
         self.connection.close()
 
 
+class CommsPublisher(CommsSender):
+    def __init__(self, **kwargs):
+        """Extends CommsSender to keep one connection and channel open for the
+        life of the process. Messages are handed to a background thread that
+        owns the channel, reconnects if the broker drops it, and optionally
+        waits for publisher confirms. Fire messages are held for up to
+        `batchWindow` seconds so a volley goes out back to back.
+
+        Extra keyword arguments:
+            batchWindow:     Seconds to hold `<team>.fire` messages. (Default 0.05)
+            confirmDelivery: Wait for the broker to confirm each publish. (Default False)
+            maxRetries:      Reconnect attempts per message. (Default 3)
+        """
+        self.batchWindow = float(kwargs.get("batchWindow", 0.05))
+        self.confirmDelivery = bool(kwargs.get("confirmDelivery", False))
+        self.maxRetries = int(kwargs.get("maxRetries", 3))
+
+        self.outgoing = queue.Queue()
+        self.stopEvent = threading.Event()
+        self.published = 0
+        self.batches = 0
+        self.reconnects = 0
+        self.failed = 0
+
+        super().__init__(**kwargs)
+
+        self.worker = threading.Thread(target=self.publishLoop, daemon=True)
+        self.worker.start()
+
+    def establishConnection(self, **kwargs):
+        """Connects like Comms, then turns on publisher confirms if asked."""
+        super().establishConnection(**kwargs)
+        if self.confirmDelivery:
+            self.channel.confirm_delivery()
+
+    def sendCommand(self, routing_key, command):
+        """Queues a message for the publishing thread and returns right away."""
+        self.outgoing.put((routing_key, command))
+
+    def publish(self, routing_key, command):
+        """Publishes one message, reconnecting and retrying if the
+        connection or channel was lost.
+        """
+        for attempt in range(0, self.maxRetries + 1):
+            try:
+                if self.connection.is_closed or self.channel.is_closed:
+                    self.reconnects += 1
+                    self.establishConnection()
+                self.channel.basic_publish(
+                    self.exchange, routing_key=routing_key, body=command
+                )
+                self.published += 1
+                return True
+            except pika.exceptions.AMQPError:
+                if attempt < self.maxRetries:
+                    time.sleep(min(0.1 * (2 ** attempt), 2.0))
+        self.failed += 1
+        print(f"Error: could not publish message to `{routing_key}`!")
+        return False
+
+    def publishLoop(self):
+        """Runs on the background thread. Waits for messages, gathers any
+        fire messages that arrive within the batch window, and publishes them
+        together. Heartbeats are serviced while idle so the broker keeps the
+        connection open.
+        """
+        while not self.stopEvent.is_set() or not self.outgoing.empty():
+            try:
+                batch = [self.outgoing.get(timeout=1.0)]
+            except queue.Empty:
+                try:
+                    if self.connection.is_open:
+                        self.connection.process_data_events(time_limit=0)
+                except pika.exceptions.AMQPError:
+                    pass
+                continue
+
+            if batch[0][0].endswith(".fire") and self.batchWindow > 0:
+                deadline = time.monotonic() + self.batchWindow
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self.outgoing.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+            for routing_key, command in batch:
+                self.publish(routing_key, command)
+                self.outgoing.task_done()
+            self.batches += 1
+
+    def flush(self):
+        """Blocks until every queued message has been published."""
+        self.outgoing.join()
+
+    def getStats(self):
+        return {
+            "queued": self.outgoing.qsize(),
+            "published": self.published,
+            "batches": self.batches,
+            "reconnects": self.reconnects,
+            "failed": self.failed,
+        }
+
+    def closeConnection(self):
+        """Publishes anything still queued, then closes the connection."""
+        self.stopEvent.set()
+        self.worker.join()
+        if self.connection.is_open:
+            self.connection.close()
+
+
+# One publisher per broker login for the whole process.
+commsPublishers = {}
+commsPublishersLock = threading.Lock()
+
+
+def getCommsPublisher(**kwargs):
+    """Returns the shared publisher for a set of credentials, creating it the
+    first time it is asked for.
+    """
+    key = (
+        kwargs.get("host"),
+        str(kwargs.get("port")),
+        kwargs.get("user"),
+        kwargs.get("exchange"),
+    )
+    with commsPublishersLock:
+        if key not in commsPublishers:
+            commsPublishers[key] = CommsPublisher(**kwargs)
+        return commsPublishers[key]
+
+
+def closeCommsPublishers():
+    """Flushes and closes every publisher created so far."""
+    with commsPublishersLock:
+        for commsPublisher in commsPublishers.values():
+            commsPublisher.closeConnection()
+        commsPublishers.clear()
+
+
 def usage():
     print("Error: You need to choose `send` or `listen` and optionally `teamName`!")
     print("Usage: python CommsClass <send,listen> [teamName]")
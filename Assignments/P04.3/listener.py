@@ -1,4 +1,6 @@
-from comms import CommsListener
+import sys
+
+from comms import CommsListener, CommsConsumer
 
 # Edit credentials here
 creds = {
@@ -10,14 +12,31 @@ creds = {
     "hash": "24121985393028864311722805236604570116"
 }
 
-print("Comms Listener starting. To exit press CTRL+C ...")
-# create instance of the listener class and sending in the creds
-# object as kwargs
-commsListener = CommsListener(**creds)
+# Run "python3 listener.py ingest" to record incoming shots in the
+# database instead of just printing messages.
+if len(sys.argv) > 1 and sys.argv[1] == "ingest":
+    from spatialapi import DatabaseCursor, confPath
+    from module import ShotIngest
+
+    shotIngest = ShotIngest(lambda: DatabaseCursor(confPath))
+
+    print("Comms Ingest Listener starting. To exit press CTRL+C ...")
+    # The consumer hands shots to the database in batches and only
+    # acks them once they are committed.
+    commsListener = CommsConsumer(handler=shotIngest.handleBatch, **creds)
+else:
+    print("Comms Listener starting. To exit press CTRL+C ...")
+    # create instance of the listener class and sending in the creds
+    # object as kwargs
+    commsListener = CommsListener(**creds)
 
 # tell rabbitMQ which 'topics' you want to listen to. In this case anything
 # with the team name in it (user) and the broadcast keyword.
 commsListener.bindKeysToQueue([f"#.{creds['user']}.#", "#.broadcast.#"])
 
 # now really start listening
-commsListener.startConsuming()
+try:
+    commsListener.startConsuming()
+except KeyboardInterrupt:
+    if isinstance(commsListener, CommsConsumer):
+        print(commsListener.getStats(), shotIngest.getStats())
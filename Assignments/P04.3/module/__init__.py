@@ -1,7 +1,24 @@
-__all__ = ["timeconversion"]
+__all__ = ["timeconversion", "connectionpool", "fleetstate", "shotingest", "hitdetection", "spawnplacement", "fleetloader", "geopackage", "gameserver", "downloadcache"]
 from module.timeconversion import convertTimeToSecondsSimple
 from module.timeconversion import convertTimeFromSecondsNoDate
 from module.timeconversion import convertTimeToSecondsNoDate
 from module.timeconversion import convertTimeToSeconds
 from module.timeconversion import convertTimeFromSeconds
 from module.timeconversion import convertDateToOtherDate
+from module.timeconversion import timeOfDaySeconds
+from module.timeconversion import convertTimesToSecondsSimple
+from module.timeconversion import convertTimesToSecondsNoDate
+from module.timeconversion import convertTimesToSeconds
+from module.connectionpool import DatabaseConnectionPool
+from module.connectionpool import getConnectionPool
+from module.connectionpool import closeConnectionPools
+from module.fleetstate import FleetState
+from module.shotingest import ShotIngest
+from module.hitdetection import HitDetector
+from module.spawnplacement import placeFleets
+from module.fleetloader import loadFleetFile
+from module.fleetloader import loadFleet
+from module.geopackage import exportTables
+from module.gameserver import GameServerClient
+from module.downloadcache import DownloadCache
+from module.downloadcache import writeLogAsync
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: A process wide pool of database connections. The config
+#              file is only read once, the schema is only set once per
+#              connection, and connections are handed back out instead
+#              of reconnecting for every query.
+#
+# Optional .config.json fields:
+#   poolminconn:      Connections opened at startup. (Default 1)
+#   poolmaxconn:      Most connections open at once. (Default 10)
+#   pooltimeout:      Seconds to wait for a free connection. (Default 30)
+#   poolpinginterval: Seconds a connection may sit idle before it is
+#                     pinged on checkout. (Default 30)
+##############################################################################
+
+import json
+import threading
+import time
+
+import psycopg2
+import psycopg2.pool
+
+
+class DatabaseConnectionPool(object):
+    """
+    DatabaseConnectionPool
+    Wraps a psycopg2 ThreadedConnectionPool with a blocking checkout,
+    health checks, and checkout statistics.
+    """
+
+    def __init__(self, conn_config_file):
+        with open(conn_config_file) as config_file:
+            self.conn_config = json.load(config_file)
+
+        self.minConn = int(self.conn_config.get("poolminconn", 1))
+        self.maxConn = int(self.conn_config.get("poolmaxconn", 10))
+        self.timeout = float(self.conn_config.get("pooltimeout", 30))
+        self.pingInterval = float(self.conn_config.get("poolpinginterval", 30))
+
+        # Search path is set as a startup option so every pooled
+        # connection already has the schema without an extra query.
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            self.minConn,
+            self.maxConn,
+            dbname=self.conn_config["dbname"],
+            user=self.conn_config["user"],
+            host=self.conn_config["dbhost"],
+            password=self.conn_config["password"],
+            port=self.conn_config["port"],
+            options="-c search_path=" + self.conn_config["schema"],
+        )
+
+        # ThreadedConnectionPool errors out instead of waiting when
+        # empty, so a semaphore makes callers queue for a connection.
+        self.available = threading.Semaphore(self.maxConn)
+        self.statsLock = threading.Lock()
+        self.lastUsed = {}
+
+        self.checkouts = 0
+        self.inUse = 0
+        self.peakInUse = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+        self.timeouts = 0
+        self.failedHealthChecks = 0
+
+    def isHealthy(self, conn):
+        """
+        isHealthy
+        Checks a connection before handing it out. Connections
+        that were recently used are trusted, while idle ones
+        are pinged in case the server dropped them.
+        """
+        if conn.closed:
+            return False
+        idleTime = time.monotonic() - self.lastUsed.get(id(conn), 0)
+        if idleTime < self.pingInterval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getConnection(self):
+        """
+        getConnection
+        Checks out a healthy connection, waiting up to the pool
+        timeout for one to become free.
+        """
+        waitStart = time.monotonic()
+        if not self.available.acquire(timeout=self.timeout):
+            with self.statsLock:
+                self.timeouts += 1
+            raise psycopg2.pool.PoolError("Timed out waiting for a database connection.")
+        waitTime = time.monotonic() - waitStart
+
+        try:
+            conn = self.pool.getconn()
+            while not self.isHealthy(conn):
+                with self.statsLock:
+                    self.failedHealthChecks += 1
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+        except:
+            self.available.release()
+            raise
+
+        with self.statsLock:
+            self.checkouts += 1
+            self.inUse += 1
+            self.peakInUse = max(self.peakInUse, self.inUse)
+            self.totalWait += waitTime
+            self.maxWait = max(self.maxWait, waitTime)
+        return conn
+
+    def putConnection(self, conn):
+        """
+        putConnection
+        Returns a connection to the pool. Broken connections
+        are closed instead of reused.
+        """
+        try:
+            self.lastUsed[id(conn)] = time.monotonic()
+            self.pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            with self.statsLock:
+                self.inUse -= 1
+            self.available.release()
+
+    def getStats(self):
+        """
+        getStats
+        Returns a dictionary of pool settings and checkout statistics.
+        """
+        with self.statsLock:
+            averageWait = 0.0
+            if self.checkouts > 0:
+                averageWait = self.totalWait / self.checkouts
+            return {
+                "min_connections": self.minConn,
+                "max_connections": self.maxConn,
+                "in_use": self.inUse,
+                "peak_in_use": self.peakInUse,
+                "checkouts": self.checkouts,
+                "average_wait_ms": averageWait * 1000,
+                "max_wait_ms": self.maxWait * 1000,
+                "timeouts": self.timeouts,
+                "failed_health_checks": self.failedHealthChecks,
+            }
+
+    def closeAll(self):
+        """
+        closeAll
+        Closes every connection held by the pool.
+        """
+        self.pool.closeall()
+
+
+# One pool per config file for the whole process.
+connectionPools = {}
+connectionPoolsLock = threading.Lock()
+
+
+def getConnectionPool(conn_config_file):
+    """
+    getConnectionPool
+    Returns the shared pool for a config file, creating it the
+    first time it is asked for.
+    """
+    with connectionPoolsLock:
+        if conn_config_file not in connectionPools:
+            connectionPools[conn_config_file] = DatabaseConnectionPool(conn_config_file)
+        return connectionPools[conn_config_file]
+
+
+def closeConnectionPools():
+    """
+    closeConnectionPools
+    Closes every pool that has been created so far.
+    """
+    with connectionPoolsLock:
+        for connPool in connectionPools.values():
+            connPool.closeAll()
+        connectionPools.clear()
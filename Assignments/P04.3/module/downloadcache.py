@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Keeps game server downloads, like the battle region and the
+#              fleet, so setting up the same game again doesn't go back to
+#              the server. Each request is keyed by its game and a hash of
+#              the path and parameters. The answer is stored by the hash of
+#              its contents, so identical answers are kept once. Parsed
+#              answers stay in memory with least recently used eviction,
+#              and raw answers can also be kept in a directory to survive
+#              restarts. Pretty printed copies for debugging are written
+#              on a background thread.
+##############################################################################
+
+import collections
+import hashlib
+import json
+import os
+import threading
+
+
+def requestKey(gameId, path, params = None):
+    """
+    requestKey
+    Returns the game id joined to a hash of the request path and
+    its sorted parameters.
+    """
+    request = json.dumps([path, sorted((params or {}).items())], default=str)
+    return str(gameId) + "-" + hashlib.sha256(request.encode("utf-8")).hexdigest()[:32]
+
+
+def writeLogAsync(fileName, value, indent = 3):
+    """
+    writeLogAsync
+    Writes value as indented JSON to fileName on a background
+    thread. Returns the thread.
+    """
+    def writeLog():
+        with open(fileName, "w") as outFile:
+            json.dump(value, outFile, indent=indent)
+
+    writer = threading.Thread(target=writeLog, daemon=True)
+    writer.start()
+    return writer
+
+
+class DownloadCache(object):
+    """
+    DownloadCache
+    Content addressed cache of parsed game server answers.
+    """
+
+    def __init__(self, maxEntries = 16, directory = None):
+        self.maxEntries = maxEntries
+        self.directory = directory
+        if directory != None:
+            os.makedirs(directory, exist_ok=True)
+
+        self.statsLock = threading.Lock()
+        # Request key to content hash, most recently used last
+        self.requests = collections.OrderedDict()
+        # Content hash to parsed answer
+        self.contents = {}
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fetch(self, gameId, path, params, download):
+        """
+        fetch
+        Returns the parsed answer to a request. download is only
+        called, with no arguments, when neither memory nor disk
+        has it, and returns the raw answer as bytes. Cached
+        answers are shared, so callers shouldn't change them.
+        """
+        key = requestKey(gameId, path, params)
+        with self.statsLock:
+            digest = self.requests.get(key)
+            if digest != None:
+                self.requests.move_to_end(key)
+                self.hits += 1
+                return self.contents[digest]
+
+        content = self.readDisk(key)
+        if content != None:
+            with self.statsLock:
+                self.diskHits += 1
+        else:
+            content = download()
+            with self.statsLock:
+                self.misses += 1
+
+        digest = hashlib.sha256(content).hexdigest()
+        value = json.loads(content)
+        self.writeDisk(key, digest, content)
+
+        with self.statsLock:
+            # Keep the copy another request already holds
+            value = self.contents.setdefault(digest, value)
+            self.requests[key] = digest
+            self.requests.move_to_end(key)
+            while len(self.requests) > self.maxEntries:
+                oldKey, oldDigest = self.requests.popitem(last=False)
+                self.evictions += 1
+                if oldDigest not in self.requests.values():
+                    del self.contents[oldDigest]
+            return value
+
+    def readDisk(self, key):
+        """
+        readDisk
+        Returns the raw answer saved for key, or None.
+        """
+        if self.directory == None:
+            return None
+        try:
+            with open(os.path.join(self.directory, key + ".ref")) as refFile:
+                digest = refFile.read().strip()
+            with open(os.path.join(self.directory, digest + ".json"), "rb") as inFile:
+                content = inFile.read()
+        except OSError:
+            return None
+        # Ignore files that were cut short or changed
+        if hashlib.sha256(content).hexdigest() != digest:
+            return None
+        return content
+
+    def writeDisk(self, key, digest, content):
+        """
+        writeDisk
+        Saves the raw answer under its hash and points key at it.
+        Files are renamed into place so readers never see half
+        of one.
+        """
+        if self.directory == None:
+            return
+        contentPath = os.path.join(self.directory, digest + ".json")
+        if not os.path.exists(contentPath):
+            with open(contentPath + ".tmp", "wb") as outFile:
+                outFile.write(content)
+            os.replace(contentPath + ".tmp", contentPath)
+        refPath = os.path.join(self.directory, key + ".ref")
+        with open(refPath + ".tmp", "w") as outFile:
+            outFile.write(digest)
+        os.replace(refPath + ".tmp", refPath)
+
+    def clear(self):
+        with self.statsLock:
+            self.requests.clear()
+            self.contents.clear()
+
+    def getStats(self):
+        with self.statsLock:
+            return {
+                "maxEntries": self.maxEntries,
+                "directory": self.directory,
+                "entries": len(self.requests),
+                "contents": len(self.contents),
+                "hits": self.hits,
+                "diskHits": self.diskHits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Bulk loads a fleet file into fleet_template. Ships are
+#              read one at a time from the JSON array instead of loading
+#              the whole file, and are inserted in pages of rows with
+#              their staggered grid positions worked out in the same
+#              statement, all inside the caller's transaction.
+##############################################################################
+
+import json
+
+from psycopg2.extras import execute_values
+
+# Characters read from the fleet file at a time
+readSize = 65536
+
+# Ships sent to the database per statement
+pageSize = 1000
+
+
+def iterateJSONArray(inFile):
+    """
+    iterateJSONArray
+    Yields each element of a top level JSON array from an open
+    text file without parsing the whole file at once.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    finished = False
+
+    while not finished:
+        chunk = inFile.read(readSize)
+        buffer += chunk
+
+        position = 0
+        while True:
+            # Skip whitespace, the opening bracket, and commas
+            while position < len(buffer) and (buffer[position].isspace() or
+                buffer[position] == "," or (not started and buffer[position] == "[")):
+                if buffer[position] == "[":
+                    started = True
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                finished = True
+                break
+            try:
+                element, endPosition = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # The element runs past the end of the buffer
+                if chunk == "":
+                    raise
+                break
+            # A number at the very end may still be cut off
+            if endPosition >= len(buffer) and chunk != "":
+                break
+            position = endPosition
+            yield element
+
+        buffer = buffer[position:]
+        if chunk == "" and not finished:
+            if buffer.strip() != "":
+                raise ValueError("Fleet file ended in the middle of the array.")
+            finished = True
+
+
+def jsonColumn(value):
+    """
+    jsonColumn
+    Serializes a value for a json column, keeping None as NULL.
+    """
+    if value == None:
+        return None
+    return json.dumps(value)
+
+
+def shipRow(ship, index, numCols):
+    """
+    shipRow
+    Turns one ship from the fleet file into a fleet_template row.
+    Guns start facing forward and level.
+    """
+    armament = ship.get('armament')
+    if armament != None:
+        # Copies, so a cached fleet isn't changed
+        armament = [dict(gun, gunAngle=0, gunElevation=0) for gun in armament]
+
+    return (ship['id'], ship['category'], ship['shipClass'],
+        ship['length'], ship['width'], jsonColumn(ship.get('torpedoLaunchers')),
+        jsonColumn(armament), jsonColumn(ship.get('armor')),
+        ship['speed'], ship['turn_radius'], index % numCols, index // numCols)
+
+
+def insertShips(cur, rows):
+    """
+    insertShips
+    Inserts a page of fleet_template rows. Every third column sits
+    222 meters per row south of the origin, while the columns between
+    them are staggered another 111 meters south, and each column is
+    111 meters further east.
+    """
+    execute_values(cur,
+        """
+            INSERT INTO public.fleet_template
+            (
+                ship_id, category, shipclass, displacement, ship_length,
+                ship_width, torpedolaunchers, armament, armor, speed,
+                turn_radius, ship_geom, ship_col, ship_row, fleet_num, bearing
+            )
+            SELECT ship_id, category, shipclass, 0, ship_length,
+                ship_width, torpedolaunchers::json, armament::json, armor::json, speed,
+                turn_radius,
+                CASE WHEN (ship_col % 3) = 0
+                THEN ST_Project(ST_Project(ST_SetSRID(ST_MakePoint(0, 0), 4326)::geography,
+                    222 * ship_row, Pi()), 111 * ship_col, 0.5 * Pi())::geometry(Point, 4326)
+                ELSE ST_Project(ST_Project(ST_SetSRID(ST_MakePoint(0, 0), 4326)::geography,
+                    111 * ship_col, 0.5 * Pi()), (222 * ship_row) + 111, Pi())::geometry(Point, 4326)
+                END,
+                ship_col, ship_row, 0, 0
+            FROM (VALUES %s) AS ships
+            (
+                ship_id, category, shipclass, ship_length, ship_width,
+                torpedolaunchers, armament, armor, speed, turn_radius, ship_col, ship_row
+            );
+        """,
+        rows, template="(%s::numeric, %s, %s, %s::numeric, %s::numeric, %s, %s, %s, " +
+            "%s::numeric, %s::numeric, %s::numeric, %s::numeric)",
+        page_size=pageSize)
+
+
+def loadFleet(cur, ships, numCols = 10):
+    """
+    loadFleet
+    Inserts ships, any iterable of fleet file ships, into
+    fleet_template a page at a time. Returns the number of
+    ships loaded.
+    """
+    rows = []
+    shipCount = 0
+    for ship in ships:
+        rows.append(shipRow(ship, shipCount, numCols))
+        shipCount += 1
+        if len(rows) >= pageSize:
+            insertShips(cur, rows)
+            rows = []
+    if len(rows) > 0:
+        insertShips(cur, rows)
+    return shipCount
+
+
+def loadFleetFile(cur, fleetFileName, numCols = 10):
+    """
+    loadFleetFile
+    Streams a fleet file into fleet_template a page at a time.
+    Returns the number of ships loaded.
+    """
+    with open(fleetFileName) as inFile:
+        return loadFleet(cur, iterateJSONArray(inFile), numCols)
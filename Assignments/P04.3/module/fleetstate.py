@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: An optional in-memory copy of the fleet. Ship positions,
+#              bearings, speeds, turn radii and guns are held in NumPy
+#              arrays so moves and rotations are plain array math.
+#              Changed rows are written back to the fleet, fleet_template,
+#              fleet_overview and ship_shapes tables in batches by a
+#              background thread, so the database stays the durable copy.
+#
+# Note: Projections use a spherical earth, while PostGIS geography uses
+#       the WGS84 spheroid, so positions can differ from ST_Project by
+#       a fraction of a percent of the distance moved.
+##############################################################################
+
+import copy
+import json
+import threading
+import time
+import uuid
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+# Mean earth radius in meters
+earthRadius = 6371008.8
+
+
+def projectPoints(lon, lat, distance, bearing):
+    """
+    projectPoints
+    Vectorized great circle projection. Takes arrays of longitudes
+    and latitudes in degrees, distances in meters, and bearings in
+    radians clockwise from north. Returns the new longitudes and
+    latitudes in degrees.
+    """
+    lonRad = np.radians(lon)
+    latRad = np.radians(lat)
+    angularDistance = np.asarray(distance, dtype=np.float64) / earthRadius
+
+    newLat = np.arcsin(
+        np.sin(latRad) * np.cos(angularDistance) +
+        np.cos(latRad) * np.sin(angularDistance) * np.cos(bearing))
+    newLon = lonRad + np.arctan2(
+        np.sin(bearing) * np.sin(angularDistance) * np.cos(latRad),
+        np.cos(angularDistance) - np.sin(latRad) * np.sin(newLat))
+
+    # Keep longitude between -180 and 180
+    newLon = (newLon + 3 * np.pi) % (2 * np.pi) - np.pi
+    return np.degrees(newLon), np.degrees(newLat)
+
+
+def greatCircleDistance(lon1, lat1, lon2, lat2):
+    """
+    greatCircleDistance
+    Vectorized haversine distance in meters between points given
+    in degrees.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    halfChord = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * earthRadius * np.arcsin(np.sqrt(halfChord))
+
+
+def rotateBearing(bearing, angleDelta):
+    """
+    rotateBearing
+    Rotates bearings in radians by a number of degrees. Rounds to
+    whole degrees the same way the rotateFleet SQL does.
+    """
+    degreesTurned = np.rint(np.degrees(bearing) + float(angleDelta) + 360) % 360
+    return np.radians(degreesTurned)
+
+
+class FleetState(object):
+    """
+    FleetState
+    Holds the fleet in memory keyed by ship_id. Every change marks
+    the ship or fleet dirty, and flush() writes the dirty rows
+    back to the database.
+    Parameters:   cursorFactory: Callable returning a context manager
+                                 that yields a database cursor, such
+                                 as lambda: DatabaseCursor(confPath).
+                  shapeUpdater:  Callable taking shipIds to rebuild
+                                 ship_shapes after a flush.
+                  flushInterval: Seconds between background flushes.
+    """
+
+    def __init__(self, cursorFactory, shapeUpdater = None, flushInterval = 0.5):
+        self.cursorFactory = cursorFactory
+        self.shapeUpdater = shapeUpdater
+        self.flushInterval = float(flushInterval)
+
+        # All mutations and flush snapshots happen under this lock
+        self.lock = threading.RLock()
+        self.stopEvent = threading.Event()
+        self.flushEvent = threading.Event()
+        self.writer = None
+        # Held for a whole flush so an older snapshot can never be
+        # committed after a newer one
+        self.flushLock = threading.Lock()
+
+        self.shipIndex = {}
+        self.shipIds = np.zeros(0, dtype=np.int64)
+        self.fleetNums = np.zeros(0, dtype=np.int64)
+        self.lon = np.zeros(0)
+        self.lat = np.zeros(0)
+        self.bearing = np.zeros(0)
+        self.speed = np.zeros(0)
+        self.turnRadius = np.zeros(0)
+        self.armament = []
+        self.dirty = np.zeros(0, dtype=bool)
+
+        # fleet_num -> [lon, lat, bearing, speed]
+        self.fleetOverview = {}
+        self.dirtyFleets = set()
+
+        # Goes up on every change so exports can tell when to resend.
+        # Versions restart with each store, so tags also carry its id.
+        self.version = 0
+        self.instanceId = uuid.uuid4().hex[:12]
+
+        self.flushCount = 0
+        self.lastFlushSeconds = 0.0
+        self.lastFlushRows = 0
+
+    def load(self):
+        """
+        load
+        Replaces the in-memory fleet with the current database copy.
+        """
+        with self.cursorFactory() as cur:
+            sql = \
+                f"""
+                    SELECT ship_id, fleet_num, ST_X(ship_geom), ST_Y(ship_geom),
+                        bearing, speed, turn_radius, armament
+                    FROM fleet ORDER BY ship_id;
+                """
+            cur.execute(sql)
+            shipRows = cur.fetchall()
+
+            sql = \
+                f"""
+                    SELECT fleet_num, ST_X(fleet_reference_point),
+                        ST_Y(fleet_reference_point), bearing, speed
+                    FROM fleet_overview;
+                """
+            cur.execute(sql)
+            overviewRows = cur.fetchall()
+
+        with self.lock:
+            count = len(shipRows)
+            self.shipIds = np.array([int(row[0]) for row in shipRows], dtype=np.int64)
+            self.fleetNums = np.array([int(row[1]) for row in shipRows], dtype=np.int64)
+            self.lon = np.array([float(row[2]) for row in shipRows], dtype=np.float64)
+            self.lat = np.array([float(row[3]) for row in shipRows], dtype=np.float64)
+            self.bearing = np.array([float(row[4]) for row in shipRows], dtype=np.float64)
+            self.speed = np.array([float(row[5]) for row in shipRows], dtype=np.float64)
+            self.turnRadius = np.array([float(row[6]) for row in shipRows], dtype=np.float64)
+            self.armament = [row[7] for row in shipRows]
+            self.dirty = np.zeros(count, dtype=bool)
+            self.shipIndex = {int(shipId): index for index, shipId in enumerate(self.shipIds)}
+
+            self.fleetOverview = {}
+            for row in overviewRows:
+                self.fleetOverview[int(row[0])] = \
+                    [float(row[1]), float(row[2]), float(row[3]), float(row[4])]
+            self.dirtyFleets = set()
+            self.version += 1
+
+    def shipRow(self, shipId):
+        """
+        shipRow
+        Returns the array index of a ship or raises KeyError.
+        """
+        return self.shipIndex[int(shipId)]
+
+    def moveFleet(self, fleetNum, distance):
+        """
+        moveFleet
+        Moves every ship in a fleet, and the fleet's reference point,
+        forward by a distance in meters. Returns False if the fleet's
+        slowest ship can't go that far.
+        """
+        with self.lock:
+            mask = self.fleetNums == int(fleetNum)
+            if not mask.any():
+                raise KeyError(fleetNum)
+            if int(self.speed[mask].min()) < abs(int(distance)):
+                return False
+
+            self.lon[mask], self.lat[mask] = projectPoints(
+                self.lon[mask], self.lat[mask], float(distance), self.bearing[mask])
+            self.dirty |= mask
+            self.version += 1
+
+            overview = self.fleetOverview.get(int(fleetNum))
+            if overview != None:
+                newLon, newLat = projectPoints(overview[0], overview[1], float(distance), overview[2])
+                overview[0] = float(newLon)
+                overview[1] = float(newLat)
+                overview[3] = float(distance)
+                self.dirtyFleets.add(int(fleetNum))
+        self.flushEvent.set()
+        return True
+
+    def rotateFleet(self, fleetNum, angleDelta):
+        """
+        rotateFleet
+        Rotates every ship in a fleet by a number of degrees. Returns
+        False if any ship can't turn that far.
+        """
+        with self.lock:
+            mask = self.fleetNums == int(fleetNum)
+            if not mask.any():
+                raise KeyError(fleetNum)
+            if int(self.turnRadius[mask].min()) < abs(int(angleDelta)):
+                return False
+
+            self.bearing[mask] = rotateBearing(self.bearing[mask], angleDelta)
+            self.dirty |= mask
+            self.version += 1
+
+            overview = self.fleetOverview.get(int(fleetNum))
+            if overview != None:
+                overview[2] = float(rotateBearing(overview[2], angleDelta))
+                self.dirtyFleets.add(int(fleetNum))
+        self.flushEvent.set()
+        return True
+
+    def splitShip(self, shipId, speed = 0, distance = 0, angleDelta = 0):
+        """
+        splitShip
+        Breaks a ship off into a new fleet of its own and returns
+        the new fleet number. Returns None, leaving the ship where
+        it is, if it can't travel distance or turn angleDelta.
+        """
+        with self.lock:
+            row = self.shipRow(shipId)
+            if int(self.speed[row]) < abs(int(distance)):
+                return None
+            if int(self.turnRadius[row]) < abs(int(angleDelta)):
+                return None
+            newId = int(self.fleetNums.max()) + 1
+            self.fleetNums[row] = newId
+            self.fleetOverview[newId] = \
+                [float(self.lon[row]), float(self.lat[row]), float(self.bearing[row]), float(speed)]
+            self.dirty[row] = True
+            self.version += 1
+            self.dirtyFleets.add(newId)
+        self.flushEvent.set()
+        return newId
+
+    def rotateShipGuns(self, shipId, angleDelta, elevationDelta):
+        """
+        rotateShipGuns
+        Rotates and elevates every gun on a ship by a number of
+        degrees. Returns False if the ship has no guns.
+        """
+        with self.lock:
+            row = self.shipRow(shipId)
+            armamentList = self.armament[row]
+            if (armamentList == None or len(armamentList) == 0):
+                return False
+            for gun in armamentList:
+                gun['gunAngle'] = (float(gun['gunAngle']) + np.radians(float(angleDelta))) % (2 * np.pi)
+                gun['gunElevation'] = (float(gun['gunElevation']) + np.radians(float(elevationDelta))) % (2 * np.pi)
+            self.dirty[row] = True
+            self.version += 1
+        self.flushEvent.set()
+        return True
+
+    def spendAmmo(self, gun):
+        """
+        spendAmmo
+        Spends one volley of a gun's ammo, capped by what is left.
+        """
+        ammo = gun['gun']['ammo'][0]
+        shotsFired = gun['gun']['rof']
+        if float(ammo['count']) <= shotsFired:
+            shotsFired = ammo['count']
+        ammo['count'] -= shotsFired
+
+    def fireGun(self, shipId, gunNumber, maxRange):
+        """
+        fireGun
+        Fires one gun straight ahead along its current angle and
+        spends the ammo. Returns the broadcast dictionary and an
+        error message, one of which is None.
+        """
+        with self.lock:
+            row = self.shipRow(shipId)
+            gun = self.armament[row][int(gunNumber)]
+            if float(gun['gun']['ammo'][0]['count']) <= 0:
+                return None, "Invalid weapon or insufficient ammo."
+
+            targetBearing = float(self.bearing[row]) + float(gun['gunAngle'])
+            targetX, targetY = projectPoints(self.lon[row], self.lat[row], float(maxRange), targetBearing)
+            self.spendAmmo(gun)
+            self.dirty[row] = True
+            self.version += 1
+
+            broadcastDict = {}
+            broadcastDict['lon'] = float(targetX)
+            broadcastDict['lat'] = float(targetY)
+            broadcastDict['angle'] = targetBearing * 180 / np.pi
+            broadcastDict['kg'] = int(gun['gun']['ammo'][0]['type']['kg'])
+        self.flushEvent.set()
+        return broadcastDict, None
+
+    def fireGunAt(self, shipId, gunNumber, targetX, targetY, maxRange):
+        """
+        fireGunAt
+        Turns a gun toward a target, fires it, and spends the ammo.
+        Returns the broadcast dictionary and an error message, one
+        of which is None.
+        """
+        with self.lock:
+            row = self.shipRow(shipId)
+            gun = self.armament[row][int(gunNumber)]
+
+            # Guns sit along the ship's center line
+            gunX, gunY = projectPoints(self.lon[row], self.lat[row], float(gun['pos']), self.bearing[row])
+            targetDistance = greatCircleDistance(gunX, gunY, float(targetX), float(targetY))
+            # Clockwise angle from north, measured in lon/lat like ST_Angle
+            targetBearing = np.arctan2(float(targetX) - gunX, float(targetY) - gunY) % (2 * np.pi)
+
+            if float(gun['gun']['ammo'][0]['count']) <= 0:
+                return None, "Invalid weapon or insufficient ammo."
+            if float(targetDistance) >= float(maxRange):
+                return None, "Selected target is out of range of gun."
+
+            gunAngleAdjustment = float(targetBearing) - \
+                ((float(self.bearing[row]) + float(gun['gunAngle'])) % (2 * np.pi))
+            self.spendAmmo(gun)
+            gun['gunAngle'] = (float(gun['gunAngle']) + gunAngleAdjustment) % (2 * np.pi)
+            self.dirty[row] = True
+            self.version += 1
+
+            broadcastDict = {}
+            broadcastDict['lon'] = float(targetX)
+            broadcastDict['lat'] = float(targetY)
+            broadcastDict['angle'] = float(targetBearing) * 180 / np.pi
+            broadcastDict['kg'] = int(gun['gun']['ammo'][0]['type']['kg'])
+        self.flushEvent.set()
+        return broadcastDict, None
+
+    def runBatch(self, commands, maxRange):
+        """
+        runBatch
+        Carries out an already validated command batch in the same
+        order as the database batch: ships given their own orders
+        are split off once each, fleets are rotated, then moved,
+        then guns are turned and fired in command order. Either
+        every change is kept or, if anything raises, none are.
+        Returns a result for every command, with the broadcast
+        dictionary in place of the result for each shot fired.
+        """
+        results = [None] * len(commands)
+        with self.lock:
+            saved = (self.fleetNums.copy(), self.lon.copy(), self.lat.copy(),
+                self.bearing.copy(), self.dirty.copy(), copy.deepcopy(self.armament),
+                copy.deepcopy(self.fleetOverview), set(self.dirtyFleets), self.version)
+            try:
+                # Each ship with its own orders gets one new fleet
+                splitSpeeds = {}
+                for command in commands:
+                    if command["command"] in ["moveShip", "rotateShip"]:
+                        shipId = int(command["ship"])
+                        splitSpeeds.setdefault(shipId, 0)
+                        if command["command"] == "moveShip":
+                            splitSpeeds[shipId] = float(command["distance"])
+                splitFleets = {}
+                for shipId in splitSpeeds:
+                    splitFleets[shipId] = self.splitShip(shipId, splitSpeeds[shipId])
+
+                fleetMoves = {}
+                fleetTurns = {}
+
+                for index in range(0, len(commands)):
+                    command = commands[index]
+                    commandType = command["command"]
+                    if commandType == "moveShip":
+                        fleetMoves[splitFleets[int(command["ship"])]] = float(command["distance"])
+                        results[index] = "Ship moved successfully."
+                    elif commandType == "rotateShip":
+                        fleetTurns[splitFleets[int(command["ship"])]] = float(command["angle"])
+                        results[index] = "Ship rotated successfully."
+                    elif commandType == "moveFleet":
+                        fleetMoves[int(command["fleet"])] = float(command["distance"])
+                        results[index] = "Fleet moved successfully."
+                    elif commandType == "rotateFleet":
+                        fleetTurns[int(command["fleet"])] = float(command["angle"])
+                        results[index] = "Fleet rotated successfully."
+
+                for fleetNum in fleetTurns:
+                    if not self.rotateFleet(fleetNum, fleetTurns[fleetNum]):
+                        raise ValueError("Distance must be within minimum fleet max rotation range.")
+                for fleetNum in fleetMoves:
+                    if not self.moveFleet(fleetNum, fleetMoves[fleetNum]):
+                        raise ValueError("Distance must be within minimum fleet max travel range.")
+
+                for index in range(0, len(commands)):
+                    command = commands[index]
+                    if command["command"] == "rotateShipGuns":
+                        if not self.rotateShipGuns(command["ship"], command["angle"], command["elevation"]):
+                            raise ValueError("Invalid ship or no guns on ship.")
+                        results[index] = "Ship guns rotated successfully."
+                    elif command["command"] == "fireGun":
+                        broadcastDict, errorMessage = self.fireGun(command["ship"], command["gun"], maxRange)
+                        results[index] = broadcastDict if errorMessage == None else errorMessage
+            except:
+                (self.fleetNums, self.lon, self.lat, self.bearing, self.dirty, self.armament,
+                    self.fleetOverview, self.dirtyFleets, self.version) = saved
+                raise
+        return results
+
+    def exportPositions(self, fleetId, timeStamp):
+        """
+        exportPositions
+        Returns the fleet in the same layout as the
+        exportFleetPositionJSON route, straight from memory.
+        """
+        with self.lock:
+            returnList = []
+            for row in range(0, len(self.shipIds)):
+                overview = self.fleetOverview.get(int(self.fleetNums[row]))
+                returnList.append({
+                    'ship_id': int(self.shipIds[row]),
+                    'bearing': float(self.bearing[row]),
+                    'location': {
+                        'coords': {
+                            'lon': float(self.lon[row]),
+                            'lat': float(self.lat[row])
+                        },
+                        'timeStamp': int(timeStamp)
+                    },
+                    'speed': float(overview[3]) if overview != None else 0.0,
+                    'hitpoints': int(1)
+                })
+        return {'fleet_id': fleetId, 'ship_status': returnList}
+
+    def flush(self):
+        """
+        flush
+        Writes every dirty ship and fleet to the database in one
+        transaction, then rebuilds the matching ship shapes.
+        Returns the number of ships written.
+        """
+        with self.flushLock:
+            return self.flushLocked()
+
+    def flushLocked(self):
+        """
+        flushLocked
+        Body of flush, run while holding flushLock.
+        """
+        startTime = time.perf_counter()
+
+        # Snapshot under the lock so commands aren't blocked on the database
+        with self.lock:
+            rows = np.nonzero(self.dirty)[0]
+            fleets = sorted(self.dirtyFleets)
+            if len(rows) == 0 and len(fleets) == 0:
+                return 0
+            shipValues = [
+                (int(self.shipIds[row]), float(self.lon[row]), float(self.lat[row]),
+                 float(self.bearing[row]), int(self.fleetNums[row]),
+                 json.dumps(self.armament[row]))
+                for row in rows
+            ]
+            fleetValues = [
+                (fleetNum, self.fleetOverview[fleetNum][0], self.fleetOverview[fleetNum][1],
+                 self.fleetOverview[fleetNum][2], self.fleetOverview[fleetNum][3])
+                for fleetNum in fleets if fleetNum in self.fleetOverview
+            ]
+            self.dirty[rows] = False
+            self.dirtyFleets = set()
+
+        try:
+            with self.cursorFactory() as cur:
+                if len(shipValues) > 0:
+                    execute_values(cur,
+                        """
+                            UPDATE fleet
+                                SET ship_geom = ST_SetSRID(ST_MakePoint(changed.lon, changed.lat), 4326),
+                                    bearing = changed.bearing,
+                                    fleet_num = changed.fleet_num,
+                                    armament = changed.armament
+                                FROM (VALUES %s) AS changed (ship_id, lon, lat, bearing, fleet_num, armament)
+                                WHERE fleet.ship_id = changed.ship_id;
+                        """,
+                        shipValues,
+                        template="(%s::numeric, %s::float8, %s::float8, %s::numeric, %s::numeric, %s::json)")
+                    execute_values(cur,
+                        """
+                            UPDATE fleet_template
+                                SET bearing = changed.bearing,
+                                    fleet_num = changed.fleet_num,
+                                    armament = changed.armament
+                                FROM (VALUES %s) AS changed (ship_id, bearing, fleet_num, armament)
+                                WHERE fleet_template.ship_id = changed.ship_id;
+                        """,
+                        [(value[0], value[3], value[4], value[5]) for value in shipValues],
+                        template="(%s::numeric, %s::numeric, %s::numeric, %s::json)")
+                if len(fleetValues) > 0:
+                    cur.execute(
+                        "DELETE FROM fleet_overview WHERE fleet_num = ANY(%s);",
+                        ([value[0] for value in fleetValues],))
+                    execute_values(cur,
+                        """
+                            INSERT INTO fleet_overview (fleet_num, fleet_reference_point, bearing, speed)
+                                SELECT fleet_num, ST_SetSRID(ST_MakePoint(lon, lat), 4326), bearing, speed
+                                FROM (VALUES %s) AS changed (fleet_num, lon, lat, bearing, speed);
+                        """,
+                        fleetValues,
+                        template="(%s::numeric, %s::float8, %s::float8, %s::numeric, %s::numeric)")
+        except:
+            # Put the rows back so the next flush retries them
+            with self.lock:
+                for value in shipValues:
+                    if value[0] in self.shipIndex:
+                        self.dirty[self.shipIndex[value[0]]] = True
+                self.dirtyFleets.update(fleets)
+            raise
+
+        if self.shapeUpdater != None and len(shipValues) > 0:
+            self.shapeUpdater(shipIds = [value[0] for value in shipValues])
+
+        self.flushCount += 1
+        self.lastFlushRows = len(shipValues)
+        self.lastFlushSeconds = time.perf_counter() - startTime
+        return len(shipValues)
+
+    def writeBehindLoop(self):
+        """
+        writeBehindLoop
+        Background thread body. Flushes shortly after changes are
+        made, batching everything made within one flush interval.
+        """
+        while not self.stopEvent.is_set():
+            self.flushEvent.wait(self.flushInterval)
+            if self.stopEvent.is_set():
+                break
+            if not self.flushEvent.is_set():
+                continue
+            # Let the rest of a burst of commands land in this batch
+            time.sleep(self.flushInterval)
+            self.flushEvent.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                print("Fleet state flush failed: " + str(error))
+
+    def start(self):
+        """
+        start
+        Starts the background write-behind thread.
+        """
+        if self.writer != None and self.writer.is_alive():
+            return
+        self.stopEvent.clear()
+        self.writer = threading.Thread(target=self.writeBehindLoop, daemon=True)
+        self.writer.start()
+
+    def stop(self):
+        """
+        stop
+        Stops the background thread and writes any remaining changes.
+        """
+        self.stopEvent.set()
+        self.flushEvent.set()
+        if self.writer != None:
+            self.writer.join()
+            self.writer = None
+        self.flush()
+
+    def getStats(self):
+        """
+        getStats
+        Returns a dictionary describing the store and its flushes.
+        """
+        with self.lock:
+            return {
+                "ships": int(len(self.shipIds)),
+                "fleets": len(self.fleetOverview),
+                "dirty_ships": int(self.dirty.sum()),
+                "dirty_fleets": len(self.dirtyFleets),
+                "version": self.version,
+                "flushes": self.flushCount,
+                "last_flush_rows": self.lastFlushRows,
+                "last_flush_ms": self.lastFlushSeconds * 1000,
+                "writer_running": self.writer != None and self.writer.is_alive(),
+            }
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: One client for every request to the game server. The
+#              login file is read once, requests share a keep-alive
+#              session so HTTPS connections are reused, failures are
+#              retried with jittered backoff, and answers that don't
+#              change often, like the current games, can be kept for a
+#              few seconds. Latency and errors are counted per endpoint.
+##############################################################################
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth asking again for.
+retryStatuses = {429, 500, 502, 503, 504}
+
+
+class GameServerClient(object):
+    """
+    GameServerClient
+    Sends authenticated GET requests to the game server over a
+    pooled session.
+    """
+
+    def __init__(self, credentialsPath, poolSize = 4, timeout = 10, retries = 3, backoff = 0.5):
+        self.credentialsPath = credentialsPath
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.config = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.statsLock = threading.Lock()
+        self.cache = {}
+        self.endpoints = {}
+        self.cacheHits = 0
+
+    def credentials(self):
+        """
+        credentials
+        Returns the "config" section of the login file, reading it
+        only the first time.
+        """
+        if self.config == None:
+            with open(self.credentialsPath) as inFile:
+                self.config = json.load(inFile)['config']
+        return self.config
+
+    def url(self, path):
+        config = self.credentials()
+        return "https://" + str(config['host']) + ":" + str(config['port']) + path
+
+    def request(self, path, params = None, retries = None):
+        """
+        request
+        Sends one GET with the hash added to params, retrying
+        connection errors and busy or failing server responses
+        with a jittered, doubling delay. retries overrides the
+        client's default, and should be 0 for requests that
+        change something on the server. Returns the response.
+        """
+        if retries == None:
+            retries = self.retries
+        url = self.url(path)
+        query = {"hash": str(self.credentials()['hash'])}
+        if params != None:
+            query.update(params)
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            failed = True
+            try:
+                response = self.session.get(url, params=query, timeout=self.timeout)
+                if response.status_code in retryStatuses and attempt < retries:
+                    response.close()
+                else:
+                    response.raise_for_status()
+                    failed = False
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    raise
+            finally:
+                self.record(path, time.perf_counter() - start, failed, attempt > 0)
+            attempt += 1
+            time.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+    def get(self, path, params = None, cacheSeconds = 0, retries = None):
+        """
+        get
+        Returns the parsed JSON answer. With cacheSeconds, the
+        same request is answered from memory for that long.
+        retries overrides the client's default.
+        """
+        key = (path, tuple(sorted((params or {}).items())))
+        if cacheSeconds > 0:
+            with self.statsLock:
+                cached = self.cache.get(key)
+                if cached != None and cached[0] > time.monotonic():
+                    self.cacheHits += 1
+                    return cached[1]
+
+        with self.request(path, params, retries=retries) as response:
+            result = response.json()
+
+        if cacheSeconds > 0:
+            with self.statsLock:
+                self.cache[key] = (time.monotonic() + cacheSeconds, result)
+        return result
+
+    def getContent(self, path, params = None):
+        """
+        getContent
+        Returns the raw bytes of the answer.
+        """
+        with self.request(path, params) as response:
+            return response.content
+
+    async def getAsync(self, path, params = None, cacheSeconds = 0):
+        """
+        getAsync
+        Awaitable version of get that runs on a worker thread.
+        """
+        return await asyncio.to_thread(self.get, path, params, cacheSeconds)
+
+    def record(self, path, seconds, failed, retried):
+        with self.statsLock:
+            endpoint = self.endpoints.setdefault(path,
+                {"requests": 0, "failures": 0, "retries": 0, "seconds": 0.0})
+            endpoint["requests"] += 1
+            endpoint["seconds"] += seconds
+            if failed:
+                endpoint["failures"] += 1
+            if retried:
+                endpoint["retries"] += 1
+
+    def clearCache(self):
+        with self.statsLock:
+            self.cache.clear()
+
+    def getStats(self):
+        with self.statsLock:
+            endpoints = {}
+            for path, endpoint in self.endpoints.items():
+                endpoints[path] = dict(endpoint)
+                endpoints[path]["averageSeconds"] = endpoint["seconds"] / endpoint["requests"]
+            return {
+                "timeout": self.timeout,
+                "retries": self.retries,
+                "cacheHits": self.cacheHits,
+                "cached": len(self.cache),
+                "endpoints": endpoints,
+            }
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Exports tables to a GeoPackage file, the SQLite based
+#              format QGIS and GDAL open directly. Geometry is written as
+#              WKB straight from PostGIS and every other column keeps its
+#              binary type, so the file is much smaller than the JSON
+#              exports. Rows are read through a server-side cursor and
+#              written a batch at a time, so memory use doesn't grow with
+#              the table.
+##############################################################################
+
+import json
+import sqlite3
+import struct
+import time
+
+# "GPKG" and GeoPackage 1.3, stored in the SQLite header.
+applicationId = 0x47504B47
+userVersion = 10300
+
+wgs84Definition = \
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,' \
+    'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,' \
+    'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,' \
+    'AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]'
+
+# SQLite column type for each Postgres type, TEXT for the rest.
+sqliteTypes = {
+    "int2": "INTEGER", "int4": "INTEGER", "int8": "INTEGER",
+    "float4": "REAL", "float8": "REAL", "numeric": "REAL",
+    "bool": "BOOLEAN", "bytea": "BLOB",
+    "timestamp": "DATETIME", "timestamptz": "DATETIME", "date": "DATE",
+    "geometry": "BLOB", "geography": "BLOB",
+}
+
+
+def geometryBlob(wkb, srsId):
+    """
+    geometryBlob
+    Wraps WKB in the GeoPackage geometry header: the magic "GP",
+    version 0, little endian flags without an envelope, and the
+    spatial reference id.
+    """
+    if wkb == None:
+        return None
+    return b"GP\x00\x01" + struct.pack("<i", srsId) + bytes(wkb)
+
+
+def sqliteValue(value):
+    """
+    sqliteValue
+    Converts a value from psycopg2 into one SQLite can store.
+    """
+    if value == None or isinstance(value, (int, float, str, bytes)):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    try:
+        # Decimal from numeric columns
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class GeoPackageWriter(object):
+    """
+    GeoPackageWriter
+    Creates a GeoPackage file and adds feature or attribute
+    tables to it.
+    """
+
+    def __init__(self, path, srsId = 4326):
+        self.path = path
+        self.srsId = srsId
+        self.db = sqlite3.connect(path)
+        self.db.execute(f"PRAGMA application_id = {applicationId};")
+        self.db.execute(f"PRAGMA user_version = {userVersion};")
+        self.db.executescript(
+            """
+                CREATE TABLE gpkg_spatial_ref_sys (
+                    srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY,
+                    organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL,
+                    definition TEXT NOT NULL, description TEXT);
+                CREATE TABLE gpkg_contents (
+                    table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,
+                    identifier TEXT UNIQUE, description TEXT DEFAULT '',
+                    last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+                    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+                    srs_id INTEGER REFERENCES gpkg_spatial_ref_sys(srs_id));
+                CREATE TABLE gpkg_geometry_columns (
+                    table_name TEXT NOT NULL REFERENCES gpkg_contents(table_name),
+                    column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+                    srs_id INTEGER NOT NULL REFERENCES gpkg_spatial_ref_sys(srs_id),
+                    z TINYINT NOT NULL, m TINYINT NOT NULL,
+                    PRIMARY KEY (table_name, column_name));
+            """)
+        self.db.executemany(
+            """
+                INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?);
+            """, [
+                ("Undefined cartesian SRS", -1, "NONE", -1, "undefined", None),
+                ("Undefined geographic SRS", 0, "NONE", 0, "undefined", None),
+                ("WGS 84 geodetic", 4326, "EPSG", 4326, wgs84Definition, None),
+            ])
+
+    def addTable(self, name, columns, geometryColumn = None, extent = None):
+        """
+        addTable
+        Creates a table from a list of (name, Postgres type)
+        columns. With a geometryColumn it is registered as a
+        feature table, with the other geometry columns kept as
+        plain WKB blobs, and otherwise as an attribute table.
+        extent is (min x, min y, max x, max y) when known.
+        """
+        definitions = ["fid INTEGER PRIMARY KEY AUTOINCREMENT"]
+        for column, columnType in columns:
+            sqliteType = sqliteTypes.get(columnType, "TEXT")
+            if column == geometryColumn:
+                sqliteType = "GEOMETRY"
+            definitions.append(f'"{column}" {sqliteType}')
+        self.db.execute(f'CREATE TABLE "{name}" ({", ".join(definitions)});')
+
+        if extent == None:
+            extent = (None, None, None, None)
+        if geometryColumn == None:
+            self.db.execute(
+                """
+                    INSERT INTO gpkg_contents (table_name, data_type, identifier)
+                    VALUES (?, 'attributes', ?);
+                """, (name, name))
+        else:
+            self.db.execute(
+                """
+                    INSERT INTO gpkg_contents (table_name, data_type, identifier,
+                        min_x, min_y, max_x, max_y, srs_id)
+                    VALUES (?, 'features', ?, ?, ?, ?, ?, ?);
+                """, (name, name) + tuple(extent) + (self.srsId,))
+            # z = 2 means Z values are optional.
+            self.db.execute(
+                """
+                    INSERT INTO gpkg_geometry_columns VALUES (?, ?, 'GEOMETRY', ?, 2, 0);
+                """, (name, geometryColumn, self.srsId))
+
+    def writeRows(self, name, columns, featureIndex, rows):
+        """
+        writeRows
+        Appends a batch of rows to a table. featureIndex is the
+        position of the feature geometry's WKB, if any.
+        """
+        placeholders = ", ".join(["?"] * len(columns))
+        names = ", ".join(f'"{column}"' for column, columnType in columns)
+        prepared = []
+        for row in rows:
+            values = []
+            for index, value in enumerate(row):
+                if index == featureIndex:
+                    values.append(geometryBlob(value, self.srsId))
+                else:
+                    values.append(sqliteValue(value))
+            prepared.append(values)
+        self.db.executemany(f'INSERT INTO "{name}" ({names}) VALUES ({placeholders});', prepared)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def exportTables(conn, tables, path, batchSize = 5000, srsId = 4326):
+    """
+    exportTables
+    Writes each Postgres table in tables, optionally schema
+    qualified, into a new GeoPackage at path. The first geometry
+    column of each table becomes its feature geometry. Returns
+    the row count of each table and the time taken.
+    """
+    start = time.perf_counter()
+    writer = GeoPackageWriter(path, srsId)
+    rowCounts = {}
+    try:
+        for table in tables:
+            schema, name = None, table
+            if "." in table:
+                schema, name = table.split(".", 1)
+
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                        SELECT column_name, udt_name FROM information_schema.columns
+                        WHERE table_name = %s AND table_schema = COALESCE(%s, current_schema())
+                        ORDER BY ordinal_position;
+                    """, (name, schema))
+                columns = cur.fetchall()
+                if len(columns) == 0:
+                    raise ValueError("Unknown table " + table + ".")
+                geometry = [column for column, columnType in columns
+                    if columnType in ("geometry", "geography")]
+                geometryColumn = geometry[0] if len(geometry) > 0 else None
+
+                extent = None
+                if geometryColumn != None:
+                    cur.execute(
+                        f"""
+                            SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+                            FROM (SELECT ST_Extent("{geometryColumn}"::geometry) AS extent FROM {table}) AS bounds;
+                        """)
+                    extent = cur.fetchone()
+
+            writer.addTable(name, columns, geometryColumn, extent)
+            selections = [f'ST_AsBinary("{column}"::geometry)' if column in geometry
+                else f'"{column}"' for column, columnType in columns]
+            featureIndex = None
+            if geometryColumn != None:
+                featureIndex = [column for column, columnType in columns].index(geometryColumn)
+
+            rowCounts[name] = 0
+            with conn.cursor(name="geopackage_export") as cur:
+                cur.itersize = batchSize
+                cur.execute(f"SELECT {', '.join(selections)} FROM {table};")
+                while True:
+                    rows = cur.fetchmany(batchSize)
+                    if len(rows) == 0:
+                        break
+                    writer.writeRows(name, columns, featureIndex, rows)
+                    rowCounts[name] += len(rows)
+        conn.commit()
+    finally:
+        writer.close()
+
+    return {"rows": rowCounts, "seconds": time.perf_counter() - start}
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Resolves shell trajectories against our ships. Uses the
+#              hit_polygon column of ship_shapes, which updateShipShapes
+#              keeps buffered by the hit radius, so every check can use
+#              the spatial indexes instead of buffering each ship again.
+#              A whole salvo is resolved with a single query.
+##############################################################################
+
+import threading
+
+from psycopg2.extras import execute_values
+
+
+class HitDetector(object):
+    """
+    HitDetector
+    Finds the first ship each shell trajectory passes through,
+    or the distance to the closest ship for shells that miss.
+    """
+
+    def __init__(self, cursorFactory):
+        self.cursorFactory = cursorFactory
+
+        self.statsLock = threading.Lock()
+        self.salvos = 0
+        self.shells = 0
+        self.hits = 0
+
+    def resolveSalvo(self, trajectories):
+        """
+        resolveSalvo
+        Takes a list of (initX, initY, finalX, finalY) trajectories
+        and returns a list with a result dictionary for each one,
+        in the same order. Hits hold "ship_id" and the "point" the
+        shell entered the ship's hit area. Misses hold "ship_id"
+        as None and the "closest_distance" in meters.
+        """
+        if len(trajectories) == 0:
+            return []
+
+        shellValues = [(index, float(trajectory[0]), float(trajectory[1]),
+            float(trajectory[2]), float(trajectory[3]))
+            for index, trajectory in enumerate(trajectories)]
+
+        with self.cursorFactory() as cur:
+            # Both lateral joins are bounding box checks against
+            # the GiST indexes. Hits take whichever ship is nearest
+            # the start of the path, and misses use KNN ordering to
+            # find the closest ship.
+            rows = execute_values(cur,
+                """
+                    SELECT shells.shell_index, hit.ship_id,
+                        ST_X(hit.hit_point), ST_Y(hit.hit_point), miss.distance
+                    FROM (
+                        SELECT shell_index,
+                            ST_SetSRID(ST_MakePoint(init_x, init_y), 4326) AS start_point,
+                            ST_SetSRID(ST_MakeLine(ST_MakePoint(init_x, init_y),
+                                ST_MakePoint(final_x, final_y)), 4326) AS shell_path
+                        FROM (VALUES %s) AS raw (shell_index, init_x, init_y, final_x, final_y)
+                    ) AS shells
+                    LEFT JOIN LATERAL (
+                        SELECT ship_id,
+                            ST_Centroid(ST_Intersection(shells.shell_path, hit_polygon)) AS hit_point
+                        FROM ship_shapes
+                        WHERE hit_polygon && shells.shell_path
+                            AND ST_Intersects(hit_polygon, shells.shell_path)
+                        ORDER BY ST_Distance(shells.start_point, hit_polygon)
+                        LIMIT 1
+                    ) AS hit ON true
+                    LEFT JOIN LATERAL (
+                        SELECT ST_Distance(ship_polygon::geography,
+                            shells.shell_path::geography) AS distance
+                        FROM ship_shapes
+                        WHERE hit.ship_id IS NULL
+                        ORDER BY ship_polygon <-> shells.shell_path
+                        LIMIT 1
+                    ) AS miss ON true
+                    ORDER BY shells.shell_index;
+                """,
+                shellValues, template="(%s, %s::float8, %s::float8, %s::float8, %s::float8)",
+                page_size=len(shellValues), fetch=True)
+
+        results = []
+        hitCount = 0
+        for row in rows:
+            if row[1] != None:
+                hitCount += 1
+                results.append({"ship_id": int(row[1]), "point": [float(row[2]), float(row[3])]})
+            else:
+                distance = None if row[4] == None else float(row[4])
+                results.append({"ship_id": None, "closest_distance": distance})
+
+        with self.statsLock:
+            self.salvos += 1
+            self.shells += len(trajectories)
+            self.hits += hitCount
+        return results
+
+    def getStats(self):
+        with self.statsLock:
+            return {
+                "salvos": self.salvos,
+                "shells": self.shells,
+                "hits": self.hits,
+            }
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Records incoming fire messages from other teams. Shots
+#              arrive from the listener in small batches, and each batch
+#              is written to the incoming_shots table with one insert
+#              that also checks every shell against the pre-buffered
+#              hit polygons in ship_shapes.
+##############################################################################
+
+import json
+import threading
+
+from psycopg2.extras import execute_values
+
+
+def parseFireMessage(routingKey, body):
+    """
+    parseFireMessage
+    Turns a fire message into a (routing key, lon, lat, angle, kg)
+    tuple. Returns None for messages that aren't valid shots.
+    """
+    if not routingKey.endswith(".fire"):
+        return None
+    try:
+        if isinstance(body, bytes):
+            body = body.decode()
+        shot = json.loads(body)
+        return (routingKey, float(shot["lon"]), float(shot["lat"]),
+            float(shot.get("angle", 0)), float(shot.get("kg", 0)))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+class ShotIngest(object):
+    """
+    ShotIngest
+    Handler for CommsConsumer that stores incoming shots and finds
+    which of our ships each one hit.
+    """
+
+    def __init__(self, cursorFactory):
+        self.cursorFactory = cursorFactory
+
+        self.statsLock = threading.Lock()
+        self.shotsRecorded = 0
+        self.hits = 0
+        self.rejected = 0
+
+    def handleBatch(self, messages):
+        """
+        handleBatch
+        Parses a batch of (routing key, body) messages and records
+        every valid shot. Ships are matched with a bounding box
+        prefilter against the hit polygon index before the exact
+        check, and the closest ship wins. Returns once the batch
+        is committed so the consumer can ack it.
+        """
+        shots = []
+        for routingKey, body in messages:
+            shot = parseFireMessage(routingKey, body)
+            if shot != None:
+                shots.append(shot)
+
+        with self.statsLock:
+            self.rejected += len(messages) - len(shots)
+        if len(shots) == 0:
+            return 0
+
+        with self.cursorFactory() as cur:
+            hitRows = execute_values(cur,
+                """
+                    INSERT INTO incoming_shots
+                        (routing_key, shot_geom, angle, kg, hit_ship_id)
+                        SELECT shots.routing_key, shots.shot_geom, shots.angle,
+                            shots.kg, hit.ship_id
+                        FROM (
+                            SELECT routing_key,
+                                ST_SetSRID(ST_MakePoint(lon, lat), 4326) AS shot_geom,
+                                angle, kg
+                            FROM (VALUES %s) AS raw (routing_key, lon, lat, angle, kg)
+                        ) AS shots
+                        LEFT JOIN LATERAL (
+                            SELECT ship_id FROM ship_shapes
+                                WHERE hit_polygon && shots.shot_geom
+                                    AND ST_Intersects(hit_polygon, shots.shot_geom)
+                                ORDER BY ship_polygon <-> shots.shot_geom
+                                LIMIT 1
+                        ) AS hit ON true
+                        RETURNING hit_ship_id;
+                """,
+                shots, template="(%s, %s::float8, %s::float8, %s::numeric, %s::numeric)",
+                page_size=len(shots), fetch=True)
+
+        hitCount = sum(1 for row in hitRows if row[0] != None)
+        with self.statsLock:
+            self.shotsRecorded += len(shots)
+            self.hits += hitCount
+        return hitCount
+
+    def getStats(self):
+        with self.statsLock:
+            return {
+                "shots_recorded": self.shotsRecorded,
+                "hits": self.hits,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04.X - Battleship API
+# Date: November 30, 2022
+# Python 3.9.5
+# Project Version: 0.3.0
+#
+# Description: Picks fleet spawn points. The area a fleet may spawn in
+#              is built once as a polygon: the bounding box, inside the
+#              max spawn buffer, outside the min spawn buffer, and inside
+#              the wedge for the chosen cardinal direction. Points are
+#              then sampled straight from that polygon, so placement
+#              takes the same few queries every time instead of retrying
+#              random points until one lands in the right place.
+##############################################################################
+
+from math import sin, cos
+
+import numpy as np
+
+from module.fleetstate import greatCircleDistance
+
+# Points used along the curved edge of a sector wedge
+arcSteps = 16
+
+
+def sectorWedge(centerX, centerY, radius, lowAngle, highAngle):
+    """
+    sectorWedge
+    Returns WKT for a pie slice around a center point. Angles are
+    radians clockwise from north, the same as ST_Azimuth, and the
+    wedge runs clockwise from lowAngle to highAngle.
+    """
+    if highAngle < lowAngle:
+        highAngle += 2 * np.pi
+    points = [(centerX, centerY)]
+    for angle in np.linspace(lowAngle, highAngle, arcSteps + 1):
+        points.append((centerX + radius * sin(angle), centerY + radius * cos(angle)))
+    points.append((centerX, centerY))
+    return "POLYGON((" + ", ".join(f"{x} {y}" for x, y in points) + "))"
+
+
+def buildSpawnArea(cur, lowAngle, highAngle):
+    """
+    buildSpawnArea
+    Builds the spawn polygon from the bbox table's bounding box,
+    min spawn buffer and max spawn buffer, cut down to the wedge
+    between lowAngle and highAngle. Returns the polygon as WKB hex.
+    """
+    sql = \
+        f"""
+            SELECT ST_XMin(bbox_geom), ST_YMin(bbox_geom),
+                ST_XMax(bbox_geom), ST_YMax(bbox_geom),
+                ST_X(ST_Centroid(bbox_geom)), ST_Y(ST_Centroid(bbox_geom))
+            FROM bbox LIMIT 1;
+        """
+    cur.execute(sql)
+    minX, minY, maxX, maxY, centerX, centerY = cur.fetchone()
+
+    # Any radius past the corners of the box covers the whole sector.
+    radius = 2 * max(maxX - minX, maxY - minY)
+    wedge = sectorWedge(centerX, centerY, radius, lowAngle, highAngle)
+
+    sql = \
+        f"""
+            SELECT ST_CollectionExtract(ST_Intersection(
+                ST_Difference(ST_Intersection(bbox_geom, bbox_max_spawn), bbox_min_spawn),
+                ST_GeomFromText(%s, 4326)), 3)
+            FROM bbox LIMIT 1;
+        """
+    cur.execute(sql, (wedge,))
+    spawnArea = cur.fetchone()[0]
+    return spawnArea
+
+
+def placeFleets(cur, lowAngle, highAngle, fleetCount = 1, minSeparation = 0, candidateFactor = 20):
+    """
+    placeFleets
+    Returns fleetCount (lon, lat) spawn points inside the spawn
+    area, each at least minSeparation meters from the others.
+    Candidates are sampled inside the area in one query and then
+    picked greedily, so the cost doesn't depend on luck.
+    Raises ValueError if the area is empty or too small to fit
+    every fleet apart.
+    """
+    spawnArea = buildSpawnArea(cur, lowAngle, highAngle)
+    if spawnArea == None:
+        raise ValueError("Spawn area is empty.")
+
+    sql = \
+        f"""
+            SELECT ST_Area(%s::geometry);
+        """
+    cur.execute(sql, (spawnArea,))
+    if cur.fetchone()[0] == 0:
+        raise ValueError("Spawn area is empty.")
+
+    candidateCount = max(fleetCount * candidateFactor, 1)
+    sql = \
+        f"""
+            SELECT ST_X(candidate.geom), ST_Y(candidate.geom)
+            FROM ST_Dump(ST_GeneratePoints(%s::geometry, %s)) AS candidate;
+        """
+    cur.execute(sql, (spawnArea, candidateCount))
+    candidates = np.array(cur.fetchall(), dtype=np.float64)
+
+    chosen = []
+    for lon, lat in candidates:
+        if len(chosen) > 0 and minSeparation > 0:
+            chosenArray = np.array(chosen)
+            distances = greatCircleDistance(chosenArray[:, 0], chosenArray[:, 1], lon, lat)
+            if np.min(distances) < minSeparation:
+                continue
+        chosen.append((float(lon), float(lat)))
+        if len(chosen) == fleetCount:
+            return chosen
+
+    raise ValueError("Spawn area is too small for " + str(fleetCount) + " fleets.")
@@ -13,6 +13,9 @@
 
 import time
 import datetime
+import functools
+
+import numpy as np
 
 """
 convertTimeToSecondsSimple
@@ -99,7 +102,91 @@ def convertDateToOtherDate(inTime):
     # Example return time: “27/10/22 12:12:07”
     tempString = str(inTime)
     rawString = str(tempString.replace(" ", "-")).split("-")
-    print(rawString)
     year = str(rawString[0][2::])
     return (rawString[2] + '/' + rawString[1] + '/' + year + ' ' + rawString[3])
-    
+
+
+# Most distinct "hour:minute:second" strings remembered by
+# timeOfDaySeconds between calls.
+timeCacheSize = 4096
+
+@functools.lru_cache(maxsize=timeCacheSize)
+def timeOfDaySeconds(inTime):
+    """
+    timeOfDaySeconds
+    Numeric, memoized version of convertTimeToSecondsSimple.
+    Parameters:         inTime: String containing a time code in the format of
+                                "hour:minute:second" without quotes
+    Returns:            timecode converted into plain seconds as a float.
+    """
+    tempTime2 = inTime.split(':')
+    return int(tempTime2[0]) * 3600 + int(tempTime2[1]) * 60 + float(tempTime2[2])
+
+
+def distinctTimes(inTimes):
+    """
+    distinctTimes
+    Finds the distinct strings in a list or NumPy array of times so
+    each only has to be parsed once, such as the shared current_time
+    of a radar sweep.
+    Returns:            The distinct strings in order of first use, the
+                        position of each input in that list, and the
+                        input's shape.
+    """
+    if isinstance(inTimes, np.ndarray):
+        shape = inTimes.shape
+        inTimes = inTimes.ravel().tolist()
+    else:
+        shape = (len(inTimes),)
+    index = {}
+    positions = np.fromiter([index.setdefault(inTime, len(index)) for inTime in inTimes],
+        dtype=np.intp, count=len(inTimes))
+    return list(index), positions, shape
+
+
+def convertTimesToSecondsSimple(inTimes):
+    """
+    convertTimesToSecondsSimple
+    Batch version of convertTimeToSecondsSimple.
+    Parameters:         inTimes: List or NumPy array of strings in the format of
+                                 "hour:minute:second" without quotes
+    Returns:            NumPy float64 array of timecodes in plain seconds.
+    """
+    uniqueTimes, positions, shape = distinctTimes(inTimes)
+    seconds = np.zeros(len(uniqueTimes), dtype=np.float64)
+    for index, inTime in enumerate(uniqueTimes):
+        tempTime2 = inTime.split(':')
+        seconds[index] = int(tempTime2[0]) * 3600 + int(tempTime2[1]) * 60 + float(tempTime2[2])
+    return seconds[positions].reshape(shape)
+
+
+def convertTimesToSecondsNoDate(inTimes):
+    """
+    convertTimesToSecondsNoDate
+    Batch version of convertTimeToSecondsNoDate. The distinct times
+    are parsed in one vectorized pass as NumPy datetimes.
+    Parameters:         inTimes: List or NumPy array of strings in the format of
+                                 "year-month-day hour:minute:second" without quotes
+    Returns:            NumPy float64 array of seconds since the start of each day.
+    """
+    uniqueTimes, positions, shape = distinctTimes(inTimes)
+    if len(uniqueTimes) == 0:
+        return np.zeros(shape, dtype=np.float64)
+    isoTimes = np.char.replace(np.array(uniqueTimes, dtype=str), ' ', 'T')
+    dateTimes = isoTimes.astype('datetime64[us]')
+    sinceMidnight = dateTimes - dateTimes.astype('datetime64[D]')
+    return (sinceMidnight.astype(np.int64) / 1e6)[positions].reshape(shape)
+
+
+def convertTimesToSeconds(inTimes):
+    """
+    convertTimesToSeconds
+    Batch version of convertTimeToSeconds.
+    Parameters:         inTimes: List or NumPy array of strings in the format of
+                                 "year-month-day hour:minute:second" without quotes
+    Returns:            NumPy float64 array of POSIX timestamps.
+    """
+    uniqueTimes, positions, shape = distinctTimes(inTimes)
+    seconds = np.array([datetime.datetime.fromisoformat(inTime).timestamp()
+        for inTime in uniqueTimes], dtype=np.float64)
+    return seconds[positions].reshape(shape)
@@ -16,6 +16,7 @@
 # pip install fastapi
 # pip install psycopg2
 # pip install pika
+# pip install numpy
 # Afterward, set up your basic with pgAdmin and fill out the .config.json 
 # file. Adjust the line below to your install path if necessary for
 # the confPath variable.
@@ -68,8 +69,9 @@
 ##############################################################################
 
 # Libraries for FastAPI
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, Body, Request
+from fastapi.responses import RedirectResponse, StreamingResponse, Response, FileResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
@@ -81,7 +83,7 @@ import requests
 
 # Radio broadcast libraries
 from sender import parseCommand
-from comms import CommsSender
+from comms import getCommsPublisher, closeCommsPublishers
 
 # Builtin libraries
 from math import radians, degrees, cos, sin, asin, sqrt, pow, atan2, pi
@@ -91,11 +93,18 @@ import json
 import sys
 import time
 import datetime
+import tempfile
 
 # Local project module
 from module import convertTimeToSecondsSimple, convertTimeFromSecondsNoDate
 from module import convertTimeToSecondsNoDate, convertTimeToSeconds
 from module import convertTimeFromSeconds, convertDateToOtherDate
+from module import getConnectionPool, closeConnectionPools
+from module import FleetState, HitDetector
+from module import placeFleets, loadFleetFile, loadFleet
+from module import exportTables
+from module import GameServerClient
+from module import DownloadCache, writeLogAsync
 
 ##############################################################################
 #                          Tables Descriptions
@@ -143,8 +152,17 @@ from module import convertTimeFromSeconds, convertDateToOtherDate
 ##                            fleet_reference_point geometry , and 
 ##                            certainty_radius
 # ship_shapes:                Stores the ships as rotated rectangles.
-##  Columns:                  ship_id numeric, ship_polygon geometry
-##                            and its spatial index ship_shape_index
+##  Columns:                  ship_id numeric, ship_polygon geometry,
+##                            hit_polygon geometry (ship_polygon buffered
+##                            by extraHitBuffer) and their spatial indexes
+##                            ship_shape_index and ship_hit_index
+# incoming_shots:             Stores shots other teams fired at us, as
+#                             recorded by "listener.py ingest", along
+#                             with which of our ships each one hit.
+##  Columns:                  shot_id serial, routing_key text,
+##                            shot_geom geometry, angle numeric,
+##                            kg numeric, hit_ship_id numeric,
+##                            received_at timestamptz
 # bbox:                       Holds the simulation bounding box as well
 #                             as additional bounding boxes to hold areas
 #                             which serve as buffers for white listing
@@ -171,9 +189,36 @@ tableList = \
         "fleet_template",     \
         "fleet_overview",     \
         "enemy_tracker",      \
-        "ship_shapes"
+        "ship_shapes",        \
+        "incoming_shots"
     ]
 
+# Keeps fleet_version_seq moving whenever the fleet or its overview
+# changes so exports can answer repeated polls with 304 Not Modified.
+# Triggers are dropped along with their tables, so this is run again
+# whenever the fleet tables are recreated.
+fleetVersionSQL = \
+    """
+        CREATE SEQUENCE IF NOT EXISTS public.fleet_version_seq;
+
+        CREATE OR REPLACE FUNCTION public.bump_fleet_version() RETURNS trigger AS $$
+        BEGIN
+            PERFORM nextval('fleet_version_seq');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS fleet_version_trigger ON public.fleet;
+        CREATE TRIGGER fleet_version_trigger
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.fleet
+            FOR EACH STATEMENT EXECUTE PROCEDURE bump_fleet_version();
+
+        DROP TRIGGER IF EXISTS fleet_overview_version_trigger ON public.fleet_overview;
+        CREATE TRIGGER fleet_overview_version_trigger
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.fleet_overview
+            FOR EACH STATEMENT EXECUTE PROCEDURE bump_fleet_version();
+    """
+
 # Load up from JSON or central server
 # Stores information necessary to reach the web address of other APIs.
 attackerIPs = []
@@ -204,46 +249,72 @@ simulationDebugLevel = 2
 
 randSeed = 1
 
+# Optional in-memory copy of the fleet. None while disabled, otherwise
+# a FleetState that writes changes back to the database in batches.
+fleetState = None
+fleetStateFlushInterval = 0.5
+
+# What extra radius around the ship counts as a hit. Hit polygons
+# are rebuilt with this buffer every time ship shapes change.
+extraHitBuffer = 10
+# Resolves every shell path, and counts salvos, shells and hits.
+hitDetector = HitDetector(lambda: DatabaseCursor(confPath))
+
+# Broadcasts go through one long-lived publisher. Fire messages are
+# held this many seconds so a volley is published back to back.
+commsBatchWindow = 0.05
+commsConfirmDelivery = False
+
 directoryAppendPath = ""
 confPath = directoryAppendPath + ".config.json"
 credentialsPath = directoryAppendPath + "login.json"
 
+# Every game server request goes through one client with a pooled
+# session. The current games list is kept this many seconds.
+gameServerTimeout = 10
+gameServerRetries = 3
+currentGamesCacheSeconds = 5
+gameServer = GameServerClient(credentialsPath, timeout=gameServerTimeout,
+    retries=gameServerRetries)
+
+# Region and fleet downloads are kept per game, so setting up the
+# same game again doesn't ask the server. Set a directory to also
+# keep them between runs.
+downloadCacheEntries = 16
+downloadCacheDirectory = None
+downloadCache = DownloadCache(downloadCacheEntries, downloadCacheDirectory)
+
 
 class DatabaseCursor(object):
 
     def __init__(self, conn_config_file):
-        with open(conn_config_file) as config_file:
-            self.conn_config = json.load(config_file)
+        # Config is only parsed the first time the pool is created
+        self.pool = getConnectionPool(conn_config_file)
 
-    # Load object from information from the config file
+    # Check out a pooled connection that already has the schema set
     def __enter__(self):
-        self.conn = psycopg2.connect(
-            "dbname='"
-            + self.conn_config["dbname"]
-            + "' "
-            + "user='"
-            + self.conn_config["user"]
-            + "' "
-            + "host='"
-            + self.conn_config["dbhost"]
-            + "' "
-            + "password='"
-            + self.conn_config["password"]
-            + "' "
-            + "port="
-            + self.conn_config["port"]
-            + " "
-        )
+        self.conn = self.pool.getConnection()
         self.cur = self.conn.cursor()
-        self.cur.execute("SET search_path TO " + self.conn_config["schema"])
 
         return self.cur
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # some logic to commit/rollback
-
-        self.conn.commit()
-        self.conn.close()
+        # Commit like before, but hand the connection back to the
+        # pool instead of closing it. If the block raised, or the
+        # commit fails, everything is rolled back so half a change
+        # is never kept and the next borrower gets a clean connection.
+        try:
+            self.cur.close()
+            if exc_type != None:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+        except psycopg2.Error:
+            if not self.conn.closed:
+                self.conn.rollback()
+            raise
+        finally:
+            self.pool.putConnection(self.conn)
 
 
 description = \
@@ -269,6 +340,67 @@ async def docs_redirect():
         above in the ApiInfo section."""
     return RedirectResponse(url="/docs")
 
+@app.get("/connectionPoolStats")
+def connectionPoolStats():
+    """
+    connectionPoolStats
+    Returns the database connection pool's settings along with
+    checkout wait times and how many connections are in use.
+    Ex. 
+     http://localhost:8081/connectionPoolStats
+    """
+    try:
+        return getConnectionPool(confPath).getStats()
+    except:
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error.")
+        return "Host database configuration error."
+
+@app.get("/gameServerStats")
+def gameServerStats():
+    """
+    gameServerStats
+    Returns request counts, failures, retries and average
+    latency for each game server endpoint, along with how
+    often cached answers were used.
+    Ex. 
+     http://localhost:8081/gameServerStats
+    """
+    return gameServer.getStats()
+
+@app.get("/downloadCacheStats")
+def downloadCacheStats():
+    """
+    downloadCacheStats
+    Returns how many region and fleet downloads were answered
+    from memory, from disk, or by the game server.
+    Ex. 
+     http://localhost:8081/downloadCacheStats
+    """
+    return downloadCache.getStats()
+
+@app.on_event("shutdown")
+def closeConnectionPool():
+    """
+    closeConnectionPool
+    Closes pooled database connections when the server stops.
+    Any in-memory fleet changes are written out first, and any
+    queued broadcasts are sent.
+    """
+    if fleetState != None:
+        try:
+            fleetState.stop()
+        except:
+            if(simulationDebugLevel > 0):
+                print("Error writing fleet state on shutdown.")
+    try:
+        closeCommsPublishers()
+    except:
+        if(simulationDebugLevel > 0):
+            print("Error sending queued broadcasts on shutdown.")
+    gameServer.close()
+    closeConnectionPools()
+
 
 
 ##############################################################################
@@ -296,32 +428,11 @@ def createGame(targetName):
     Ex. 
      http://localhost:8081/createGame/test1
     """
-    # Acquire request credentials
-    credDict = {}
-    try:
-        inFile = open(credentialsPath)
-        credDict = json.load(inFile)
-        inFile.close()
-    except:
-        if(simulationDebugLevel > 0):
-            print("Error reading credentials file.")
-        return "Error reading credentials file."
-
-    # Generate URL for request
-    url = ""
-    try:
-        urlPath = "https://" + credDict['config']['host'] + ":" + credDict['config']['port']
-        urlParam = "/create_game/"
-        authString = "?hash=" + credDict['config']['hash'] + "&game_name=" + targetName
-        url = urlPath + urlParam + authString
-    except:
-        if(simulationDebugLevel > 0):
-            print("Error generating request URL.")
-        return "Error generating request URL."
-
-    # Actually send game creation request to game server
+    # Actually send game creation request to game server. It isn't
+    # retried, since a slow success that timed out here would make
+    # a second game.
     try:
-        returnMessage = json.loads(requests.get(url).content)
+        returnMessage = gameServer.get("/create_game/", {"game_name": targetName}, retries=0)
         global gameName
         gameName = returnMessage['gameId']
         return returnMessage
@@ -339,32 +450,11 @@ async def currentGames():
     Ex. 
      http://localhost:8081/currentGames
     """
-    # Acquire request credentials
-    credDict = {}
+    # Actually query game server for games list. The list is
+    # shared for a few seconds and fetched off the event loop.
     try:
-        inFile = open(credentialsPath)
-        credDict = json.load(inFile)
-        inFile.close()
-    except:
-        if(simulationDebugLevel > 1):
-            print("Error reading credentials file.")
-        return "Error reading credentials file."
-
-    # Generate query URL
-    url = ""
-    try:
-        urlPath = "https://" + credDict['config']['host'] + ":" + credDict['config']['port']
-        urlParam = "/current_games/"
-        authString = "?hash=" + credDict['config']['hash']
-        url = urlPath + urlParam + authString
-    except:
-        if(simulationDebugLevel > 0):
-            print("Error generating query URL.")
-        return "Error generating query URL."
-
-    # Actually query game server for games list
-    try:
-        returnMessage = json.loads(requests.get(url).content)
+        returnMessage = await gameServer.getAsync("/current_games/",
+            cacheSeconds=currentGamesCacheSeconds)
         return returnMessage
     except:
         if(simulationDebugLevel > 0):
@@ -409,109 +499,128 @@ def fleetHitDetection(initX, initY, finalX, finalY):
     """
     fleetHitDetection
     Returns the shortest distance or first intersection of a projectile.
+    Ex. 
+     http://localhost:8081/fleetHitDetection/-10.5/40.1/-10.4/40.2
     """
-
-    # What extra radius around the ship counts as a hit.
-    extraHitBuffer = 10
-
     try:
-        with DatabaseCursor(confPath) as cur:
-            # Calculate if there are any intersections first
-            sql = \
-                f"""
-                    SELECT  ST_Centroid(ST_Intersection(ST_MakeLine(ST_SetSRID(ST_MakePoint({str(initX)}, {str(initX)}), 4326), 
-                                                    ST_SetSRID(ST_MakePoint({str(finalX)}, {str(finalY)}), 4326)), 
-					                        ST_Buffer(ship_polygon::geography, {str(extraHitBuffer)})::geometry(Polygon, 4326)))::jsonb,
-                            ship_id
-                    FROM ship_shapes
-                    WHERE ST_Intersects(ST_MakeLine(ST_SetSRID(ST_MakePoint({str(initX)}, {str(initX)}), 4326), 
-                                                    ST_SetSRID(ST_MakePoint({str(finalX)}, {str(finalY)}), 4326)), 
-					                        ST_Buffer(ship_polygon::geography, {str(extraHitBuffer)})::geometry(Polygon, 4326))
-                    ORDER BY ST_Distance(ST_SetSRID(ST_MakePoint({str(initX)}, {str(initY)}), 4326), ship_polygon) LIMIT 1;
-                """
-
-            cur.execute(sql)
-            intersectsFirst = cur.fetchone()
-
-            print(intersectsFirst)
-
-            # Returns any ship if a hit.
-            if(intersectsFirst != None):
-                return ("Hits ship: " + str(intersectsFirst[1]))
-
-            # Calculates closest hit otherwise
-            sql = \
-                f"""
-                    SELECT ST_Distance(ship_polygon::geography, ST_SetSRID(ST_MakePoint(0, 0), 4326)::geography)
-                    FROM ship_shapes 
-                    ORDER BY ST_Distance(ship_polygon::geography, ST_SetSRID(ST_MakePoint(0, 0), 4326)::geography) ASC
-                    LIMIT 1;
-                """
+        result = hitDetector.resolveSalvo(
+            [(initX, initY, finalX, finalY)])[0]
 
-            cur.execute(sql)
-            closestDistance = cur.fetchone()[0]
+        # Returns any ship if a hit.
+        if(result["ship_id"] != None):
+            return ("Hits ship: " + str(result["ship_id"]))
 
-            return ("Closest distance: " + str(closestDistance))
+        # Calculates closest hit otherwise
+        return ("Closest distance: " + str(result["closest_distance"]))
 
     except:
         if(simulationDebugLevel > 1):
             print ("Host database configuration error.")
         return "Host database configuration error."
 
-def updateShipShapesAlternate():
+@app.post("/salvoHitDetection")
+def salvoHitDetection(trajectories: list = Body(...)):
+    """
+    salvoHitDetection
+    Resolves a whole salvo at once. Takes a list of 
+    [initX, initY, finalX, finalY] shell paths and returns, 
+    in the same order, the first ship each one hits or 
+    the closest distance to a ship for misses.
+    Ex. POST http://localhost:8081/salvoHitDetection
+     [[-10.5, 40.1, -10.4, 40.2], [-10.5, 40.1, -10.6, 40.0]]
+    """
+    try:
+        return hitDetector.resolveSalvo(trajectories)
+    except:
+        if(simulationDebugLevel > 1):
+            print ("Host database configuration error or invalid inputs.")
+        return "Host database configuration error or invalid inputs."
+
+@app.get("/hitDetectionStats")
+def hitDetectionStats():
+    """
+    hitDetectionStats
+    Returns how many salvos, shells and hits have been
+    resolved.
+    Ex. 
+     http://localhost:8081/hitDetectionStats
+    """
+    return hitDetector.getStats()
+
+def shipShapeFilter(shipIds = None, fleetNums = None):
+    """
+    shipShapeFilter
+    Builds the WHERE clause limiting a shape update to the 
+    given ships and/or fleets. Returns an empty string to
+    update every ship.
+    """
+    conditions = []
+    if shipIds != None and len(shipIds) > 0:
+        idString = ", ".join(str(int(shipId)) for shipId in shipIds)
+        conditions.append(f"fleet.ship_id IN ({idString})")
+    if fleetNums != None and len(fleetNums) > 0:
+        fleetString = ", ".join(str(int(fleetNum)) for fleetNum in fleetNums)
+        conditions.append(f"fleet.fleet_num IN ({fleetString})")
+    if len(conditions) == 0:
+        return ""
+    return "WHERE " + " OR ".join(conditions)
+
+def updateShipShapesAlternate(shipIds = None, fleetNums = None):
     """
     updateShipShapesAlternate
     Updates ship polygons so that they reflect the ship's current 
     position and dimensions. Places ships with their position
-    at the bottom left of the polygon.
+    at the bottom left of the polygon. Optionally only updates
+    the ships in shipIds and/or fleetNums.
     """
     try:
+        whereClause = shipShapeFilter(shipIds, fleetNums)
+        if (whereClause == "" and (shipIds != None or fleetNums != None)):
+            return "Shapes updated successfully."
+
         with DatabaseCursor(confPath) as cur:
             # Calculate new rectangles for ship geometry.
-            # Ship reference points are on the bottom left corner
+            # Ship reference points are on the bottom left corner.
+            # Each corner is projected once per ship from a single
+            # join against fleet. The buffered hit area is refreshed
+            # in the same pass.
             sql = \
                 f"""
                     UPDATE ship_shapes 
-                        SET ship_polygon = 
-                            ST_SetSRID(ST_MakePolygon(
-                                ST_AddPoint(
-                                ST_AddPoint( 
-                                ST_AddPoint( 
-                                ST_MakeLine(
+                        SET ship_polygon = shapes.polygon,
+                            hit_polygon = ST_Buffer(shapes.polygon::geography, 
+                                {str(extraHitBuffer)})::geometry(Polygon, 4326)
+                        FROM
+                        (
+                        SELECT ship_id, 
+                            ST_SetSRID(ST_MakePolygon(ST_MakeLine(ARRAY[
+                                corners.bottom_left, 
+                                corners.top_left, 
+                                corners.top_right, 
+                                corners.bottom_right, 
+                                corners.bottom_left
+                            ])), 4326) AS polygon
+                        FROM
+                        (
+                            SELECT ship_id, 
                                 /* Bottom left point */
-                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
+                                ship_geom AS bottom_left,
                                 /* Top left point */
-                                ST_Project
-                                    (
-                                        (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                        (SELECT ship_length FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
-                                        (SELECT bearing FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
-                                    )::geometry (Point,4326)),
+                                ST_Project(ship_geom::geography, ship_length, bearing)::geometry (Point,4326) AS top_left,
                                 /* Top Right point */
-                                ST_Project
-                                    (
-                                        (
-                                            ST_Project
-                                            (
-                                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                                (SELECT ship_width FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
-                                                (SELECT bearing + (Pi() * 0.5) FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
-                                            )::geometry (Point,4326)
-                                        )::geography,
-                                        (SELECT ship_length FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
-                                        (SELECT bearing FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
-                                    )::geometry (Point,4326)),
+                                ST_Project(starboard_side, ship_length, bearing)::geometry (Point,4326) AS top_right,
                                 /* Bottom right point */
-                                ST_Project
-                                    (
-                                        (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                        (SELECT ship_width FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1),
-                                        (SELECT bearing + (Pi() * 0.5) FROM FLEET WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
-                                    )::geometry (Point,4326)
-                                ), 
-                                /* Bottom left point */
-                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1))
-                            ), 4326);
+                                starboard_side::geometry (Point,4326) AS bottom_right
+                            FROM
+                            (
+                                SELECT ship_id, ship_geom, ship_length, bearing,
+                                    ST_Project(ship_geom::geography, ship_width, bearing + (Pi() * 0.5)) AS starboard_side
+                                FROM fleet
+                                {whereClause}
+                            ) AS sides
+                        ) AS corners
+                        ) AS shapes
+                        WHERE ship_shapes.ship_id = shapes.ship_id;
                 """
 
             cur.execute(sql)
@@ -523,98 +632,63 @@ def updateShipShapesAlternate():
             print ("Host database configuration error.")
         return "Host database configuration error."
 
-def updateShipShapes():
+def updateShipShapes(shipIds = None, fleetNums = None):
     """
     updateShipShapes
     Updates ship polygons so that they reflect the ship's current 
     position and dimensions. An alternate version
     that places ships at their polygon's center for position.
+    Optionally only updates the ships in shipIds and/or fleetNums.
     """
     try:
+        whereClause = shipShapeFilter(shipIds, fleetNums)
+        if (whereClause == "" and (shipIds != None or fleetNums != None)):
+            return "Shapes updated successfully."
+
         with DatabaseCursor(confPath) as cur:
             # Calculate new rectangles for ship geometry.
-            # Ship reference points are on the bottom left corner
+            # Ship reference points are at the center.
+            # Each corner is projected once per ship from a single
+            # join against fleet. The buffered hit area is refreshed
+            # in the same pass.
             sql = \
                 f"""
                     UPDATE ship_shapes 
-                        SET ship_polygon = 
-                            ST_SetSRID(ST_MakePolygon(
-                                ST_AddPoint(
-                                ST_AddPoint( 
-                                ST_AddPoint( 
-                                ST_MakeLine(
+                        SET ship_polygon = shapes.polygon,
+                            hit_polygon = ST_Buffer(shapes.polygon::geography, 
+                                {str(extraHitBuffer)})::geometry(Polygon, 4326)
+                        FROM
+                        (
+                        SELECT ship_id, 
+                            ST_SetSRID(ST_MakePolygon(ST_MakeLine(ARRAY[
+                                corners.bottom_left, 
+                                corners.top_left, 
+                                corners.top_right, 
+                                corners.bottom_right, 
+                                corners.bottom_left
+                            ])), 4326) AS polygon
+                        FROM
+                        (
+                            SELECT ship_id, 
                                 /* Bottom left point */
-                                ST_Project
-                                    (
-                                        (
-                                            ST_Project
-                                            (
-                                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) - (Pi() * 0.5)
-                                            )::geometry (Point,4326)
-                                        )::geography,
-                                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + Pi()
-                                    )::geometry (Point,4326),
+                                ST_Project(port_side, ship_length * 0.5, bearing + Pi())::geometry (Point,4326) AS bottom_left,
                                 /* Top left point */
-                                ST_Project
-                                    (
-                                        (
-                                            ST_Project
-                                            (
-                                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) - (Pi() * 0.5)
-                                            )::geometry (Point,4326)
-                                        )::geography,
-                                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
-                                    )::geometry (Point,4326)),
+                                ST_Project(port_side, ship_length * 0.5, bearing)::geometry (Point,4326) AS top_left,
                                 /* Top Right point */
-                                ST_Project
-                                    (
-                                        (
-                                            ST_Project
-                                            (
-                                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + (Pi() * 0.5)
-                                            )::geometry (Point,4326)
-                                        )::geography,
-                                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)
-                                    )::geometry (Point,4326)),
+                                ST_Project(starboard_side, ship_length * 0.5, bearing)::geometry (Point,4326) AS top_right,
                                 /* Bottom right point */
-                                ST_Project
-                                    (
-                                        (
-                                            ST_Project
-                                            (
-                                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + (Pi() * 0.5)
-                                            )::geometry (Point,4326)
-                                        )::geography,
-                                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + Pi()
-                                    )::geometry (Point,4326)
-                                ), 
-                                /* Bottom left point */
-                                ST_Project
-                                    (
-                                        (
-                                            ST_Project
-                                            (
-                                                (SELECT ship_geom FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1)::geography,
-                                                (SELECT ship_width FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                                (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) - (Pi() * 0.5)
-                                            )::geometry (Point,4326)
-                                        )::geography,
-                                        (SELECT ship_length FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) * 0.5,
-                                        (SELECT bearing FROM fleet WHERE fleet.ship_id = ship_shapes.ship_id LIMIT 1) + Pi()
-                                    )::geometry (Point,4326))
-                            ), 4326);
+                                ST_Project(starboard_side, ship_length * 0.5, bearing + Pi())::geometry (Point,4326) AS bottom_right
+                            FROM
+                            (
+                                SELECT ship_id, ship_length, bearing,
+                                    ST_Project(ship_geom::geography, ship_width * 0.5, bearing - (Pi() * 0.5)) AS port_side,
+                                    ST_Project(ship_geom::geography, ship_width * 0.5, bearing + (Pi() * 0.5)) AS starboard_side
+                                FROM fleet
+                                {whereClause}
+                            ) AS sides
+                        ) AS corners
+                        ) AS shapes
+                        WHERE ship_shapes.ship_id = shapes.ship_id;
                 """
 
             cur.execute(sql)
@@ -662,6 +736,17 @@ def moveFleet(targetFleetNumber, targetDistance):
     Ex. 
      http://localhost:8081/moveFleet/0/20
     """
+    # Handle in memory if the fleet state store is enabled
+    if fleetState != None:
+        try:
+            if not fleetState.moveFleet(targetFleetNumber, targetDistance):
+                return "Error: Distance must be within minimum fleet max travel range."
+            return "Fleet moved successfully."
+        except:
+            if(simulationDebugLevel > 1):
+                print ("Invalid fleet or inputs.")
+            return "Host database configuration error or invalid inputs."
+
     try:
         with DatabaseCursor(confPath) as cur:
             # Find max distance of fleet's slowest ship.
@@ -704,7 +789,7 @@ def moveFleet(targetFleetNumber, targetDistance):
 
             cur.execute(sql)
 
-        updateShipShapes()
+        updateShipShapes(fleetNums = [targetFleetNumber])
 
         return "Fleet moved successfully."
 
@@ -728,20 +813,38 @@ def moveShip(targetShipNumber, targetDistance):
     Ex.
      http://localhost:8081/moveShip/[0,1,2,3]/[20,20,15,20]
     """
-    # Go ahead and handle multiple ships recursively
+    # Go ahead and handle multiple ships as one batch
     # if lists of ships were passed in.
     try:
         if type(targetShipNumber) == str and '[' in targetShipNumber:
             tempShips = json.loads(targetShipNumber)
             tempDistances = json.loads(targetDistance)
-            for index in range(0, len(tempShips)):
-                moveShip(tempShips[index], tempDistances[index])
+            batchResult = runCommandBatch([{"command": "moveShip", "ship": tempShips[index], 
+                "distance": tempDistances[index]} for index in range(0, len(tempShips))])
+            if not batchResult["accepted"]:
+                return batchResult
             return "Multiple ships moved successfully." 
     except:
         if(simulationDebugLevel > 0):
             print ("Error: Invalid command format or configuration.")
         return "Error: Invalid command format or configuration."
 
+    # Handle in memory if the fleet state store is enabled
+    if fleetState != None:
+        try:
+            newId = fleetState.splitShip(targetShipNumber, targetDistance,
+                distance=targetDistance)
+            if newId == None:
+                return "Error: Distance must be within ship max travel range."
+            result = moveFleet(newId, targetDistance)
+            if result != "Fleet moved successfully.":
+                return result
+            return "Ship moved successfully."
+        except:
+            if(simulationDebugLevel > 0):
+                print ("Invalid ship or inputs.")
+            return "Host database configuration error or invalid inputs."
+
     try:
         with DatabaseCursor(confPath) as cur:
             # Ensure this is a valid move
@@ -810,6 +913,17 @@ def rotateFleet(targetFleetNumber, targetAngleDelta):
     Ex. 
      http://localhost:8081/rotateFleet/0/20
     """
+    # Handle in memory if the fleet state store is enabled
+    if fleetState != None:
+        try:
+            if not fleetState.rotateFleet(targetFleetNumber, targetAngleDelta):
+                return "Error: Distance must be within minimum fleet max rotation range."
+            return "Fleet rotated successfully."
+        except:
+            if(simulationDebugLevel > 1):
+                print ("Invalid fleet or inputs.")
+            return "Host database configuration error or invalid inputs."
+
     try:
         with DatabaseCursor(confPath) as cur:
             # Find max angle of fleet's slowest turning ship.
@@ -846,7 +960,7 @@ def rotateFleet(targetFleetNumber, targetAngleDelta):
 
             cur.execute(sql)
 
-        updateShipShapes()
+        updateShipShapes(fleetNums = [targetFleetNumber])
 
         return "Fleet rotated successfully."
 
@@ -871,20 +985,37 @@ def rotateShip(targetShipNumber, targetAngleDelta):
      http://localhost:8081/rotateShip/[0,1,2,3]/[20,20,15,20]
     """
 
-    # Go ahead and handle multiple ships recursively
+    # Go ahead and handle multiple ships as one batch
     # if lists of ships were passed in.
     try:
         if type(targetShipNumber) == str and '[' in targetShipNumber:
             tempShips = json.loads(targetShipNumber)
             tempDeltas = json.loads(targetAngleDelta)
-            for index in range(0, len(tempShips)):
-                rotateShip(tempShips[index], tempDeltas[index])
+            batchResult = runCommandBatch([{"command": "rotateShip", "ship": tempShips[index], 
+                "angle": tempDeltas[index]} for index in range(0, len(tempShips))])
+            if not batchResult["accepted"]:
+                return batchResult
             return "Multiple ships rotated successfully." 
     except:
         if(simulationDebugLevel > 0):
             print ("Error: Invalid command format or configuration.")
         return "Error: Invalid command format or configuration."
 
+    # Handle in memory if the fleet state store is enabled
+    if fleetState != None:
+        try:
+            newId = fleetState.splitShip(targetShipNumber, angleDelta=targetAngleDelta)
+            if newId == None:
+                return "Error: Distance must be within minimum fleet max travel range."
+            result = rotateFleet(newId, targetAngleDelta)
+            if result != "Fleet rotated successfully.":
+                return result
+            return "Ship rotated successfully."
+        except:
+            if(simulationDebugLevel > 1):
+                print ("Invalid ship or inputs.")
+            return "Host database configuration error or invalid inputs."
+
     try:
         with DatabaseCursor(confPath) as cur:
             # Ensure this is a valid rotation
@@ -957,21 +1088,35 @@ def rotateShipGuns(targetShipNumber, targetAngleDelta, targetElevationDelta):
      http://localhost:8081/rotateShipGuns/[0,1,2,3]/[20,20,15,20]/[20,20,15,20]
     """
 
-    # Go ahead and handle multiple ships recursively
+    # Go ahead and handle multiple ships as one batch
     # if lists of ships were passed in.
     try:
         if type(targetShipNumber) == str and '[' in targetShipNumber:
             tempShips = json.loads(targetShipNumber)
             tempAngleDeltas = json.loads(targetAngleDelta)
             tempElevationDeltas = json.loads(targetElevationDelta)
-            for index in range(0, len(tempShips)):
-                rotateShipGuns(tempShips[index], tempAngleDeltas[index], tempElevationDeltas[index])
+            batchResult = runCommandBatch([{"command": "rotateShipGuns", "ship": tempShips[index], 
+                "angle": tempAngleDeltas[index], "elevation": tempElevationDeltas[index]} 
+                for index in range(0, len(tempShips))])
+            if not batchResult["accepted"]:
+                return batchResult
             return "Multiple ships' guns rotated successfully." 
     except:
         if(simulationDebugLevel > 0):
             print ("Error: Invalid command format or configuration.")
         return "Error: Invalid command format or configuration."
 
+    # Handle in memory if the fleet state store is enabled
+    if fleetState != None:
+        try:
+            if not fleetState.rotateShipGuns(targetShipNumber, targetAngleDelta, targetElevationDelta):
+                return "Error: Invalid ship or no guns on ship."
+            return "Ship guns rotated successfully."
+        except:
+            if(simulationDebugLevel > 1):
+                print ("Invalid ship or inputs.")
+            return "Host database configuration error or invalid inputs."
+
     armamentList = []
 
     try:
@@ -1047,7 +1192,8 @@ def sendCommandBroadcastFrom(inMessage, inCommandType = ""):
 
     # Generate message
     team = creds["user"]
-    commsSender = CommsSender(**creds)
+    commsPublisher = getCommsPublisher(batchWindow = commsBatchWindow, 
+        confirmDelivery = commsConfirmDelivery, **creds)
     broadcastMessage = creds['user'] + "." + inCommandType + " ~ " + str(inMessage)
     broadcastMessage = broadcastMessage.replace('\'', '"')
     print(broadcastMessage)
@@ -1055,9 +1201,24 @@ def sendCommandBroadcastFrom(inMessage, inCommandType = ""):
     if(simulationDebugLevel > 1):
         print(f"{cmd['msgAction']} at/to {cmd['targetName']}")
 
-    # Convert JSON to string and send
-    commsSender.sendCommand(cmd["cmd"], json.dumps(cmd["data"]))
-    commsSender.closeConnection()
+    # Convert JSON to string and send. The connection stays open
+    # for the next broadcast.
+    commsPublisher.sendCommand(cmd["cmd"], json.dumps(cmd["data"]))
+
+
+def broadcastShot(broadcastDict):
+    """
+    broadcastShot
+    Broadcasts a shot that has already been accounted for.
+    """
+    try:
+        broadcastCommand = str(broadcastDict)
+        sendCommandBroadcastFrom(broadcastCommand, "fire")
+        return ("Shot firing accounted for.")
+    except:
+        if simulationDebugLevel > 0:
+            print("Error broadcasting shot.")
+        return ("Shot firing accounted for but error broadcasting shot.")
 
 
 @app.get("/fireGunNowShip/{targetShipNumber}/{gunNumber}")
@@ -1077,24 +1238,42 @@ def fireGunNowShip(targetShipNumber, gunNumber):
     broadcastCommand = ""
     broadcastDict = {}
 
-    # Go ahead and handle multiple ships recursively
+    # Go ahead and handle multiple ships as one batch
     # if lists of ships were passed in.
     try:
         if type(targetShipNumber) == str and '[' in targetShipNumber:
             tempShips = json.loads(targetShipNumber)
             tempGuns = json.loads(gunNumber)
+            batchCommandList = []
             for index in range(0, len(tempShips)):
-                if(type(tempGuns[index]) == 'list'):
+                if isinstance(tempGuns[index], list):
                     for inIndex in range(0, len(tempGuns[index])):
-                        fireGunNowShip(tempShips[index], tempGuns[index][inIndex])
+                        batchCommandList.append({"command": "fireGun", 
+                            "ship": tempShips[index], "gun": tempGuns[index][inIndex]})
                 else:
-                        fireGunNowShip(tempShips[index], tempGuns[index])
+                    batchCommandList.append({"command": "fireGun", 
+                        "ship": tempShips[index], "gun": tempGuns[index]})
+            batchResult = runCommandBatch(batchCommandList)
+            if not batchResult["accepted"]:
+                return batchResult
             return "Multiple ships' guns fired successfully." 
     except:
         if(simulationDebugLevel > 0):
             print ("Error: Invalid command format or configuration.")
         return "Error: Invalid command format or configuration."
 
+    # Handle in memory if the fleet state store is enabled
+    if fleetState != None:
+        try:
+            broadcastDict, errorMessage = fleetState.fireGun(targetShipNumber, gunNumber, 100000)
+            if errorMessage != None:
+                return errorMessage
+        except:
+            if(simulationDebugLevel > 1):
+                print ("Invalid ship or inputs.")
+            return "Host database configuration error or invalid inputs."
+        return broadcastShot(broadcastDict)
+
     # Handle accounting for ship munitions and sanity checks for shots.
     # Also grab some info for the broadcast command.
     try:
@@ -1181,14 +1360,7 @@ def fireGunNowShip(targetShipNumber, gunNumber):
         return "Host database configuration error or invalid inputs."
 
     # Broadcast shot
-    try:
-        broadcastCommand = str(broadcastDict)
-        sendCommandBroadcastFrom(broadcastCommand, "fire")
-        return ("Shot firing accounted for.")
-    except:
-        if simulationDebugLevel > 0:
-            print("Error broadcasting shot.")
-        return ("Shot firing accounted for but error broadcasting shot.")
+    return broadcastShot(broadcastDict)
 
 @app.get("/fireGun/{targetShipNumber}/{gunNumber}/{targetX}/{targetY}")
 def fireGun(targetShipNumber, gunNumber, targetX, targetY):
@@ -1205,6 +1377,18 @@ def fireGun(targetShipNumber, gunNumber, targetX, targetY):
     # Don't know how to calculate max range yet.
     maxRange = 100000
 
+    # Handle in memory if the fleet state store is enabled
+    if fleetState != None:
+        try:
+            broadcastDict, errorMessage = fleetState.fireGunAt(targetShipNumber, gunNumber, targetX, targetY, maxRange)
+            if errorMessage != None:
+                return errorMessage
+        except:
+            if(simulationDebugLevel > 1):
+                print ("Invalid ship or inputs.")
+            return "Host database configuration error or invalid inputs."
+        return broadcastShot(broadcastDict)
+
     # Handle accounting for ship munitions and sanity checks for shots.
     # Also grab some info for the broadcast command.
     try:
@@ -1294,14 +1478,417 @@ def fireGun(targetShipNumber, gunNumber, targetX, targetY):
         return "Host database configuration error or invalid inputs."
 
     # Broadcast shot
+    return broadcastShot(broadcastDict)
+
+# Fields each batch command type needs besides "ship" or "fleet".
+batchCommandFields = \
+    {
+        "moveShip": ["distance"],
+        "rotateShip": ["angle"],
+        "moveFleet": ["distance"],
+        "rotateFleet": ["angle"],
+        "rotateShipGuns": ["angle", "elevation"],
+        "fireGun": ["gun"]
+    }
+
+def validateCommandBatch(commands, shipDict):
+    """
+    validateCommandBatch
+    Checks every command in a batch against the current fleet
+    before anything is changed. Returns a list holding an error
+    message, or None, for each command.
+    Parameters:   commands: List of command dictionaries.
+                  shipDict: ship_id -> dictionary of fleet_num,
+                            speed, turn_radius and armament.
+    """
+    errors = []
+    movedShips = set()
+    rotatedShips = set()
+    movedFleets = set()
+    rotatedFleets = set()
+
+    for command in commands:
+        error = None
+        try:
+            commandType = command["command"]
+            if commandType not in batchCommandFields:
+                raise ValueError("Unknown command type.")
+            for field in batchCommandFields[commandType]:
+                float(command[field])
+
+            if commandType in ["moveFleet", "rotateFleet"]:
+                fleetNum = int(command["fleet"])
+                fleetShips = [ship for ship in shipDict.values() if ship["fleet_num"] == fleetNum]
+                if len(fleetShips) == 0:
+                    raise ValueError("Invalid fleet.")
+
+                if commandType == "moveFleet":
+                    if fleetNum in movedFleets:
+                        raise ValueError("Fleet already moved in this batch.")
+                    if min(ship["speed"] for ship in fleetShips) < abs(float(command["distance"])):
+                        raise ValueError("Distance must be within minimum fleet max travel range.")
+                    movedFleets.add(fleetNum)
+                else:
+                    if fleetNum in rotatedFleets:
+                        raise ValueError("Fleet already rotated in this batch.")
+                    if min(ship["turn_radius"] for ship in fleetShips) < abs(float(command["angle"])):
+                        raise ValueError("Distance must be within minimum fleet max rotation range.")
+                    rotatedFleets.add(fleetNum)
+            else:
+                shipId = int(command["ship"])
+                if shipId not in shipDict:
+                    raise ValueError("Invalid ship.")
+                ship = shipDict[shipId]
+
+                if commandType == "moveShip":
+                    if shipId in movedShips:
+                        raise ValueError("Ship already moved in this batch.")
+                    if ship["speed"] < abs(float(command["distance"])):
+                        raise ValueError("Distance must be within ship max travel range.")
+                    movedShips.add(shipId)
+                elif commandType == "rotateShip":
+                    if shipId in rotatedShips:
+                        raise ValueError("Ship already rotated in this batch.")
+                    if ship["turn_radius"] < abs(float(command["angle"])):
+                        raise ValueError("Distance must be within minimum fleet max travel range.")
+                    rotatedShips.add(shipId)
+                elif commandType == "rotateShipGuns":
+                    if ship["armament"] == None or len(ship["armament"]) == 0:
+                        raise ValueError("Invalid ship or no guns on ship.")
+                else:
+                    gunIndex = int(command["gun"])
+                    if ship["armament"] == None or gunIndex < 0 or gunIndex >= len(ship["armament"]):
+                        raise ValueError("Invalid gun.")
+                    if float(ship["armament"][gunIndex]['gun']['ammo'][0]['count']) <= 0:
+                        raise ValueError("Invalid weapon or insufficient ammo.")
+        except ValueError as exception:
+            error = "Error: " + str(exception)
+        except:
+            error = "Error: Invalid command format."
+        errors.append(error)
+
+    # A ship given its own orders is split off, so it can't
+    # also be ordered around with its old fleet.
+    splitShips = movedShips | rotatedShips
+    for index in range(0, len(commands)):
+        if errors[index] == None and commands[index]["command"] in ["moveFleet", "rotateFleet"]:
+            fleetNum = int(commands[index]["fleet"])
+            if any(shipDict[shipId]["fleet_num"] == fleetNum for shipId in splitShips):
+                errors[index] = "Error: Fleet has a ship given its own orders in this batch."
+
+    return errors
+
+def fleetStateShipDict():
+    """
+    fleetStateShipDict
+    Builds the ship dictionary used for batch validation
+    from the in memory fleet state.
+    """
+    shipDict = {}
+    for index in range(0, len(fleetState.shipIds)):
+        shipDict[int(fleetState.shipIds[index])] = \
+            {
+                "fleet_num": int(fleetState.fleetNums[index]),
+                "speed": float(fleetState.speed[index]),
+                "turn_radius": float(fleetState.turnRadius[index]),
+                "armament": fleetState.armament[index]
+            }
+    return shipDict
+
+def runCommandBatchFleetState(commands):
+    """
+    runCommandBatchFleetState
+    Validates a batch against the in memory fleet state and
+    then carries it out there, in the same order and all or
+    nothing like the database batch. The fleet state is locked
+    throughout so nothing changes between the two.
+    """
+    # Don't know how to calculate max range yet.
+    maxRange = 100000
+    with fleetState.lock:
+        errors = validateCommandBatch(commands, fleetStateShipDict())
+        if any(error != None for error in errors):
+            return {"accepted": False, "results": errors}
+        results = fleetState.runBatch(commands, maxRange)
+
+    # Broadcast shots only after the whole batch has been applied
+    for index in range(0, len(commands)):
+        if isinstance(results[index], dict):
+            results[index] = broadcastShot(results[index])
+    return {"accepted": True, "results": results}
+
+def runCommandBatch(commands):
+    """
+    runCommandBatch
+    Validates and then carries out a list of move, rotate, gun
+    rotation and firing commands in a single transaction.
+    Nothing is changed unless every command is valid. Ships
+    given their own orders are split off first, then fleets
+    are rotated, then moved, then guns are turned and fired.
+    Ship shapes are rebuilt once at the end.
+    Returns a dictionary with a result for every command.
+    """
+    if fleetState != None:
+        return runCommandBatchFleetState(commands)
+
+    # Don't know how to calculate max range yet.
+    maxRange = 100000
+    results = [None] * len(commands)
+    shots = []
+
+    with DatabaseCursor(confPath) as cur:
+        # Grab everything needed to validate the whole batch at once
+        sql = \
+            f"""
+                SELECT ship_id, fleet_num, speed, turn_radius, armament FROM fleet;
+            """
+
+        cur.execute(sql)
+        shipDict = {}
+        for row in cur.fetchall():
+            shipDict[int(row[0])] = \
+                {
+                    "fleet_num": int(row[1]),
+                    "speed": float(row[2]),
+                    "turn_radius": float(row[3]),
+                    "armament": row[4]
+                }
+
+        errors = validateCommandBatch(commands, shipDict)
+        if any(error != None for error in errors):
+            return {"accepted": False, "results": errors}
+
+        sql = \
+            f"""
+                SELECT MAX(fleet_num) FROM fleet_template LIMIT 1;
+            """
+
+        cur.execute(sql)
+        newId = int(cur.fetchone()[0]) + 1
+
+        # Give every ship with its own orders a new fleet, then
+        # treat those orders like fleet orders.
+        splitFleets = {}
+        splitSpeeds = {}
+        fleetMoves = {}
+        fleetTurns = {}
+        for index in range(0, len(commands)):
+            command = commands[index]
+            commandType = command["command"]
+            if commandType in ["moveShip", "rotateShip"]:
+                shipId = int(command["ship"])
+                if shipId not in splitFleets:
+                    splitFleets[shipId] = newId
+                    splitSpeeds[shipId] = 0
+                    newId += 1
+                if commandType == "moveShip":
+                    splitSpeeds[shipId] = float(command["distance"])
+                    fleetMoves[splitFleets[shipId]] = float(command["distance"])
+                    results[index] = "Ship moved successfully."
+                else:
+                    fleetTurns[splitFleets[shipId]] = float(command["angle"])
+                    results[index] = "Ship rotated successfully."
+            elif commandType == "moveFleet":
+                fleetMoves[int(command["fleet"])] = float(command["distance"])
+                results[index] = "Fleet moved successfully."
+            elif commandType == "rotateFleet":
+                fleetTurns[int(command["fleet"])] = float(command["angle"])
+                results[index] = "Fleet rotated successfully."
+
+        if len(splitFleets) > 0:
+            splitValues = ", ".join(
+                cur.mogrify("(%s, %s, %s)", (shipId, splitFleets[shipId], splitSpeeds[shipId])).decode()
+                for shipId in splitFleets)
+            sql = \
+                f"""
+                    UPDATE fleet 
+                        SET fleet_num = split.fleet_num
+                        FROM (VALUES {splitValues}) AS split (ship_id, fleet_num, speed)
+                        WHERE fleet.ship_id = split.ship_id;
+
+                    UPDATE fleet_template 
+                        SET fleet_num = split.fleet_num
+                        FROM (VALUES {splitValues}) AS split (ship_id, fleet_num, speed)
+                        WHERE fleet_template.ship_id = split.ship_id;
+
+                    INSERT INTO fleet_overview
+                        (fleet_num, fleet_reference_point, bearing, speed)
+                        SELECT split.fleet_num, fleet.ship_geom, fleet.bearing, split.speed
+                        FROM fleet 
+                        JOIN (VALUES {splitValues}) AS split (ship_id, fleet_num, speed)
+                            ON fleet.ship_id = split.ship_id;
+                """
+
+            cur.execute(sql)
+
+        if len(fleetTurns) > 0:
+            turnValues = ", ".join(
+                cur.mogrify("(%s, %s)", (fleetNum, fleetTurns[fleetNum])).decode()
+                for fleetNum in fleetTurns)
+            sql = \
+                f"""
+                    UPDATE fleet 
+                        SET bearing = ((((bearing * 180 / Pi()) + 
+                            turns.angle + 360)::INTEGER % 360) * Pi() / 180)
+                        FROM (VALUES {turnValues}) AS turns (fleet_num, angle)
+                        WHERE fleet.fleet_num = turns.fleet_num;
+
+                    UPDATE fleet_template 
+                        SET bearing = ((((bearing * 180 / Pi()) + 
+                            turns.angle + 360)::INTEGER % 360) * Pi() / 180)
+                        FROM (VALUES {turnValues}) AS turns (fleet_num, angle)
+                        WHERE fleet_template.fleet_num = turns.fleet_num;
+
+                    UPDATE fleet_overview 
+                        SET bearing = ((((bearing * 180 / Pi()) + 
+                            turns.angle + 360)::INTEGER % 360) * Pi() / 180)
+                        FROM (VALUES {turnValues}) AS turns (fleet_num, angle)
+                        WHERE fleet_overview.fleet_num = turns.fleet_num;
+                """
+
+            cur.execute(sql)
+
+        if len(fleetMoves) > 0:
+            moveValues = ", ".join(
+                cur.mogrify("(%s, %s)", (fleetNum, fleetMoves[fleetNum])).decode()
+                for fleetNum in fleetMoves)
+            sql = \
+                f"""
+                    UPDATE fleet 
+                        SET ship_geom = ST_Project(ship_geom::geography, 
+                            moves.distance, fleet.bearing)::geometry(Point, 4326)
+                        FROM (VALUES {moveValues}) AS moves (fleet_num, distance)
+                        WHERE fleet.fleet_num = moves.fleet_num;
+
+                    UPDATE fleet_overview 
+                        SET fleet_reference_point = ST_Project(fleet_reference_point::geography, 
+                                moves.distance, fleet_overview.bearing)::geometry(Point, 4326),
+                            speed = moves.distance
+                        FROM (VALUES {moveValues}) AS moves (fleet_num, distance)
+                        WHERE fleet_overview.fleet_num = moves.fleet_num;
+                """
+
+            cur.execute(sql)
+
+        # Turn and fire guns on the armament lists that were
+        # already fetched, then write every changed list back once.
+        changedArmaments = set()
+        for index in range(0, len(commands)):
+            command = commands[index]
+            if command["command"] == "rotateShipGuns":
+                shipId = int(command["ship"])
+                armamentList = shipDict[shipId]["armament"]
+                for gun in armamentList:
+                    gun['gunAngle'] = (float(gun['gunAngle']) + 
+                        (float(command["angle"]) * pi / 180)) % (pi * 2.0)
+                    gun['gunElevation'] = (float(gun['gunElevation']) + 
+                        (float(command["elevation"]) * pi / 180)) % (pi * 2.0)
+                changedArmaments.add(shipId)
+                results[index] = "Ship guns rotated successfully."
+            elif command["command"] == "fireGun":
+                shipId = int(command["ship"])
+                gunIndex = int(command["gun"])
+                armamentList = shipDict[shipId]["armament"]
+                if armamentList == None or gunIndex < 0 or gunIndex >= len(armamentList):
+                    results[index] = "Invalid gun."
+                    continue
+                gun = armamentList[gunIndex]
+                ammo = gun['gun']['ammo'][0]
+                if float(ammo['count']) <= 0:
+                    results[index] = "Invalid weapon or insufficient ammo."
+                    continue
+
+                # Calculate shots fired in case limited ammo
+                shotsFired = gun['gun']['rof']
+                if float(ammo['count']) <= shotsFired:
+                    shotsFired = ammo['count']
+                ammo['count'] -= shotsFired
+                changedArmaments.add(shipId)
+                shots.append((index, shipId, float(gun['gunAngle']), int(ammo['type']['kg'])))
+
+        if len(changedArmaments) > 0:
+            armamentValues = ", ".join(
+                cur.mogrify("(%s, %s)", (shipId, json.dumps(shipDict[shipId]["armament"]))).decode()
+                for shipId in changedArmaments)
+            sql = \
+                f"""
+                    UPDATE fleet 
+                        SET armament = guns.armament::json
+                        FROM (VALUES {armamentValues}) AS guns (ship_id, armament)
+                        WHERE fleet.ship_id = guns.ship_id;
+
+                    UPDATE fleet_template 
+                        SET armament = guns.armament::json
+                        FROM (VALUES {armamentValues}) AS guns (ship_id, armament)
+                        WHERE fleet_template.ship_id = guns.ship_id;
+                """
+
+            cur.execute(sql)
+
+        # Find where every shot lands now that ships have moved
+        shotTargets = {}
+        if len(shots) > 0:
+            shotValues = ", ".join(
+                cur.mogrify("(%s, %s, %s)", (index, shipId, gunAngle)).decode()
+                for index, shipId, gunAngle, shellSize in shots)
+            sql = \
+                f"""
+                    SELECT shots.command_index, fleet.bearing + shots.gun_angle,
+                        ST_X(ST_Project(ship_geom::geography, {str(maxRange)}, 
+                            fleet.bearing + shots.gun_angle)::geometry(Point, 4326)),
+                        ST_Y(ST_Project(ship_geom::geography, {str(maxRange)}, 
+                            fleet.bearing + shots.gun_angle)::geometry(Point, 4326))
+                    FROM fleet 
+                    JOIN (VALUES {shotValues}) AS shots (command_index, ship_id, gun_angle)
+                        ON fleet.ship_id = shots.ship_id;
+                """
+
+            cur.execute(sql)
+            for row in cur.fetchall():
+                shotTargets[int(row[0])] = row[1:]
+
+    # Rebuild shapes once for every ship that moved or turned
+    changedShips = list(splitFleets.keys()) + \
+        [shipId for shipId in shipDict if shipDict[shipId]["fleet_num"] in fleetMoves or 
+            shipDict[shipId]["fleet_num"] in fleetTurns]
+    if len(changedShips) > 0:
+        updateShipShapes(shipIds = changedShips)
+
+    # Broadcast shots only after the batch has been committed
+    for index, shipId, gunAngle, shellSize in shots:
+        targetBearing, targetX, targetY = shotTargets[index]
+        broadcastDict = {}
+        broadcastDict['lon'] = float(targetX)
+        broadcastDict['lat'] = float(targetY)
+        broadcastDict['angle'] = float(targetBearing) * 180 / pi
+        broadcastDict['kg'] = int(shellSize)
+        results[index] = broadcastShot(broadcastDict)
+
+    return {"accepted": True, "results": results}
+
+@app.post("/batchCommands")
+def batchCommands(commands: list = Body(...)):
+    """
+    batchCommands
+    Runs a list of ship and fleet commands as one batch.
+    Every command is checked before any are carried out, and
+    all of them are applied in a single transaction.
+    Ex. POST http://localhost:8081/batchCommands
+     [
+        {"command": "moveShip", "ship": 0, "distance": 20},
+        {"command": "rotateShip", "ship": 1, "angle": 15},
+        {"command": "moveFleet", "fleet": 2, "distance": 20},
+        {"command": "rotateFleet", "fleet": 2, "angle": -10},
+        {"command": "rotateShipGuns", "ship": 3, "angle": 20, "elevation": 5},
+        {"command": "fireGun", "ship": 3, "gun": 0}
+     ]
+    """
     try:
-        broadcastCommand = str(broadcastDict)
-        sendCommandBroadcastFrom(broadcastCommand, "fire")
-        return ("Shot firing accounted for.")
+        return runCommandBatch(commands)
     except:
-        if simulationDebugLevel > 0:
-            print("Error broadcasting shot.")
-        return ("Shot firing accounted for but error broadcasting shot.")
+        if(simulationDebugLevel > 0):
+            print ("Host database configuration error or invalid inputs.")
+        return "Host database configuration error or invalid inputs."
 
 @app.get("/attackerClockRequest")
 def attackerClockRequest():
@@ -1360,52 +1947,29 @@ def loadRegion():
     if gameType == 'online':
         fleetFileName = 'tempRegion.json'
 
-        # Acquire request credentials
-        credDict = {}
-        try:
-            inFile = open(credentialsPath)
-            credDict = json.load(inFile)
-            inFile.close()
-        except:
-            if(simulationDebugLevel > 1):
-                print("Error reading credentials file.")
-            return "Error reading credentials file."
-
-        # Generate URL for request
-        url = ""
-        try:
-            urlPath = "https://" + str(credDict['config']['host']) + ":" + str(credDict['config']['port'])
-            urlParam = "/get_battle_location/"
-            authString = "?hash=" + str(credDict['config']['hash']) + "&game_id=" + str(gameName)
-
-            url = urlPath + urlParam + authString
-        except:
-            if(simulationDebugLevel > 0):
-                print("Error generating request URL.")
-            return "Error generating request URL."
-
-        # Actually send region details request to game server
+        # Actually send region details request to game server,
+        # unless this game's region was already downloaded
         returnMessage = {}
+        regionParams = {"game_id": str(gameName)}
         try:
-            returnMessage = json.loads(requests.get(url).content)
+            returnMessage = downloadCache.fetch(gameName, "/get_battle_location/", regionParams,
+                lambda: gameServer.getContent("/get_battle_location/", regionParams))
         except:
             if(simulationDebugLevel > 0):
                 print("Error sending request to game server.")
             return "Error sending request to game server."
 
-        # Save json to a temporary file then proceed like normal.
-        # This file should be loaded into the database and never
-        # referenced after this function.
+        # Use the answer directly. A readable copy is only
+        # written, in the background, when debugging.
         try:
             bboxDict = returnMessage['bbox']
             fleetSection = returnMessage['section']
-            tempFleet = json.dumps(returnMessage, indent=3)
-            with open(fleetFileName, "w") as tempFile:
-                tempFile.write(tempFleet)
+            if(simulationDebugLevel > 1):
+                writeLogAsync(fleetFileName, returnMessage)
         except:
             if(simulationDebugLevel > 0):
-                print("Error saving region.")
-            return "Error saving region."
+                print("Error reading region details.")
+            return "Error reading region details."
     else:
         try:
             inFile = open(inFileName)
@@ -1436,13 +2000,11 @@ def loadRegion():
     else:
         index = int((degrees + 11.25) / 22.5)
     direction = cardinalList[index % 16]
+    # The spawn wedge is built as a polygon, so the north wedge
+    # can simply start at a negative angle.
     regionLowAngle = (index * 22.5 - 10.25) * pi / 180
     regionHighAngle = (index * 22.5 + 10.25) * pi / 180
 
-    if(direction == 0):
-        regionLowAngle = 10.25 * pi / 180
-        regionHighAngle = (360 - 10.25) * pi / 180
-
     try:
         with DatabaseCursor(confPath) as cur:
 
@@ -1482,46 +2044,29 @@ def loadRegion():
                         SET bbox_max_spawn = ST_SetSRID(ST_Buffer(ST_Centroid((SELECT bbox_geom FROM bbox LIMIT 1)), 
                             {str(desiredMaxBuffer)} * LEAST({str(east)} - {str(west)}, {str(north)} - {str(south)})), 4326);
 
+                """
+            cur.execute(sql)
+
+            # Sample the spawn point straight from the valid spawn area
+            # instead of retrying random points across the whole box.
+            newX, newY = placeFleets(cur, regionLowAngle, regionHighAngle)[0]
+            randNum = random.random()
 
-                    DO $$
-                    DECLARE rand_num float := random();
-                    DECLARE count INTEGER := 1;
-                    DECLARE new_x FLOAT := 0;
-                    DECLARE new_y FLOAT := 0;
-                    DECLARE rand_point geometry;
-                    BEGIN
-                    WHILE (count < 10001) LOOP
-                        rand_point := (ST_SetSRID(ST_GeometryN(ST_GeneratePoints((SELECT bbox_geom FROM bbox LIMIT 1), 1), 1), 4326));
-
-                        IF 	ST_Intersects(rand_point, (SELECT bbox_max_spawn FROM bbox LIMIT 1))
-                        THEN
-                            IF NOT ST_Intersects(rand_point, (SELECT bbox_min_spawn FROM bbox LIMIT 1))
-                            THEN
-                                IF (ST_Azimuth(ST_SetSRID(ST_Centroid((SELECT bbox_geom FROM bbox LIMIT 1)), 4326), rand_point) > {str(regionLowAngle)}) 
-                                AND (ST_Azimuth(ST_SetSRID(ST_Centroid((SELECT bbox_geom FROM bbox LIMIT 1)), 4326), rand_point) < {str(regionHighAngle)})
-                                THEN
-                                    new_x := ST_X(rand_point);
-                                    new_y := ST_Y(rand_point);
-                                    count := 10002;
-                                END IF;
-                            END IF;
-                        END IF;
-                        count := count + 1;
-                    END LOOP;
+            sql = \
+                f"""
                     INSERT INTO fleet SELECT 
                                     ship_id, category, shipclass, displacement, ship_length, ship_width, torpedolaunchers,
                                     armament, armor, speed, turn_radius,
-                                    ST_Translate(ST_Rotate(ship_geom, 2 * Pi() * rand_num, ST_SetSRID(ST_MakePoint(0,0), 4326)
-                                    ), new_x, new_y)::geometry(Point, 4326),
+                                    ST_Translate(ST_Rotate(ship_geom, 2 * Pi() * {str(randNum)}, ST_SetSRID(ST_MakePoint(0,0), 4326)
+                                    ), {str(newX)}, {str(newY)})::geometry(Point, 4326),
                                     bearing, fleet_num 
                                     FROM fleet_template;
                     INSERT INTO fleet_overview (fleet_num, fleet_reference_point, bearing, speed) 
-	                    VALUES (0, ST_SetSRID(ST_MakePoint(new_x, new_y), 4326), 2 * Pi() * rand_num, 0);
-                    UPDATE fleet SET bearing = rand_num;
+                        VALUES (0, ST_SetSRID(ST_MakePoint({str(newX)}, {str(newY)}), 4326), 2 * Pi() * {str(randNum)}, 0);
+                    UPDATE fleet SET bearing = {str(randNum)};
                     INSERT INTO ship_shapes (ship_id) SELECT 
                         ship_id
                         FROM fleet_template;
-                    END$$;
                 """
             cur.execute(sql)
 
@@ -1541,7 +2086,6 @@ def loadFleetJSON():
      http://localhost:8081/loadFleetJSON
     """
     # Create variables with proper scope to store infile info
-    fleetList = []
     fleetFileName = "ships.json"
     #fleetFileName = 'jsontest.json'
     # Select persistent first attacker address to query
@@ -1550,245 +2094,294 @@ def loadFleetJSON():
     #url = "http://" + attackerIPs[0] + "/REGISTER"
     #fleetDict = json.loads(requests.get(url).content)
 
+    fleetShips = None
     if gameType == 'online':
         fleetFileName = 'tempShips.json'
 
-        # Acquire request credentials
-        credDict = {}
-        try:
-            inFile = open(credentialsPath)
-            credDict = json.load(inFile)
-            inFile.close()
-        except:
-            if(simulationDebugLevel > 0):
-                print("Error reading credentials file.")
-            return "Error reading credentials file."
-
-        # Generate URL for request
-        url = ""
-        try:
-            urlPath = "https://" + str(credDict['config']['host']) + ":" + str(credDict['config']['port'])
-
-            # Normal String
-            #urlParam = "/generate_fleet"
-            #authString = "?fleetName=" + str(credDict['config']['user']) + "&hash=" + str(credDict['config']['hash'])
+        # Normal request
+        #fleetPath, fleetParams = "/generate_fleet", {"fleetName": str(gameServer.credentials()['user'])}
 
-            # Test String
-            urlParam = "/example_fleet"
-            authString = "?hash=" + str(credDict['config']['hash'])
+        # Test request
+        fleetPath, fleetParams = "/example_fleet", None
 
-            url = urlPath + urlParam + authString
-        except:
-            if(simulationDebugLevel > 0):
-                print("Error generating request URL.")
-            return "Error generating request URL."
-
-        # Actually send fleet details request to game server
-        returnMessage = {}
+        # Actually send fleet details request to game server,
+        # unless this game's fleet was already downloaded. A
+        # readable copy is only written, in the background, when
+        # debugging.
         try:
-            returnMessage = json.loads(requests.get(url).content)
-        except:
-            if(simulationDebugLevel > 0):
-                print("Error sending request to game server.")
-            return "Error sending request to game server."
-
-        # Save json to a temporary file then proceed like normal.
-        # This file should be loaded into the database and never
-        # referenced after this function.
-        try:
-            tempFleet = json.dumps(returnMessage, indent=3)
-            with open(fleetFileName, "w") as tempFile:
-                tempFile.write(tempFleet)
+            fleetShips = downloadCache.fetch(gameName, fleetPath, fleetParams,
+                lambda: gameServer.getContent(fleetPath, fleetParams))
+            if(simulationDebugLevel > 1):
+                writeLogAsync(fleetFileName, fleetShips)
         except:
             if(simulationDebugLevel > 0):
-                print("Error saving temporary fleet file.")
-            return "Error saving temporary fleet file."
+                print("Error sending request to game server or saving temporary fleet file.")
+            return "Error sending request to game server or saving temporary fleet file."
 
     # Configure desired number of columns for fleet
     numCols = 10
 
+    # Ships are read from the file as they are inserted, a page
+    # at a time, all in one transaction. Downloaded fleets are
+    # already parsed.
     try:
-        inFile = open(fleetFileName)
-        fleetList = json.load(inFile)
-        inFile.close()
-    except:
+        with DatabaseCursor(confPath) as cur:
+            # Don't keep half a fleet if the file is bad
+            try:
+                if fleetShips != None:
+                    shipCount = loadFleet(cur, fleetShips, numCols)
+                else:
+                    shipCount = loadFleetFile(cur, fleetFileName, numCols)
+            except:
+                cur.connection.rollback()
+                raise
+        if(simulationDebugLevel > 1):
+            print("Ships loaded: " + str(shipCount))
+    except (OSError, ValueError, KeyError):
         if(simulationDebugLevel > 0):
             print("Error reading fleet file.")
         return "Error reading fleet file."
-
-    try:
-        for index in range(0, len(fleetList)):
-            with DatabaseCursor(confPath) as cur:
-                # Add default gun angles to JSON
-                if(fleetList[index]['armament'] != None):
-                    for inIndex in range(0, len(fleetList[index]['armament'])):
-                        fleetList[index]['armament'][inIndex]['gunAngle'] = 0
-                        fleetList[index]['armament'][inIndex]['gunElevation'] = 0
-
-                # Clean up JSON formatting string for postgres
-                armamentString = ""
-                if(fleetList[index]['armament'] == None):
-                    armamentString = "null"
-                else:
-                    armamentString = str(fleetList[index]['armament'])
-                    armamentString = armamentString.replace('\'', '"')
-                    armamentString = armamentString.replace('None', 'null')
-                if(fleetList[index]['torpedoLaunchers'] == None):
-                    torpedoString = "null"
-                else:
-                    torpedoString = str(fleetList[index]['torpedoLaunchers'])
-                    torpedoString = torpedoString.replace('\'', '"')
-                    torpedoString = torpedoString.replace('None', 'null')
-                armorString = str(fleetList[index]['armor']).replace('\'', '"')
-                armorString = armorString.replace('None', 'null')
-
-                # Construct insertion query for this ship
-                sql = \
-                    f"""
-                        INSERT INTO public.fleet_template 
-                        (
-                            ship_id, category, shipclass, displacement, ship_length, 
-                            ship_width, torpedolaunchers, armament, armor, speed, 
-                            turn_radius, ship_geom, ship_col, ship_row, fleet_num, bearing
-                        ) 
-                        VALUES 
-                        (
-                            {str(fleetList[index]['id'])}, '{str(fleetList[index]['category'])}', 
-                            '{str(fleetList[index]['shipClass'])}', 0, {str(fleetList[index]['length'])}, 
-                            {str(fleetList[index]['width'])}, '{torpedoString}', '{armamentString}', '{armorString}', 
-                            {str(fleetList[index]['speed'])}, {str(fleetList[index]['turn_radius'])}, 
-                            ST_SetSRID(ST_MakePoint(0, 0),4326), {str(int(index % numCols))}, {str(int(index / numCols))}, 
-                            0, 0
-                        );
-                    """
-                cur.execute(sql)
-
-        # Calculate and update fleet template positions
-        with DatabaseCursor(confPath) as cur:
-            sql = \
-                f"""
-                    /* Handle staggered rows */
-                        UPDATE fleet_template 
-                            SET ship_geom = ST_Project(matching_row.ship_geom::geography, 222 * matching_row.ship_row, Pi()
-                            )::geometry(Point, 4326)
-                                FROM (SELECT ship_geom, ship_col, ship_row, ship_id FROM fleet_template) AS matching_row
-                                WHERE (matching_row.ship_col % 3) = 0 AND fleet_template.ship_id = matching_row.ship_id;
-
-                        UPDATE fleet_template 
-                            SET ship_geom = ST_Project(matching_row.ship_geom::geography, 111 * matching_row.ship_col, (0.5 * Pi())
-                            )::geometry(Point, 4326)
-                                FROM (SELECT ship_geom, ship_col, ship_row, ship_id FROM fleet_template) AS matching_row
-                                WHERE fleet_template.ship_id = matching_row.ship_id;
-                                
-                        UPDATE fleet_template 
-                            SET ship_geom = ST_Project(matching_row.ship_geom::geography, (222 * matching_row.ship_row) + 111, Pi()
-                            )::geometry(Point, 4326)
-                                FROM (SELECT ship_geom, ship_col, ship_row, ship_id FROM fleet_template) AS matching_row
-                                WHERE (matching_row.ship_col % 3) != 0 AND fleet_template.ship_id = matching_row.ship_id;
-                """
-            cur.execute(sql)
-
     except:
         if(simulationDebugLevel > 0):
             print("Host database configuration error or invalid column field.")
         return ("Host database configuration error or invalid column field.")
-        
+
+def getFleetVersion():
+    """
+    getFleetVersion
+    Returns the current value of the fleet version sequence.
+    """
+    with DatabaseCursor(confPath) as cur:
+        sql = \
+            f"""
+                SELECT last_value FROM fleet_version_seq;
+            """
+        cur.execute(sql)
+        return int(cur.fetchone()[0])
+
+def streamJSONRows(sql, prefix, suffix):
+    """
+    streamJSONRows
+    Generator that runs a query returning one JSON text column
+    through a server-side cursor and yields the rows joined into
+    a JSON array, wrapped in prefix and suffix. The pooled 
+    connection is held only while the response is streaming.
+    """
+    pool = getConnectionPool(confPath)
+    conn = pool.getConnection()
+    try:
+        with conn.cursor(name="json_export") as cur:
+            cur.itersize = 500
+            cur.execute(sql)
+            yield prefix
+            separator = ""
+            for row in cur:
+                yield separator + row[0]
+                separator = ","
+            yield suffix
+        conn.commit()
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        pool.putConnection(conn)
+
+def notModified(request, etag):
+    """
+    notModified
+    Checks whether the client already has this version.
+    """
+    return request != None and request.headers.get("if-none-match") == etag
+
 @app.get("/exportFleetJSON")
-def exportFleetJSON():
+def exportFleetJSON(request: Request = None):
     """
     exportFleetJSON
-    Loads a fleet and returns it as a JSON file.
+    Loads a fleet and returns it as a JSON file. The JSON is built
+    by Postgres and streamed, and an ETag lets repeated polls get
+    a 304 Not Modified until the fleet changes.
      http://localhost:8081/exportFleetJSON
     """
-    # Create variables with proper scope to store return json info
-    returnList = []
-    shipTuple = None
-
     try:
-        with DatabaseCursor(confPath) as cur:
-            sql = \
-                f"""
-                    SELECT 
-                        ship_id, category, shipclass, ship_length, 
-                        ship_width, torpedolaunchers, armament, armor, speed, 
-                        turn_radius, ship_geom::jsonb, displacement, bearing
-                    FROM public.fleet;
-                """
-            cur.execute(sql)
-            shipTuple = cur.fetchall()
-        for index in range(0, len(shipTuple)):
-            returnDict = {}
-            returnDict['id'] = shipTuple[index][0]
-            returnDict['category'] = shipTuple[index][1]
-            returnDict['shipClass'] = shipTuple[index][2]
-            returnDict['length'] = shipTuple[index][3]
-            returnDict['width'] = shipTuple[index][4]
-            returnDict['torpedoLaunchers'] = shipTuple[index][5]
-            returnDict['armament'] = shipTuple[index][6]
-            returnDict['armor'] = shipTuple[index][7]
-            returnDict['speed'] = shipTuple[index][8]
-            returnDict['turn_radius'] = shipTuple[index][9]
-            returnDict['location'] = shipTuple[index][10]
-            returnDict['displacement'] = shipTuple[index][11]
-            returnDict['bearing'] = shipTuple[index][12]
-            returnList.append(returnDict)
-        returnFormatted = json.dumps(str(returnList), indent=3)
-        return returnList
+        # Make sure pending in-memory changes are in the database
+        if fleetState != None:
+            fleetState.flush()
+
+        etag = '"fleet-' + str(getFleetVersion()) + '"'
     except:
         if(simulationDebugLevel > 0):
             print("Host database configuration error or invalid column field.")
         return ("Host database configuration error or invalid column field.")
 
+    if notModified(request, etag):
+        return Response(status_code = 304, headers = {"ETag": etag})
+
+    sql = \
+        f"""
+            SELECT json_build_object(
+                'id', ship_id, 
+                'category', category, 
+                'shipClass', shipclass, 
+                'length', ship_length, 
+                'width', ship_width, 
+                'torpedoLaunchers', torpedolaunchers, 
+                'armament', armament, 
+                'armor', armor, 
+                'speed', speed, 
+                'turn_radius', turn_radius, 
+                'location', ST_AsGeoJSON(ship_geom)::json, 
+                'displacement', displacement, 
+                'bearing', bearing
+            )::text
+            FROM public.fleet;
+        """
+
+    return StreamingResponse(streamJSONRows(sql, "[", "]"), 
+        media_type = "application/json", headers = {"ETag": etag})
+
 @app.get("/exportFleetPositionJSON")
-def exportFleetPositionJSON():
+def exportFleetPositionJSON(request: Request = None):
     """
     exportFleetPositionJSON
     Loads a fleet and returns it as a JSON file 
     containing mostly simplified positional info.
-     http://localhost:8081/loadFleetPositionJSON
+    Streamed and cached with an ETag like exportFleetJSON.
+     http://localhost:8081/exportFleetPositionJSON
     """
-    # Create variables with proper scope to store return json info
-    returnDict = {}
-    returnDict['fleet_id'] = teamname
-    returnList = []
-    shipTuple = None
+    returnTime = int(datetime.datetime.now().timestamp())
+
+    # Serve straight from memory if the fleet state store is enabled
+    if fleetState != None:
+        etag = '"positions-memory-' + fleetState.instanceId + "-" + str(fleetState.version) + '"'
+        if notModified(request, etag):
+            return Response(status_code = 304, headers = {"ETag": etag})
+        return Response(content = json.dumps(fleetState.exportPositions(teamname, returnTime)), 
+            media_type = "application/json", headers = {"ETag": etag})
 
     try:
-        with DatabaseCursor(confPath) as cur:
-            sql = \
-                f"""
-					SELECT
-                        ship_id, bearing, ST_X(ST_Centroid(ship_geom)), ST_Y(ST_Centroid(ship_geom)), 
-						(SELECT speed FROM fleet_overview WHERE fleet_overview.fleet_num = fleet.fleet_num)
-                    FROM public.fleet;
-                """
-            cur.execute(sql)
-            shipTuple = cur.fetchall()
-            
-        returnTime = int(datetime.datetime.fromisoformat(str(datetime.datetime.now())).timestamp())
-        for index in range(0, len(shipTuple)):
-            returnShipDict = {}
-            returnShipDict['ship_id'] = int(shipTuple[index][0])
-            returnShipDict['bearing'] = float(shipTuple[index][1])
-            returnShipDict['location'] = \
-            { \
-                'coords': \
-                { \
-                    'lon': float(shipTuple[index][2]), \
-                    'lat': float(shipTuple[index][3]) \
-                }, \
-                'timeStamp': int(returnTime) \
-            }
-            returnShipDict['speed'] = float(shipTuple[index][4])
-            returnShipDict['hitpoints'] = int(1)
-            returnList.append(returnShipDict)
-        returnDict['ship_status'] = returnList
-        returnFormatted = json.dumps(str(returnDict), indent=3)
-        return returnDict
+        etag = '"positions-' + str(getFleetVersion()) + '"'
+    except:
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error or invalid column field.")
+        return ("Host database configuration error or invalid column field.")
+
+    if notModified(request, etag):
+        return Response(status_code = 304, headers = {"ETag": etag})
+
+    # One join instead of looking up the fleet speed per ship
+    sql = \
+        f"""
+            SELECT json_build_object(
+                'ship_id', fleet.ship_id::integer,
+                'bearing', fleet.bearing::float8,
+                'location', json_build_object(
+                    'coords', json_build_object(
+                        'lon', ST_X(ST_Centroid(fleet.ship_geom)),
+                        'lat', ST_Y(ST_Centroid(fleet.ship_geom))
+                    ),
+                    'timeStamp', {str(returnTime)}
+                ),
+                'speed', COALESCE(fleet_overview.speed, 0)::float8,
+                'hitpoints', 1
+            )::text
+            FROM public.fleet
+            LEFT JOIN public.fleet_overview 
+                ON fleet_overview.fleet_num = fleet.fleet_num;
+        """
+
+    prefix = '{"fleet_id": ' + json.dumps(teamname) + ', "ship_status": ['
+    return StreamingResponse(streamJSONRows(sql, prefix, "]}"), 
+        media_type = "application/json", headers = {"ETag": etag})
+
+@app.get("/exportFleetGeoPackage")
+def exportFleetGeoPackage():
+    """
+    exportFleetGeoPackage
+    Exports the fleet and ship_shapes tables as one GeoPackage 
+    file that can be opened directly in QGIS. Geometry is kept
+    as WKB and rows are copied in batches, so the file is smaller
+    than exportFleetJSON and memory stays flat for large fleets.
+     http://localhost:8081/exportFleetGeoPackage
+    """
+    handle, path = tempfile.mkstemp(suffix = ".gpkg")
+    os.close(handle)
+    # The writer creates the file itself.
+    os.remove(path)
+
+    pool = getConnectionPool(confPath)
+    conn = pool.getConnection()
+    try:
+        # Make sure pending in-memory changes are in the database
+        if fleetState != None:
+            fleetState.flush()
+
+        exportTables(conn, ["public.fleet", "public.ship_shapes"], path)
     except:
+        if not conn.closed:
+            conn.rollback()
+        if os.path.exists(path):
+            os.remove(path)
         if(simulationDebugLevel > 0):
             print("Host database configuration error or invalid column field.")
         return ("Host database configuration error or invalid column field.")
+    finally:
+        pool.putConnection(conn)
+
+    return FileResponse(path, media_type = "application/geopackage+sqlite3",
+        filename = "fleet.gpkg", background = BackgroundTask(os.remove, path))
+
+@app.get("/enableFleetState")
+def enableFleetState():
+    """
+    enableFleetState
+    Loads the fleet into memory so moves, rotations and firing
+    are handled without waiting on the database. Changes are
+    written back in batches in the background.
+     http://localhost:8081/enableFleetState
+    """
+    global fleetState
+    try:
+        if fleetState == None:
+            newState = FleetState(lambda: DatabaseCursor(confPath), 
+                updateShipShapes, fleetStateFlushInterval)
+            newState.load()
+            newState.start()
+            fleetState = newState
+        return "Fleet state store enabled."
+    except:
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error or missing fleet.")
+        return ("Host database configuration error or missing fleet.")
+
+@app.get("/disableFleetState")
+def disableFleetState():
+    """
+    disableFleetState
+    Writes any pending in-memory changes to the database and
+    goes back to handling every command in the database.
+     http://localhost:8081/disableFleetState
+    """
+    global fleetState
+    try:
+        if fleetState != None:
+            fleetState.stop()
+            fleetState = None
+        return "Fleet state store disabled."
+    except:
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error writing fleet state.")
+        return ("Host database configuration error writing fleet state.")
+
+@app.get("/fleetStateStats")
+def fleetStateStats():
+    """
+    fleetStateStats
+    Returns how many ships are waiting to be written and how
+    long the last batch took.
+     http://localhost:8081/fleetStateStats
+    """
+    if fleetState == None:
+        return "Fleet state store is not enabled."
+    return fleetState.getStats()
 
 
 @app.get("/loadPersistentIPs")
@@ -1952,18 +2545,28 @@ async def initializeSimulation():
                 CREATE TABLE IF NOT EXISTS public.ship_shapes 
                 (
                     ship_id numeric,
-                    ship_polygon geometry
+                    ship_polygon geometry,
+                    hit_polygon geometry
                 );
 
                 CREATE INDEX IF NOT EXISTS ship_shape_index
                     ON public.ship_shapes
                     USING GIST (ship_polygon);
+
+                CREATE INDEX IF NOT EXISTS ship_hit_index
+                    ON public.ship_shapes
+                    USING GIST (hit_polygon);
                 """
 
             cur.execute(sql)
+            cur.execute(fleetVersionSQL)
 
         loadFleetJSON()
         loadRegion()
+
+        # Start the in-memory copy over from the new fleet
+        if fleetState != None:
+            fleetState.load()
         
     except:
         if(simulationDebugLevel > 0):
@@ -2253,14 +2856,41 @@ async def createTables():
                     CREATE TABLE IF NOT EXISTS public.ship_shapes 
                     (
                         ship_id numeric,
-                        ship_polygon geometry
+                        ship_polygon geometry,
+                        hit_polygon geometry
                     );
 
+                    ALTER TABLE public.ship_shapes 
+                        ADD COLUMN IF NOT EXISTS hit_polygon geometry;
+
                     CREATE INDEX IF NOT EXISTS ship_shape_index
                         ON public.ship_shapes
                         USING GIST (ship_polygon);
+
+                    CREATE INDEX IF NOT EXISTS ship_hit_index
+                        ON public.ship_shapes
+                        USING GIST (hit_polygon);
                 """
             cur.execute(sql)
+        with DatabaseCursor(confPath) as cur:
+            # Create incoming shots table
+            sql = \
+                f"""
+                    CREATE TABLE IF NOT EXISTS public.incoming_shots 
+                    (
+                        shot_id SERIAL PRIMARY KEY,
+                        routing_key text,
+                        shot_geom geometry(Point, 4326),
+                        angle numeric,
+                        kg numeric,
+                        hit_ship_id numeric,
+                        received_at timestamptz DEFAULT now()
+                    );
+                """
+            cur.execute(sql)
+        with DatabaseCursor(confPath) as cur:
+            # Create fleet version sequence and triggers
+            cur.execute(fleetVersionSQL)
 
         return "Necessary missing tables created."
     except:
@@ -2353,6 +2983,13 @@ async def destroyTables():
                     DROP TABLE public.ship_shapes;
                 """
             cur.execute(sql)
+        with DatabaseCursor(confPath) as cur:
+            # Destroy incoming shots table
+            sql = \
+                f"""
+                    DROP TABLE public.incoming_shots;
+                """
+            cur.execute(sql)
 
         return "Necessary missing tables destroyed."
     except:
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Benchmarks interceptor assignment. Builds made up swarms
+#              of hostile missiles heading over five batteries and
+#              compares checking one missile and one interceptor type at
+#              a time, the way the intercept query ran, with the
+#              InterceptSolver handling the whole swarm at once.
+#
+# Running Instructions:
+# - No database is needed.
+# - Run "python3 benchmark_intercepts.py [swarm sizes...]" in this directory.
+##############################################################################
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from spatialapi import convertSpeedMetersToDegree, metersToDegreesNA
+from module import TrajectoryPredictor, InterceptSolver
+
+# Speed categories and counts like a small attacker supplied arsenal.
+arsenal = {
+    "Patriot": (6, 200),
+    "SeaSparrow": (8, 150),
+    "Javelin": (4, 300),
+    "Hellfire": (3, 350),
+}
+
+simulationTime = 1000.0
+shootBuffer = 3
+
+
+def makeSwarm(threatCount):
+    """
+    makeSwarm
+    Builds solvable missile pings that cross a box of North
+    America from the edges toward the middle while descending.
+    """
+    missiles = []
+    for missileId in range(0, threatCount):
+        startX = random.uniform(-110, -90)
+        startY = random.uniform(30, 45)
+        stepX = random.uniform(-0.05, 0.05)
+        stepY = random.uniform(-0.05, 0.05)
+        altitude = metersToDegreesNA(random.uniform(8000, 12000))
+        missiles.append({
+            "missile_id": missileId,
+            "missile_type": "Atlas",
+            "previous": (startX, startY, altitude, simulationTime - 5),
+            "current": (startX + 5 * stepX, startY + 5 * stepY,
+                altitude - metersToDegreesNA(50), simulationTime),
+        })
+    return missiles
+
+
+def makeBatteries():
+    """
+    makeBatteries
+    Places a center battery and one to each side, like
+    createFiveBatteries.
+    """
+    return np.array([[-100, 37.5, 0], [-100, 45, 0], [-100, 30, 0],
+        [-90, 37.5, 0], [-110, 37.5, 0]], dtype=np.float64)
+
+
+def runPerMissile(trajectories, batteries, interceptors):
+    """
+    runPerMissile
+    Checks each missile against each interceptor type in turn,
+    preferring whichever type has the most left, and searching
+    every predicted point against the closest battery.
+    """
+    remaining = {name: interceptors[name][1] for name in interceptors}
+    assigned = 0
+    for missileIndex in range(0, len(trajectories)):
+        positions = trajectories.positions[missileIndex]
+        for name in sorted(remaining, key=lambda option: remaining[option], reverse=True):
+            if remaining[name] <= 0:
+                continue
+            distances = np.min(np.linalg.norm(positions[:, None, :] - batteries[None, :, :], axis=2), axis=1)
+            usable = (positions[:, 2] >= 0) & \
+                ((trajectories.times - simulationTime - shootBuffer) >= distances / interceptors[name][0])
+            if np.any(usable):
+                remaining[name] -= 1
+                assigned += 1
+                break
+    return assigned
+
+
+def timeRun(label, function):
+    """
+    timeRun
+    Runs a function once and prints the time taken.
+    """
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed * 1000:10.2f} ms  assigned {result}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    sizes = [10, 100, 1000]
+    if len(sys.argv) > 1:
+        sizes = [int(size) for size in sys.argv[1:]]
+
+    random.seed(5443)
+    predictor = TrajectoryPredictor("linear", 1000)
+    solver = InterceptSolver()
+    batteries = makeBatteries()
+    interceptors = {name: (float(convertSpeedMetersToDegree(arsenal[name][0])), arsenal[name][1])
+        for name in arsenal}
+
+    for size in sizes:
+        print(f"Threats: {size}")
+        trajectories = predictor.predict(makeSwarm(size), simulationTime)
+        oldTime = timeRun("One missile and type at once",
+            lambda: runPerMissile(trajectories, batteries, interceptors))
+        newTime = timeRun("InterceptSolver whole swarm",
+            lambda: len(solver.solve(trajectories, batteries, interceptors,
+                simulationTime, shootBuffer, False)))
+        print(f"  Speedup: {oldTime / newTime:6.1f}x")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Benchmarks recording radar sweeps. Builds made up sweeps
+#              of growing size and compares the original one cursor and
+#              several queries per ping approach with RadarSweepIngest.
+#              Each size records two sweeps, one where every missile is
+#              new and one where every missile is seen again.
+#
+# Running Instructions:
+# - Fill out .config.json the same way as for spatialapi.py.
+# - Run "python3 benchmark_radar.py [sizes...]" in this directory.
+# Warning: This empties active_missile_pings and solved_missile_pings.
+##############################################################################
+
+import asyncio
+import random
+import sys
+import time
+
+import spatialapi
+from spatialapi import DatabaseCursor, confPath, metersToDegreesNA
+from module import RadarSweepIngest, convertTimeToSecondsSimple
+
+
+def makeSweep(missileCount, second):
+    """
+    makeSweep
+    Builds a radar sweep feature collection with missileCount
+    missiles over North America at the given second of the day.
+    """
+    features = []
+    for missileId in range(0, missileCount):
+        features.append({
+            "id": missileId,
+            "geometry": {"type": "Point", "coordinates": [
+                random.uniform(-120, -80), random.uniform(30, 48)]},
+            "properties": {
+                "altitude": random.uniform(1000, 9000),
+                "current_time": f"12:00:{second:02d}",
+                "missile_type": "Atlas",
+            },
+        })
+    return features
+
+
+def resetPings():
+    """
+    resetPings
+    Empties both ping tables between runs.
+    """
+    with DatabaseCursor(confPath) as cur:
+        cur.execute("TRUNCATE active_missile_pings, solved_missile_pings;")
+
+
+def runLegacy(features):
+    """
+    runLegacy
+    Records a sweep the original way, with a cursor and a
+    count query or two for every ping.
+    """
+    for feature in features:
+        with DatabaseCursor(confPath) as cur:
+            point = f"""ST_SetSRID(ST_MakePoint({feature['geometry']['coordinates'][0]},
+                {feature['geometry']['coordinates'][1]},
+                {metersToDegreesNA(feature['properties']['altitude'])}), 4326)"""
+            timeCode = convertTimeToSecondsSimple(feature['properties']['current_time'])
+            cur.execute(f"SELECT COUNT(missile_id) FROM solved_missile_pings WHERE missile_id = {feature['id']};")
+            if int(cur.fetchone()[0]) > 0:
+                continue
+            cur.execute(f"SELECT COUNT(missile_id) FROM active_missile_pings WHERE missile_id = {feature['id']};")
+            if int(cur.fetchone()[0]) > 0:
+                cur.execute(f"""
+                    INSERT INTO solved_missile_pings (intersects, time_code, missile_type, missile_id) VALUES
+                        ({point}, {timeCode}, '{feature['properties']['missile_type']}', {feature['id']});
+                    DELETE FROM active_missile_pings WHERE missile_id = {feature['id']};
+                """)
+            else:
+                cur.execute(f"""
+                    INSERT INTO active_missile_pings (intersects, time_code, missile_type, missile_id) VALUES
+                        ({point}, {timeCode}, '{feature['properties']['missile_type']}', {feature['id']});
+                """)
+
+
+def runIngest(radarSweepIngest, features):
+    """
+    runIngest
+    Records a sweep in one transaction and settles every
+    missile that could be planned for.
+    """
+    with DatabaseCursor(confPath) as cur:
+        sweep = radarSweepIngest.ingest(cur, features)
+        radarSweepIngest.settle(cur, [missile['missile_id'] for missile in sweep['solvable']],
+            sweep['timings'])
+    return sweep['timings']
+
+
+def timeSweeps(function):
+    """
+    timeSweeps
+    Records the new sweep and then the repeat sweep, returning
+    the total time taken.
+    """
+    resetPings()
+    start = time.perf_counter()
+    function(0)
+    function(1)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    sizes = [10, 100, 1000, 5000]
+    if len(sys.argv) > 1:
+        sizes = [int(size) for size in sys.argv[1:]]
+
+    spatialapi.simulationDebugLevel = 0
+    asyncio.run(spatialapi.createTables())
+    random.seed(5443)
+    radarSweepIngest = RadarSweepIngest()
+
+    print(f"{'Missiles':>10} {'Original ms':>14} {'Ingest ms':>12} {'Speedup':>9}")
+    for size in sizes:
+        sweeps = [makeSweep(size, 0), makeSweep(size, 5)]
+        oldTime = timeSweeps(lambda sweep: runLegacy(sweeps[sweep]))
+        newTime = timeSweeps(lambda sweep: runIngest(radarSweepIngest, sweeps[sweep]))
+        print(f"{size:>10} {oldTime * 1000:14.2f} {newTime * 1000:12.2f} {oldTime / newTime:8.1f}x")
+
+    print("Average phase seconds:")
+    for phase, seconds in radarSweepIngest.getStats()["averagePhaseSeconds"].items():
+        print(f"  {phase:<10} {seconds * 1000:10.2f} ms")
+    resetPings()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Micro-benchmarks for module/timeconversion.py. Times each
+#              original one string at a time function against its batch
+#              version on made up timestamps, both for radar sweep style
+#              input where many pings share a time and for input where
+#              every time is different. No database is needed.
+#
+# Running Instructions:
+# - Run "python3 benchmark_timeconversion.py [sizes...]" in this directory.
+##############################################################################
+
+import datetime
+import random
+import sys
+import time
+
+from module import convertTimeToSecondsSimple, convertTimeToSecondsNoDate
+from module import convertTimeToSeconds
+from module import convertTimesToSecondsSimple, convertTimesToSecondsNoDate
+from module import convertTimesToSeconds
+
+# Distinct times in a sweep style run.
+sweepTimes = 5
+
+
+def makeTimesOfDay(count, distinct):
+    """
+    makeTimesOfDay
+    Returns count "hour:minute:second" strings drawn from
+    distinct different times.
+    """
+    choices = [f"{random.randint(0, 23)}:{random.randint(0, 59):02d}:{random.randint(0, 59):02d}"
+        for choice in range(0, distinct)]
+    return [random.choice(choices) for time in range(0, count)]
+
+
+def makeDateTimes(count, distinct):
+    """
+    makeDateTimes
+    Returns count "year-month-day hour:minute:second" strings
+    drawn from distinct different times.
+    """
+    start = datetime.datetime(2022, 10, 27)
+    choices = [str(start + datetime.timedelta(seconds=random.uniform(0, 86400 * 30)))
+        for choice in range(0, distinct)]
+    return [random.choice(choices) for time in range(0, count)]
+
+
+def bestTime(function, repeats = 3):
+    """
+    bestTime
+    Returns the fastest of several runs in seconds.
+    """
+    best = None
+    for repeat in range(0, repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+
+if __name__ == "__main__":
+    sizes = [1000, 10000, 100000]
+    if len(sys.argv) > 1:
+        sizes = [int(size) for size in sys.argv[1:]]
+
+    random.seed(5443)
+    cases = [
+        ("Simple", makeTimesOfDay,
+            lambda times: [float(convertTimeToSecondsSimple(inTime)) for inTime in times],
+            convertTimesToSecondsSimple),
+        ("NoDate", makeDateTimes,
+            lambda times: [float(convertTimeToSecondsNoDate(inTime)) for inTime in times],
+            convertTimesToSecondsNoDate),
+        ("Seconds", makeDateTimes,
+            lambda times: [convertTimeToSeconds(inTime) for inTime in times],
+            convertTimesToSeconds),
+    ]
+
+    print(f"{'Function':<9} {'Input':<7} {'Times':>8} {'Original ms':>13} {'Batch ms':>10} {'Speedup':>9}")
+    for name, makeTimes, original, batch in cases:
+        for size in sizes:
+            for label, distinct in [("sweep", sweepTimes), ("unique", size)]:
+                times = makeTimes(size, distinct)
+                oldTime = bestTime(lambda: original(times))
+                newTime = bestTime(lambda: batch(times))
+                print(f"{name:<9} {label:<7} {size:>8} {oldTime * 1000:13.2f} "
+                    f"{newTime * 1000:10.2f} {oldTime / newTime:8.1f}x")
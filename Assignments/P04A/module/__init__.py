@@ -1,7 +1,28 @@
-__all__ = ["timeconversion"]
+__all__ = ["timeconversion", "connectionpool", "radarsweep", "trajectory", "interceptsolver", "attackerclient", "tickscheduler", "firedispatch", "threatzones", "batteryplacement", "geopackage", "simulationclock"]
 from module.timeconversion import convertTimeToSecondsSimple
 from module.timeconversion import convertTimeFromSecondsNoDate
 from module.timeconversion import convertTimeToSecondsNoDate
 from module.timeconversion import convertTimeToSeconds
 from module.timeconversion import convertTimeFromSeconds
 from module.timeconversion import convertDateToOtherDate
+from module.timeconversion import timeOfDaySeconds
+from module.timeconversion import convertTimesToSecondsSimple
+from module.timeconversion import convertTimesToSecondsNoDate
+from module.timeconversion import convertTimesToSeconds
+from module.connectionpool import DatabaseConnectionPool
+from module.connectionpool import getConnectionPool
+from module.connectionpool import closeConnectionPools
+from module.radarsweep import RadarSweepIngest
+from module.trajectory import TrajectoryPredictor
+from module.trajectory import registerMotionModel
+from module.interceptsolver import InterceptSolver
+from module.attackerclient import AttackerClient
+from module.tickscheduler import TickScheduler
+from module.firedispatch import FireDispatcher
+from module.firedispatch import fireDispatchTableSQL
+from module.threatzones import ThreatZoneCache
+from module.batteryplacement import placeNewBatteries
+from module.batteryplacement import batteryCoverageReport
+from module.geopackage import exportTables
+from module.simulationclock import SimulationClock
+from module.simulationclock import timeOfDayToEpoch
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: An asyncio friendly HTTP client for talking to attackers.
+#              Requests go out over one keep-alive session with a pool of
+#              connections per attacker, and run on a small set of worker
+#              threads so awaiting them never blocks the event loop.
+#              Several attackers can be asked at the same time with
+#              getAll.
+##############################################################################
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class AttackerClient(object):
+    """
+    AttackerClient
+    Sends GET and POST requests to attackers without blocking the
+    event loop, reusing connections between requests.
+    """
+
+    def __init__(self, poolSize = 10, timeout = 5):
+        self.poolSize = poolSize
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=poolSize,
+            thread_name_prefix="attacker-client")
+
+        self.statsLock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.requestSeconds = 0.0
+
+    def send(self, method, url, **kwargs):
+        """
+        send
+        Sends one request on the calling thread and returns the
+        response body. Raises on connection errors and error
+        status codes.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response.content
+        except:
+            with self.statsLock:
+                self.failures += 1
+            raise
+        finally:
+            with self.statsLock:
+                self.requests += 1
+                self.requestSeconds += time.perf_counter() - start
+
+    async def request(self, method, url, **kwargs):
+        """
+        request
+        Awaitable version of send.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+            lambda: self.send(method, url, **kwargs))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def getAll(self, urls, **kwargs):
+        """
+        getAll
+        GETs every url at the same time. Returns the response
+        bodies in the same order, with the exception in place of
+        any request that failed.
+        """
+        return await asyncio.gather(*[self.get(url, **kwargs) for url in urls],
+            return_exceptions=True)
+
+    def getStats(self):
+        with self.statsLock:
+            averageSeconds = 0.0
+            if self.requests > 0:
+                averageSeconds = self.requestSeconds / self.requests
+            return {
+                "poolSize": self.poolSize,
+                "timeout": self.timeout,
+                "requests": self.requests,
+                "failures": self.failures,
+                "averageSeconds": averageSeconds,
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Places any number of missile batteries in the assigned
+#              region. The region and cities are read once, candidate
+#              sites are sampled inside the region in a single query, and
+#              the sites are then picked in memory before every battery
+#              is inserted in one statement. Strategies:
+#              - "greedy":   Each battery goes where it covers the most
+#                            cities not yet covered, with ties going to
+#                            the site that brings cities closest to a
+#                            battery.
+#              - "kmeans":   Batteries go to the centers of city
+#                            clusters, moved to the closest site inside
+#                            the region.
+#              - "cardinal": One battery on the center of the region and
+#                            the rest where evenly spaced lines out from
+#                            the center cross the border, like the
+#                            original five battery layout.
+##############################################################################
+
+import numpy as np
+
+from psycopg2.extras import execute_values
+
+# Uses 1 Degree of Separation = 111,139 meters, like metersToDegreesNA.
+metersPerDegree = 111139.0
+
+# Lloyd iterations used by the kmeans strategy.
+kmeansIterations = 25
+
+
+def loadCities(cur):
+    """
+    loadCities
+    Returns a (C, 2) array of the region's city points.
+    """
+    cur.execute(
+        """
+            SELECT ST_X(point_geometry), ST_Y(point_geometry)
+            FROM points_of_interest WHERE point_category != 'Battery'
+            ORDER BY point_id;
+        """)
+    return np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 2)
+
+
+def loadCandidates(cur, candidateCount):
+    """
+    loadCandidates
+    Returns a (K, 2) array of sites inside the region: the point
+    on surface, every city inside the border, and candidateCount
+    random points, all from one query.
+    """
+    cur.execute(
+        """
+            WITH region AS (SELECT boundary FROM assigned_regions LIMIT 1)
+            SELECT ST_X(site), ST_Y(site) FROM (
+                SELECT ST_PointOnSurface(boundary) AS site FROM region
+                UNION ALL
+                SELECT point_geometry FROM points_of_interest, region
+                WHERE point_category != 'Battery' AND ST_Contains(boundary, ST_Force2D(point_geometry))
+                UNION ALL
+                SELECT (ST_Dump(ST_GeneratePoints(boundary, %s))).geom FROM region
+            ) AS sites;
+        """, (int(candidateCount),))
+    return np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 2)
+
+
+def cardinalSites(cur, count):
+    """
+    cardinalSites
+    Returns the region's centroid followed by count - 1 points
+    where lines from the centroid, evenly spaced clockwise from
+    north, cross the border.
+    """
+    cur.execute(
+        """
+            WITH region AS (
+                SELECT boundary, ST_Centroid(boundary) AS center
+                FROM assigned_regions LIMIT 1
+            )
+            SELECT ST_X(center), ST_Y(center), 0 FROM region
+            UNION ALL
+            SELECT * FROM (
+                SELECT ST_X(crossing), ST_Y(crossing), direction
+                FROM region, generate_series(1, %(count)s - 1) AS direction,
+                LATERAL (
+                    SELECT ST_Centroid(ST_Intersection(ST_Boundary(boundary),
+                        ST_MakeLine(center, ST_SetSRID(ST_MakePoint(
+                            ST_X(center) + 180 * sin(2 * pi() * (direction - 1) / (%(count)s - 1)),
+                            ST_Y(center) + 180 * cos(2 * pi() * (direction - 1) / (%(count)s - 1))), 4326))
+                    )) AS crossing
+                ) AS edge
+                ORDER BY direction
+            ) AS borders;
+        """, {"count": int(count)})
+    return np.array([row[:2] for row in cur.fetchall() if row[0] != None], dtype=np.float64).reshape(-1, 2)
+
+
+def siteDistances(sites, cities):
+    """
+    siteDistances
+    Returns the (K, C) distances in degrees from each site to
+    each city.
+    """
+    offsets = sites[:, None, :] - cities[None, :, :]
+    return np.sqrt(np.einsum('ijk,ijk->ij', offsets, offsets))
+
+
+def greedySites(candidates, cities, weights, count, coverageRadius):
+    """
+    greedySites
+    Picks count candidates one at a time, each covering the most
+    uncovered city weight within coverageRadius, with ties going
+    to whichever leaves the least weighted distance to the
+    closest battery.
+    """
+    if len(cities) == 0:
+        return candidates[:count]
+
+    distances = siteDistances(candidates, cities)
+    covers = distances <= coverageRadius
+    covered = np.zeros(len(cities), dtype=bool)
+    nearest = np.full(len(cities), np.inf)
+    chosen = []
+    for index in range(0, min(count, len(candidates))):
+        gain = covers[:, ~covered] @ weights[~covered]
+        totalDistance = np.minimum(distances, nearest[None, :]) @ weights
+        gain[chosen] = -1
+        best = np.lexsort((totalDistance, -gain))[0]
+        chosen.append(best)
+        covered |= covers[best]
+        nearest = np.minimum(nearest, distances[best])
+    return candidates[chosen]
+
+
+def kmeansSites(candidates, cities, weights, count, coverageRadius):
+    """
+    kmeansSites
+    Clusters the cities into count groups weighted by the city
+    weights, then moves each center to the closest unused
+    candidate. Falls back to greedy picks when there are fewer
+    cities than batteries.
+    """
+    if len(cities) < count:
+        return greedySites(candidates, cities, weights, count, coverageRadius)
+
+    # Start from the greedy picks so the result is repeatable.
+    centers = greedySites(candidates, cities, weights, count, coverageRadius).copy()
+    for iteration in range(0, kmeansIterations):
+        groups = np.argmin(siteDistances(centers, cities), axis=0)
+        moved = centers.copy()
+        for group in range(0, len(centers)):
+            members = groups == group
+            if np.any(members):
+                moved[group] = np.average(cities[members], axis=0, weights=weights[members])
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+
+    distances = siteDistances(centers, candidates)
+    chosen = []
+    for group in range(0, len(centers)):
+        distances[group, chosen] = np.inf
+        chosen.append(int(np.argmin(distances[group])))
+    return candidates[chosen]
+
+
+def coverageReport(sites, cities, weights, coverageRadius):
+    """
+    coverageReport
+    Describes how well a set of battery sites covers the cities.
+    """
+    report = {
+        "batteries": len(sites),
+        "cities": len(cities),
+        "coverage_radius_meters": coverageRadius * metersPerDegree,
+        "cities_covered": 0,
+        "coverage": 0.0,
+        "weighted_coverage": 0.0,
+        "mean_distance_meters": None,
+        "max_distance_meters": None,
+        "cities_per_battery": [0] * len(sites),
+    }
+    if len(sites) == 0 or len(cities) == 0:
+        return report
+
+    distances = siteDistances(sites, cities)
+    nearest = np.min(distances, axis=0)
+    covered = nearest <= coverageRadius
+    report["cities_covered"] = int(np.sum(covered))
+    report["coverage"] = float(np.mean(covered))
+    report["weighted_coverage"] = float(np.sum(weights[covered]) / np.sum(weights))
+    report["mean_distance_meters"] = float(np.mean(nearest) * metersPerDegree)
+    report["max_distance_meters"] = float(np.max(nearest) * metersPerDegree)
+    report["cities_per_battery"] = [int(value) for value in np.sum(distances <= coverageRadius, axis=1)]
+    return report
+
+
+def placeNewBatteries(cur, count, strategy = "greedy", coverageRadius = 1.0,
+    weights = None, candidateCount = 500):
+    """
+    placeNewBatteries
+    Replaces the batteries in points_of_interest with count new
+    ones placed by the named strategy, numbered -1, -2, ... like
+    before. coverageRadius is in degrees, and weights optionally
+    gives each city an importance in point_id order. Returns the
+    coverage report for the new batteries along with their sites.
+    """
+    cities = loadCities(cur)
+    if weights is None:
+        weights = np.ones(len(cities))
+    weights = np.asarray(weights, dtype=np.float64)
+
+    if strategy == "cardinal":
+        sites = cardinalSites(cur, count)
+    elif strategy == "greedy" or strategy == "kmeans":
+        candidates = loadCandidates(cur, candidateCount)
+        if len(candidates) == 0:
+            raise ValueError("Assigned region is empty.")
+        if strategy == "greedy":
+            sites = greedySites(candidates, cities, weights, count, coverageRadius)
+        else:
+            sites = kmeansSites(candidates, cities, weights, count, coverageRadius)
+    else:
+        raise ValueError("Unknown battery placement strategy " + str(strategy) + ".")
+
+    cur.execute(
+        """
+            DELETE FROM points_of_interest WHERE point_category = 'Battery';
+        """)
+    execute_values(cur,
+        """
+            INSERT INTO points_of_interest (point_id, point_category, point_geometry)
+            SELECT point_id, 'Battery', ST_SetSRID(ST_MakePoint(x, y, 0), 4326)
+            FROM (VALUES %s) AS sites (point_id, x, y);
+        """,
+        [(-(index + 1), float(site[0]), float(site[1])) for index, site in enumerate(sites)],
+        template="(%s, %s::float8, %s::float8)")
+
+    report = coverageReport(sites, cities, weights, coverageRadius)
+    report["strategy"] = strategy
+    report["sites"] = [[float(site[0]), float(site[1])] for site in sites]
+    return report
+
+
+def batteryCoverageReport(cur, coverageRadius = 1.0, weights = None):
+    """
+    batteryCoverageReport
+    Returns the coverage report for the batteries already placed.
+    """
+    cities = loadCities(cur)
+    if weights is None:
+        weights = np.ones(len(cities))
+    cur.execute(
+        """
+            SELECT ST_X(point_geometry), ST_Y(point_geometry)
+            FROM points_of_interest WHERE point_category = 'Battery'
+            ORDER BY point_id DESC;
+        """)
+    sites = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 2)
+    return coverageReport(sites, cities, np.asarray(weights, dtype=np.float64), coverageRadius)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Sends fire solutions to attackers in the background. A
+#              radar sweep only adds a row to fire_dispatches inside its
+#              own transaction. Once that commits, the row is handed to a
+#              pool of worker threads that POST it with a timeout, retry
+#              a few times with backoff, and record whether the attacker
+#              acknowledged it. Rows left queued by a restart can be sent
+#              again with resumePending.
+##############################################################################
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Creates the dispatch table. Status goes from queued to acked, or to
+# failed once every retry is used up.
+fireDispatchTableSQL = \
+"""
+    CREATE TABLE IF NOT EXISTS fire_dispatches (
+        id SERIAL PRIMARY KEY,
+        intercept_id INT,
+        missile_id INT,
+        url TEXT,
+        payload JSONB,
+        status TEXT DEFAULT 'queued',
+        attempts INT DEFAULT 0,
+        last_error TEXT,
+        response TEXT,
+        queued_at TIMESTAMPTZ DEFAULT now(),
+        finished_at TIMESTAMPTZ
+    );
+
+    CREATE INDEX IF NOT EXISTS fire_dispatch_status_index
+    ON fire_dispatches (status);
+"""
+
+# Longest attacker response kept in the table.
+responseLimit = 1000
+
+
+class FireDispatcher(object):
+    """
+    FireDispatcher
+    Queues fire solutions in the database and sends them to
+    attackers concurrently after the queuing transaction commits.
+    """
+
+    def __init__(self, cursorFactory, sender, workers = 8, maxRetries = 3, retryDelay = 0.5):
+        self.cursorFactory = cursorFactory
+        # Called as sender(method, url, **kwargs), raising on failure.
+        self.sender = sender
+        self.workers = workers
+        self.maxRetries = maxRetries
+        self.retryDelay = retryDelay
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+            thread_name_prefix="fire-dispatch")
+
+        self.statsLock = threading.Lock()
+        self.inFlight = set()
+        self.queued = 0
+        self.acked = 0
+        self.failed = 0
+        self.retries = 0
+        self.deliverySeconds = 0.0
+
+    def enqueue(self, cur, interceptId, missileId, url, payload):
+        """
+        enqueue
+        Adds a fire solution to fire_dispatches with the caller's
+        cursor. Returns the dispatch to pass to submit once the
+        caller's transaction has committed.
+        """
+        cur.execute(
+            """
+                INSERT INTO fire_dispatches (intercept_id, missile_id, url, payload)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id;
+            """, (interceptId, missileId, url, payload))
+        return (int(cur.fetchone()[0]), url, payload)
+
+    def submit(self, dispatches):
+        """
+        submit
+        Starts sending committed dispatches. Dispatches already
+        being sent are skipped. Only these are counted as queued,
+        so rows from a rolled back sweep never are.
+        """
+        for dispatchId, url, payload in dispatches:
+            with self.statsLock:
+                if dispatchId in self.inFlight:
+                    continue
+                self.inFlight.add(dispatchId)
+                self.queued += 1
+            self.executor.submit(self.deliver, dispatchId, url, payload)
+
+    def resumePending(self):
+        """
+        resumePending
+        Submits every dispatch still queued in the table, such as
+        ones left behind when the server stopped. Returns how many
+        were found.
+        """
+        with self.cursorFactory() as cur:
+            cur.execute(
+                """
+                    SELECT id, url, payload FROM fire_dispatches
+                    WHERE status = 'queued' ORDER BY id;
+                """)
+            pending = [(int(row[0]), row[1], json.dumps(row[2])) for row in cur.fetchall()]
+        self.submit(pending)
+        return len(pending)
+
+    def deliver(self, dispatchId, url, payload):
+        """
+        deliver
+        POSTs one fire solution, retrying with a growing delay,
+        and records the outcome.
+        """
+        start = time.perf_counter()
+        attempts = 0
+        status = 'failed'
+        lastError = None
+        response = None
+        try:
+            while attempts <= self.maxRetries:
+                if attempts > 0:
+                    with self.statsLock:
+                        self.retries += 1
+                    time.sleep(self.retryDelay * (2 ** (attempts - 1)))
+                attempts += 1
+                try:
+                    body = self.sender("POST", url,
+                        headers={'Content-Type': 'application/json'}, data=payload)
+                    response = body.decode("utf-8", "replace")[:responseLimit]
+                    status = 'acked'
+                    break
+                except Exception as error:
+                    lastError = str(error)[:responseLimit]
+
+            with self.cursorFactory() as cur:
+                cur.execute(
+                    """
+                        UPDATE fire_dispatches
+                        SET status = %s, attempts = attempts + %s, last_error = %s,
+                            response = %s, finished_at = now()
+                        WHERE id = %s;
+                    """, (status, attempts, lastError, response, dispatchId))
+        finally:
+            with self.statsLock:
+                self.inFlight.discard(dispatchId)
+                if status == 'acked':
+                    self.acked += 1
+                else:
+                    self.failed += 1
+                self.deliverySeconds += time.perf_counter() - start
+
+    def flush(self, timeout = 30):
+        """
+        flush
+        Waits up to timeout seconds for every in flight dispatch
+        to finish. Returns True if they all did.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.statsLock:
+                if len(self.inFlight) == 0:
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def getStats(self):
+        with self.statsLock:
+            finished = self.acked + self.failed
+            averageSeconds = 0.0
+            if finished > 0:
+                averageSeconds = self.deliverySeconds / finished
+            return {
+                "workers": self.workers,
+                "maxRetries": self.maxRetries,
+                "queued": self.queued,
+                "inFlight": len(self.inFlight),
+                "acked": self.acked,
+                "failed": self.failed,
+                "retries": self.retries,
+                "averageDeliverySeconds": averageSeconds,
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
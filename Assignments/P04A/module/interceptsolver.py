@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Chooses interceptors for a whole sweep of predicted
+#              missile paths at once. For every predicted point the
+#              closest battery and the slowest interceptor that could
+#              still get there in time are worked out together, which
+#              turns the choice of launch time for each interceptor
+#              type into a lookup on a running minimum. Interceptors
+#              are then handed out without going over the inventory.
+##############################################################################
+
+import threading
+import time
+
+import numpy as np
+
+# Most array elements worked on at once.
+elementBudget = 4000000
+
+
+class InterceptSolver(object):
+    """
+    InterceptSolver
+    Assigns an interceptor type, battery, and launch time to each
+    predicted missile path that can be stopped.
+    """
+
+    def __init__(self):
+        self.statsLock = threading.Lock()
+        self.solves = 0
+        self.threats = 0
+        self.assigned = 0
+        self.solveSeconds = 0.0
+
+    def feasibleSteps(self, trajectories, batteries, speeds, simulationTime,
+        shootBuffer = 0, shootEarliest = False):
+        """
+        feasibleSteps
+        Returns an (M, K) array with the prediction step each
+        missile would be hit at by each of the K interceptor
+        speeds, or -1 if it can't be, along with an (M, T) array
+        of the closest battery and an (M, T) array of the distance
+        to it. A step works if the missile is above ground and the
+        interceptor reaches it shootBuffer seconds before the
+        missile does.
+        """
+        positions = trajectories.positions
+        missileCount, stepCount = positions.shape[0], positions.shape[1]
+        batteries = np.asarray(batteries, dtype=np.float64).reshape(-1, 3)
+        speeds = np.asarray(speeds, dtype=np.float64)
+
+        steps = np.full((missileCount, len(speeds)), -1, dtype=np.int64)
+        closestBattery = np.zeros((missileCount, stepCount), dtype=np.int64)
+        closestDistance = np.full((missileCount, stepCount), np.inf)
+        if missileCount == 0 or len(batteries) == 0 or len(speeds) == 0:
+            return steps, closestBattery, closestDistance
+
+        # Seconds left to fly at each step. Anything at or past now
+        # can't be reached.
+        slack = trajectories.times - simulationTime - shootBuffer
+
+        # Squared distances are expanded into a matrix product around
+        # the batteries' center, so no (M, T, B, 3) array is built and
+        # only the closest distance needs a square root.
+        center = np.mean(batteries, axis=0)
+        localBatteries = batteries - center
+        batteryNorms = np.sum(localBatteries ** 2, axis=1)
+
+        rowStep = max(1, elementBudget // (stepCount * max(len(batteries), len(speeds))))
+        for start in range(0, missileCount, rowStep):
+            rows = slice(start, min(start + rowStep, missileCount))
+            # The point's own squared length is the same for every
+            # battery, so it is only added back for the closest one.
+            local = positions[rows] - center
+            batteryTerms = batteryNorms - 2 * (local @ localBatteries.T)
+            closestBattery[rows] = np.argmin(batteryTerms, axis=2)
+            closestTerms = np.take_along_axis(batteryTerms, closestBattery[rows][:, :, None], axis=2)[:, :, 0]
+            closestDistance[rows] = np.sqrt(np.maximum(
+                np.einsum('ijk,ijk->ij', local, local) + closestTerms, 0))
+
+            # The slowest interceptor that still makes each step.
+            usable = (positions[rows, :, 2] >= 0) & (slack[None, :] > 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                neededSpeed = np.where(usable, closestDistance[rows] / slack[None, :], np.inf)
+
+            # A speed works at the first step whose running minimum
+            # from the chosen end drops to it.
+            if shootEarliest:
+                runningMinimum = np.minimum.accumulate(neededSpeed, axis=1)
+            else:
+                runningMinimum = np.minimum.accumulate(neededSpeed[:, ::-1], axis=1)
+            missed = np.stack([np.count_nonzero(runningMinimum > speed, axis=1)
+                for speed in speeds], axis=1)
+            found = missed < stepCount
+            if shootEarliest:
+                chosen = missed
+            else:
+                chosen = stepCount - 1 - missed
+            steps[rows] = np.where(found, chosen, -1)
+
+        return steps, closestBattery, closestDistance
+
+    def solve(self, trajectories, batteries, interceptors, simulationTime,
+        shootBuffer = 0, shootEarliest = False, targets = None):
+        """
+        solve
+        Assigns interceptors to the missiles in a
+        PredictedTrajectories. batteries is a (B, 3) array of
+        battery points and interceptors maps each interceptor name
+        to its (speed in degrees per second, count on hand).
+        targets optionally limits which missiles are engaged.
+        Missiles with the fewest usable interceptor types are
+        served first, and each takes whichever usable type has
+        the most left. Returns a list of assignment dictionaries
+        holding the "missile_id", "interceptor", "point",
+        "launch_time", "hit_time", "battery", and the
+        "missile_index" into the trajectories, in missile order.
+        """
+        phaseStart = time.perf_counter()
+        names = list(interceptors.keys())
+        speeds = [interceptors[name][0] for name in names]
+        remaining = {name: int(interceptors[name][1]) for name in names}
+
+        steps, closestBattery, closestDistance = self.feasibleSteps(trajectories,
+            batteries, speeds, simulationTime, shootBuffer, shootEarliest)
+        batteries = np.asarray(batteries, dtype=np.float64).reshape(-1, 3)
+
+        candidates = np.nonzero(np.any(steps >= 0, axis=1))[0]
+        if targets is not None:
+            targets = np.asarray(targets, dtype=bool)
+            candidates = candidates[targets[candidates]]
+        options = np.sum(steps[candidates] >= 0, axis=1)
+        order = candidates[np.argsort(options, kind='stable')]
+
+        assignments = []
+        for missileIndex in order:
+            usable = [kind for kind in range(0, len(names))
+                if steps[missileIndex, kind] >= 0 and remaining[names[kind]] > 0]
+            if len(usable) == 0:
+                continue
+            kind = max(usable, key=lambda option: remaining[names[option]])
+            remaining[names[kind]] -= 1
+
+            step = steps[missileIndex, kind]
+            hitTime = float(trajectories.times[step])
+            flightTime = closestDistance[missileIndex, step] / speeds[kind]
+            assignments.append({
+                "missile_id": int(trajectories.missileIds[missileIndex]),
+                "interceptor": names[kind],
+                "point": tuple(float(value) for value in trajectories.positions[missileIndex, step]),
+                "launch_time": hitTime - float(flightTime),
+                "hit_time": hitTime,
+                "battery": tuple(float(value) for value in batteries[closestBattery[missileIndex, step]]),
+                "missile_index": int(missileIndex),
+            })
+        assignments.sort(key=lambda assignment: assignment["missile_index"])
+
+        with self.statsLock:
+            self.solves += 1
+            self.threats += len(trajectories)
+            self.assigned += len(assignments)
+            self.solveSeconds += time.perf_counter() - phaseStart
+        return assignments
+
+    def getStats(self):
+        with self.statsLock:
+            return {
+                "solves": self.solves,
+                "threats": self.threats,
+                "assigned": self.assigned,
+                "solveSeconds": self.solveSeconds,
+            }
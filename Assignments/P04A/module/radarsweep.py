@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Ingests a whole radar sweep at once. Every ping in the
+#              sweep is copied into a temp table in one COPY, sorted into
+#              solved, active, and new missiles with joins against the
+#              ping tables, and recorded with one statement per group,
+#              all inside the caller's transaction. The cost of a sweep
+#              stays a handful of statements no matter how many missiles
+#              the attacker has in the air.
+##############################################################################
+
+import io
+import threading
+import time
+
+from module.timeconversion import convertTimesToSecondsSimple
+
+# Uses 1 Degree of Separation = 111,139 meters, like metersToDegreesNA.
+metersPerDegree = 111139.0
+
+# Phases timed for every sweep, in the order they run.
+sweepPhases = ["load", "classify", "record", "fetch", "settle"]
+
+
+def escapeCopyText(value):
+    """
+    escapeCopyText
+    Escapes a value for COPY's text format.
+    """
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t") \
+        .replace("\n", "\\n").replace("\r", "\\r")
+
+
+def sweepCopyBuffer(features):
+    """
+    sweepCopyBuffer
+    Turns the features of a radar sweep into a COPY text buffer
+    with one line of missile_id, x, y, altitude in meters,
+    time in seconds, and missile type for each ping.
+    """
+    # A sweep shares a handful of timestamps, so parse them together.
+    timeCodes = convertTimesToSecondsSimple(
+        [feature['properties']['current_time'] for feature in features])
+    lines = []
+    for feature, timeCode in zip(features, timeCodes):
+        coordinates = feature['geometry']['coordinates']
+        properties = feature['properties']
+        lines.append("\t".join([
+            str(int(feature['id'])),
+            str(float(coordinates[0])),
+            str(float(coordinates[1])),
+            str(float(properties['altitude'])),
+            str(float(timeCode)),
+            escapeCopyText(properties['missile_type'])]))
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+class RadarSweepIngest(object):
+    """
+    RadarSweepIngest
+    Records a radar sweep's pings and returns the missiles that
+    now have two pings and can have an interception planned.
+    """
+
+    def __init__(self):
+        self.statsLock = threading.Lock()
+        self.sweeps = 0
+        self.pings = 0
+        self.solvedPings = 0
+        self.newMissiles = 0
+        self.solvableMissiles = 0
+        self.phaseTotals = {phase: 0.0 for phase in sweepPhases}
+        self.lastTimings = {}
+
+    def ingest(self, cur, features):
+        """
+        ingest
+        Loads a sweep's features with the given cursor. Pings for
+        solved missiles are added to solved_missile_pings and new
+        missiles are added to active_missile_pings. Returns a
+        dictionary holding "solvable", a list of dictionaries for
+        each missile already in active_missile_pings with its
+        current and previous ping, and "timings", the seconds each
+        phase took. Call settle with the same cursor before the
+        transaction commits, since the sweep is cleared on commit.
+        """
+        timings = {}
+        phaseStart = time.perf_counter()
+
+        # The temp table lives as long as the pooled connection, and
+        # its rows only last until the transaction commits.
+        cur.execute(
+            """
+                CREATE TEMP TABLE IF NOT EXISTS sweep_pings (
+                    missile_id INT,
+                    x FLOAT8,
+                    y FLOAT8,
+                    altitude FLOAT8,
+                    time_code FLOAT8,
+                    missile_type TEXT,
+                    status TEXT
+                ) ON COMMIT DELETE ROWS;
+                TRUNCATE sweep_pings;
+            """)
+        if len(features) > 0:
+            cur.copy_expert(
+                """
+                    COPY sweep_pings (missile_id, x, y, altitude, time_code, missile_type)
+                    FROM STDIN;
+                """, sweepCopyBuffer(features))
+        timings["load"] = time.perf_counter() - phaseStart
+
+        # Sort every ping at once. Solved wins over active, the
+        # same order the pings were checked in one at a time.
+        phaseStart = time.perf_counter()
+        cur.execute(
+            """
+                UPDATE sweep_pings SET status =
+                    CASE
+                        WHEN EXISTS (SELECT 1 FROM solved_missile_pings
+                            WHERE solved_missile_pings.missile_id = sweep_pings.missile_id) THEN 'solved'
+                        WHEN EXISTS (SELECT 1 FROM active_missile_pings
+                            WHERE active_missile_pings.missile_id = sweep_pings.missile_id) THEN 'active'
+                        ELSE 'new'
+                    END;
+                ANALYZE sweep_pings;
+            """)
+        timings["classify"] = time.perf_counter() - phaseStart
+
+        phaseStart = time.perf_counter()
+        cur.execute(
+            """
+                INSERT INTO solved_missile_pings (intersects, time_code, missile_type, missile_id)
+                SELECT ST_SetSRID(ST_MakePoint(x, y, altitude / %(metersPerDegree)s), 4326),
+                    time_code, missile_type, missile_id
+                FROM sweep_pings
+                WHERE status = 'solved';
+            """, {"metersPerDegree": metersPerDegree})
+        solvedCount = cur.rowcount
+        cur.execute(
+            """
+                INSERT INTO active_missile_pings (intersects, time_code, missile_type, missile_id)
+                SELECT ST_SetSRID(ST_MakePoint(x, y, altitude / %(metersPerDegree)s), 4326),
+                    time_code, missile_type, missile_id
+                FROM sweep_pings
+                WHERE status = 'new';
+            """, {"metersPerDegree": metersPerDegree})
+        newCount = cur.rowcount
+        timings["record"] = time.perf_counter() - phaseStart
+
+        # Pair each active missile with its most recent earlier ping.
+        # A repeat of the same time can't give a velocity yet.
+        phaseStart = time.perf_counter()
+        cur.execute(
+            """
+                SELECT DISTINCT ON (sweep_pings.missile_id)
+                    sweep_pings.missile_id, sweep_pings.missile_type,
+                    sweep_pings.x, sweep_pings.y,
+                    sweep_pings.altitude / %(metersPerDegree)s, sweep_pings.time_code,
+                    ST_X(active_missile_pings.intersects), ST_Y(active_missile_pings.intersects),
+                    ST_Z(active_missile_pings.intersects), active_missile_pings.time_code
+                FROM sweep_pings
+                JOIN active_missile_pings ON active_missile_pings.missile_id = sweep_pings.missile_id
+                WHERE sweep_pings.status = 'active'
+                    AND active_missile_pings.time_code < sweep_pings.time_code
+                ORDER BY sweep_pings.missile_id, active_missile_pings.time_code DESC;
+            """, {"metersPerDegree": metersPerDegree})
+        solvable = []
+        for row in cur.fetchall():
+            solvable.append({
+                "missile_id": int(row[0]),
+                "missile_type": row[1],
+                "current": (float(row[2]), float(row[3]), float(row[4]), float(row[5])),
+                "previous": (float(row[6]), float(row[7]), float(row[8]), float(row[9])),
+            })
+        timings["fetch"] = time.perf_counter() - phaseStart
+
+        with self.statsLock:
+            self.sweeps += 1
+            self.pings += len(features)
+            self.solvedPings += solvedCount
+            self.newMissiles += newCount
+            self.solvableMissiles += len(solvable)
+            for phase in timings:
+                self.phaseTotals[phase] += timings[phase]
+            self.lastTimings = dict(timings)
+
+        return {"solvable": solvable, "timings": timings}
+
+    def settle(self, cur, missileIds, timings = None):
+        """
+        settle
+        Moves the given missiles' current pings into
+        solved_missile_pings and clears their old pings out of
+        active_missile_pings. Adds the time taken to timings.
+        """
+        phaseStart = time.perf_counter()
+        if len(missileIds) > 0:
+            missileIds = [int(missileId) for missileId in missileIds]
+            cur.execute(
+                """
+                    INSERT INTO solved_missile_pings (intersects, time_code, missile_type, missile_id)
+                    SELECT ST_SetSRID(ST_MakePoint(x, y, altitude / %(metersPerDegree)s), 4326),
+                        time_code, missile_type, missile_id
+                    FROM sweep_pings
+                    WHERE status = 'active' AND missile_id = ANY(%(missileIds)s);
+
+                    DELETE FROM active_missile_pings WHERE missile_id = ANY(%(missileIds)s);
+                """, {"metersPerDegree": metersPerDegree, "missileIds": missileIds})
+        elapsed = time.perf_counter() - phaseStart
+
+        with self.statsLock:
+            self.phaseTotals["settle"] += elapsed
+            self.lastTimings["settle"] = elapsed
+        if timings != None:
+            timings["settle"] = elapsed
+
+    def getStats(self):
+        with self.statsLock:
+            averages = {}
+            for phase in sweepPhases:
+                averages[phase] = 0.0
+                if self.sweeps > 0:
+                    averages[phase] = self.phaseTotals[phase] / self.sweeps
+            return {
+                "sweeps": self.sweeps,
+                "pings": self.pings,
+                "solvedPings": self.solvedPings,
+                "newMissiles": self.newMissiles,
+                "solvableMissiles": self.solvableMissiles,
+                "averagePhaseSeconds": averages,
+                "lastPhaseSeconds": dict(self.lastTimings),
+            }
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Keeps the simulation time without asking for it on every
+#              use. The clock is the monotonic clock plus an offset. Every
+#              so often the offset is measured against a time source,
+#              such as the attacker's clock, the way NTP does: a few
+#              requests are timed, the one with the shortest round trip is
+#              kept, and the remote time is taken to be halfway through
+#              it. Reading the time never waits on a lock or the network.
+##############################################################################
+
+import asyncio
+import threading
+import time
+
+# Seconds in a day, for placing time of day clocks on a date.
+daySeconds = 24 * 3600
+
+
+def timeOfDayToEpoch(timeOfDay, reference = None):
+    """
+    timeOfDayToEpoch
+    Places a time of day in seconds on whichever local date puts
+    it closest to reference, a POSIX timestamp defaulting to now.
+    Returns it as a POSIX timestamp.
+    """
+    if reference == None:
+        reference = time.time()
+    local = time.localtime(reference)
+    midnight = reference - (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec
+        + (reference % 1))
+    candidates = [midnight + day * daySeconds + timeOfDay for day in (-1, 0, 1)]
+    return min(candidates, key=lambda candidate: abs(candidate - reference))
+
+
+class SimulationClock(object):
+    """
+    SimulationClock
+    Monotonic simulation time, periodically synced to a time
+    source that returns POSIX seconds.
+    """
+
+    def __init__(self, source = None, syncInterval = 5.0, samples = 3):
+        # Called with no arguments, returning the remote time. None
+        # uses this machine's wall clock.
+        self.source = source
+        self.syncInterval = syncInterval
+        self.samples = samples
+        # Read without a lock. A float is swapped in whole, so now()
+        # always sees either the old offset or the new one.
+        self.offset = time.time() - time.monotonic()
+
+        self.statsLock = threading.Lock()
+        self.syncs = 0
+        self.failures = 0
+        self.lastSync = None
+        self.lastRoundTrip = None
+        self.minRoundTrip = None
+        self.roundTripTotal = 0.0
+        self.lastAdjustment = 0.0
+        self.drift = 0.0
+        self.lastError = None
+
+    def now(self):
+        """
+        now
+        Returns the simulation time in POSIX seconds.
+        """
+        return time.monotonic() + self.offset
+
+    def timeOfDay(self):
+        """
+        timeOfDay
+        Returns the simulation time as local seconds since midnight.
+        """
+        current = self.now()
+        local = time.localtime(current)
+        return local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec + (current % 1)
+
+    def sync(self):
+        """
+        sync
+        Measures the offset to the time source with a few timed
+        requests and keeps the one with the shortest round trip.
+        Returns True if the offset was updated.
+        """
+        source = self.source
+        if source == None:
+            source = time.time
+
+        best = None
+        error = None
+        for sample in range(0, self.samples):
+            sent = time.monotonic()
+            try:
+                remote = float(source())
+            except Exception as failure:
+                error = str(failure)
+                continue
+            received = time.monotonic()
+            roundTrip = received - sent
+            if best == None or roundTrip < best[0]:
+                best = (roundTrip, remote + roundTrip / 2 - received, received)
+
+        with self.statsLock:
+            if best == None:
+                self.failures += 1
+                self.lastError = error
+                return False
+
+            roundTrip, offset, received = best
+            adjustment = offset - self.offset
+            # How fast our clock gains or loses against the source,
+            # in seconds per second.
+            if self.lastSync != None and received > self.lastSync:
+                self.drift = adjustment / (received - self.lastSync)
+            self.offset = offset
+            self.syncs += 1
+            self.lastSync = received
+            self.lastRoundTrip = roundTrip
+            self.lastAdjustment = adjustment
+            self.roundTripTotal += roundTrip
+            if self.minRoundTrip == None or roundTrip < self.minRoundTrip:
+                self.minRoundTrip = roundTrip
+            return True
+
+    async def run(self):
+        """
+        run
+        Syncs every syncInterval seconds until cancelled. Requests
+        run on a worker thread so the event loop stays free.
+        """
+        while True:
+            await asyncio.to_thread(self.sync)
+            await asyncio.sleep(self.syncInterval)
+
+    def getStats(self):
+        with self.statsLock:
+            averageRoundTrip = None
+            if self.syncs > 0:
+                averageRoundTrip = self.roundTripTotal / self.syncs
+            sinceSync = None
+            if self.lastSync != None:
+                sinceSync = time.monotonic() - self.lastSync
+            return {
+                "source": "local" if self.source == None else "remote",
+                "now": self.now(),
+                "offset": self.offset,
+                "syncs": self.syncs,
+                "failures": self.failures,
+                "secondsSinceSync": sinceSync,
+                "lastRoundTrip": self.lastRoundTrip,
+                "minRoundTrip": self.minRoundTrip,
+                "averageRoundTrip": averageRoundTrip,
+                "lastAdjustment": self.lastAdjustment,
+                "drift": self.drift,
+                "lastError": self.lastError,
+            }
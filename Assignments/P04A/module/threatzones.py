@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Builds the threat zones around our cities once per game.
+#              Each missile class gets one polygon in threat_zones, the
+#              union of every city buffered by that class's blast radius,
+#              with a spatial index for any query that wants them. The
+#              cities and radii are also kept in memory so predicted
+#              paths can be checked without going to the database, with
+#              a bounding box check first so only cities near a path are
+#              measured point by point.
+##############################################################################
+
+import threading
+import time
+
+import numpy as np
+
+# Most array elements worked on at once.
+elementBudget = 4000000
+
+
+class ThreatZoneCache(object):
+    """
+    ThreatZoneCache
+    Holds the city threat zone for each missile class and answers
+    which predicted paths pass through their class's zone.
+    """
+
+    def __init__(self):
+        self.statsLock = threading.Lock()
+        self.cities = np.zeros((0, 2))
+        self.radii = {}
+        self.loaded = False
+        self.builds = 0
+        self.checks = 0
+        self.candidatePairs = 0
+        self.checkSeconds = 0.0
+
+    def rebuild(self, cur, radiusScale):
+        """
+        rebuild
+        Recreates threat_zones from the cities in
+        points_of_interest and the radius category of every class
+        in missile_spec_key, scaled by radiusScale degrees, and
+        then loads the cache from it.
+        """
+        cur.execute(
+            """
+                DROP TABLE IF EXISTS threat_zones;
+                CREATE TABLE threat_zones (missile_type TEXT PRIMARY KEY, radius FLOAT8, zone GEOMETRY);
+
+                INSERT INTO threat_zones (missile_type, radius, zone)
+                SELECT classification_label, radius_category * %(radiusScale)s,
+                    ST_Union(ST_Buffer(ST_Force2D(point_geometry), radius_category * %(radiusScale)s))
+                FROM missile_spec_key, points_of_interest
+                WHERE point_category != 'Battery'
+                GROUP BY classification_label, radius_category;
+
+                /* Classes without any city still get a radius. */
+                INSERT INTO threat_zones (missile_type, radius, zone)
+                SELECT classification_label, radius_category * %(radiusScale)s, NULL
+                FROM missile_spec_key
+                ON CONFLICT (missile_type) DO NOTHING;
+
+                CREATE INDEX threat_zone_index
+                ON threat_zones
+                USING gist(zone);
+            """, {"radiusScale": float(radiusScale)})
+        with self.statsLock:
+            self.builds += 1
+        self.load(cur)
+
+    def load(self, cur, radiusScale = None):
+        """
+        load
+        Reads the cities and each class's radius into memory from
+        the threat_zones table. If the table is missing, as in a
+        database set up before it existed, it is rebuilt first
+        with radiusScale.
+        """
+        if radiusScale != None:
+            cur.execute(
+                """
+                    SELECT to_regclass('threat_zones') IS NULL;
+                """)
+            if cur.fetchone()[0]:
+                self.rebuild(cur, radiusScale)
+                return
+
+        cur.execute(
+            """
+                SELECT ST_X(point_geometry), ST_Y(point_geometry)
+                FROM points_of_interest WHERE point_category != 'Battery';
+            """)
+        cities = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 2)
+        cur.execute(
+            """
+                SELECT missile_type, radius FROM threat_zones;
+            """)
+        radii = {row[0]: float(row[1]) for row in cur.fetchall() if row[1] != None}
+
+        with self.statsLock:
+            self.cities = cities
+            self.radii = radii
+            self.loaded = True
+
+    def radius(self, missileType):
+        """
+        radius
+        Returns a class's blast radius in degrees, or None if the
+        class is unknown.
+        """
+        with self.statsLock:
+            return self.radii.get(missileType)
+
+    def zones(self, cur, missileType = None):
+        """
+        zones
+        Returns the threat zones as a list of dictionaries holding
+        the "missile_type", "radius", and GeoJSON "zone", for one
+        class or for all of them.
+        """
+        sql = \
+            """
+                SELECT missile_type, radius, ST_AsGeoJSON(zone)::json FROM threat_zones
+            """
+        if missileType == None:
+            cur.execute(sql + " ORDER BY missile_type;")
+        else:
+            cur.execute(sql + " WHERE missile_type = %s;", (missileType,))
+        return [{"missile_type": row[0], "radius": row[1], "zone": row[2]} for row in cur.fetchall()]
+
+    def threatened(self, trajectories):
+        """
+        threatened
+        Returns a boolean array saying which missiles in a
+        PredictedTrajectories come within their class's blast
+        radius of a city at any predicted point. Unknown classes
+        are never a threat, the same as a missing radius was in
+        the original buffer query.
+        """
+        start = time.perf_counter()
+        with self.statsLock:
+            cities = self.cities
+            radii = np.array([self.radii.get(missileType, np.nan)
+                for missileType in trajectories.missileTypes], dtype=np.float64)
+
+        result = np.zeros(len(trajectories), dtype=bool)
+        pairCount = 0
+        if len(trajectories) > 0 and len(cities) > 0:
+            positions = trajectories.positions[:, :, :2]
+
+            # Only cities inside a path's bounding box, grown by the
+            # radius, can be within reach of it.
+            low = np.min(positions, axis=1) - radii[:, None]
+            high = np.max(positions, axis=1) + radii[:, None]
+            near = np.all((cities[None, :, :] >= low[:, None, :]) &
+                (cities[None, :, :] <= high[:, None, :]), axis=2)
+            missileIndexes, cityIndexes = np.nonzero(near)
+            pairCount = len(missileIndexes)
+
+            step = max(1, elementBudget // max(1, positions.shape[1]))
+            for first in range(0, pairCount, step):
+                pairs = slice(first, min(first + step, pairCount))
+                offsets = positions[missileIndexes[pairs]] - cities[cityIndexes[pairs]][:, None, :]
+                closest = np.min(np.einsum('ijk,ijk->ij', offsets, offsets), axis=1)
+                hits = missileIndexes[pairs][closest <= radii[missileIndexes[pairs]] ** 2]
+                result[hits] = True
+
+        with self.statsLock:
+            self.checks += len(trajectories)
+            self.candidatePairs += pairCount
+            self.checkSeconds += time.perf_counter() - start
+        return result
+
+    def getStats(self):
+        with self.statsLock:
+            return {
+                "loaded": self.loaded,
+                "cities": len(self.cities),
+                "classes": len(self.radii),
+                "builds": self.builds,
+                "checks": self.checks,
+                "candidatePairs": self.candidatePairs,
+                "checkSeconds": self.checkSeconds,
+            }
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Keeps the simulation loop on a steady beat. Each tick is
+#              scheduled from the time the loop started instead of from
+#              when the last tick finished, so the time spent working
+#              doesn't add up into drift. Ticks that are missed entirely
+#              are skipped rather than run back to back.
+##############################################################################
+
+import asyncio
+
+
+class TickScheduler(object):
+    """
+    TickScheduler
+    Waits until the next tick of a fixed interval on the event
+    loop's clock.
+    """
+
+    def __init__(self, interval = 1.0):
+        self.interval = interval
+        self.startTime = None
+        self.ticks = 0
+        self.missedTicks = 0
+        self.lastLateness = 0.0
+
+    def start(self):
+        """
+        start
+        Marks now as tick zero.
+        """
+        self.startTime = asyncio.get_running_loop().time()
+        self.ticks = 0
+        self.missedTicks = 0
+        self.lastLateness = 0.0
+
+    async def wait(self):
+        """
+        wait
+        Sleeps until the next tick is due. If the work since the
+        last tick ran late, returns right away, and any ticks that
+        were passed over completely are counted as missed.
+        """
+        loop = asyncio.get_running_loop()
+        if self.startTime == None:
+            self.startTime = loop.time()
+
+        self.ticks += 1
+        now = loop.time()
+        deadline = self.startTime + self.ticks * self.interval
+        if now > deadline:
+            # Run right away, but drop any whole ticks already gone.
+            missed = int((now - deadline) // self.interval)
+            self.missedTicks += missed
+            self.ticks += missed
+            deadline = self.startTime + self.ticks * self.interval
+
+        await asyncio.sleep(max(0.0, deadline - now))
+        self.lastLateness = loop.time() - deadline
+
+    def getStats(self):
+        return {
+            "interval": self.interval,
+            "ticks": self.ticks,
+            "missedTicks": self.missedTicks,
+            "lastLateness": self.lastLateness,
+        }
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P04 - Missile Defence Part 2
+# Date: October 31, 2022
+# Python 3.9.5
+# Project Version: 0.2.0
+#
+# Description: Predicts hostile missile paths in memory. Every missile
+#              that has two radar pings gets its future positions worked
+#              out as NumPy arrays, one point per second, by a swappable
+#              motion model. ThreatZoneCache checks them against the
+#              cities, and InterceptSolver searches them for intercepts,
+#              so nothing has to be written to the database until an
+#              intercept is chosen.
+#
+# Adding a motion model:
+# - Subclass MotionModel and fill in predict.
+# - Call registerMotionModel("name", YourModel()).
+# - Pass motionModel="name" to TrajectoryPredictor.
+##############################################################################
+
+import threading
+import time
+
+import numpy as np
+
+# Uses 1 Degree of Separation = 111,139 meters, like metersToDegreesNA.
+metersPerDegree = 111139.0
+
+
+def pingVelocity(current, previous):
+    """
+    pingVelocity
+    Returns the (M, 3) per second velocity between two (M, 4)
+    arrays of x, y, z, time pings.
+    """
+    timeDifference = current[:, 3] - previous[:, 3]
+    return (current[:, :3] - previous[:, :3]) / timeDifference[:, None]
+
+
+class MotionModel(object):
+    """
+    MotionModel
+    Base for motion models. predict is given (M, 4) arrays of the
+    current and previous x, y, z, time pings and an array of
+    seconds ahead of the current ping, and returns an (M, T, 3)
+    array of predicted positions.
+    """
+
+    def predict(self, current, previous, steps):
+        raise NotImplementedError
+
+
+class LinearMotion(MotionModel):
+    """
+    LinearMotion
+    Keeps the velocity between the two pings, like the original
+    trajectory_prediction table did.
+    """
+
+    def predict(self, current, previous, steps):
+        velocity = pingVelocity(current, previous)
+        return current[:, None, :3] + velocity[:, None, :] * steps[None, :, None]
+
+
+class BallisticMotion(MotionModel):
+    """
+    BallisticMotion
+    Keeps the ground velocity between the two pings, but pulls
+    the altitude down with gravity from the measured climb rate.
+    """
+
+    def __init__(self, gravity = 9.81):
+        # Altitudes are kept in degrees like the ping tables.
+        self.gravity = gravity / metersPerDegree
+
+    def predict(self, current, previous, steps):
+        velocity = pingVelocity(current, previous)
+        positions = current[:, None, :3] + velocity[:, None, :] * steps[None, :, None]
+        positions[:, :, 2] -= 0.5 * self.gravity * steps[None, :] ** 2
+        return positions
+
+
+motionModels = {
+    "linear": LinearMotion(),
+    "ballistic": BallisticMotion(),
+}
+
+
+def registerMotionModel(name, model):
+    """
+    registerMotionModel
+    Makes a motion model available to TrajectoryPredictor by name.
+    """
+    motionModels[name] = model
+
+
+class PredictedTrajectories(object):
+    """
+    PredictedTrajectories
+    Holds the predicted positions of a group of missiles. Row m
+    of positions belongs to missileIds[m], and column t is where
+    it will be at times[t].
+    """
+
+    def __init__(self, missileIds, missileTypes, positions, times):
+        self.missileIds = missileIds
+        self.missileTypes = missileTypes
+        self.positions = positions
+        self.times = times
+
+    def __len__(self):
+        return len(self.missileIds)
+
+
+class TrajectoryPredictor(object):
+    """
+    TrajectoryPredictor
+    Predicts missile paths for predictionCap seconds ahead.
+    """
+
+    def __init__(self, motionModel = "linear", predictionCap = 1000):
+        self.motionModel = motionModel
+        self.predictionCap = predictionCap
+
+        self.statsLock = threading.Lock()
+        self.predictions = 0
+        self.missiles = 0
+        self.predictSeconds = 0.0
+
+    def predict(self, missiles, startTime):
+        """
+        predict
+        Takes the solvable missile dictionaries from
+        RadarSweepIngest and predicts each one a second at a time
+        for predictionCap seconds, the same points the
+        trajectory_prediction table held. Times count up from
+        startTime.
+        """
+        phaseStart = time.perf_counter()
+        model = motionModels[self.motionModel]
+        steps = np.arange(1, int(self.predictionCap), dtype=np.float64)
+
+        if len(missiles) == 0:
+            positions = np.zeros((0, len(steps), 3))
+        else:
+            current = np.array([missile['current'] for missile in missiles], dtype=np.float64)
+            previous = np.array([missile['previous'] for missile in missiles], dtype=np.float64)
+            positions = model.predict(current, previous, steps)
+
+        trajectories = PredictedTrajectories(
+            np.array([missile['missile_id'] for missile in missiles], dtype=np.int64),
+            [missile['missile_type'] for missile in missiles],
+            positions, np.rint(float(startTime) + steps))
+
+        with self.statsLock:
+            self.predictions += 1
+            self.missiles += len(missiles)
+            self.predictSeconds += time.perf_counter() - phaseStart
+        return trajectories
+
+    def getStats(self):
+        with self.statsLock:
+            return {
+                "motionModel": self.motionModel,
+                "predictionCap": self.predictionCap,
+                "predictions": self.predictions,
+                "missiles": self.missiles,
+                "predictSeconds": self.predictSeconds,
+            }
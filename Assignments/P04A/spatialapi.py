@@ -52,6 +52,9 @@
 #   simulation by itself to allow other people to get ready.
 # - When you are ready to begin, run 
 #   "http://localhost:8081/simulationControlLoop"
+#   The simulation runs in the background. Check on it with
+#   "http://localhost:8081/simulationStatus" and end it early with
+#   "http://localhost:8081/stopSimulation"
 # - The simulation will either produce an error message or run until
 #   the arsenal is depleted and then automatically send the messsage
 #   to all attackers to end the simulation. 
@@ -60,7 +63,8 @@
 
 # Libraries for FastAPI
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, FileResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
@@ -74,14 +78,24 @@ import requests
 from math import radians, degrees, cos, sin, asin, sqrt, pow, atan2
 import os
 import json
+import asyncio
 import sys
 import time
 import datetime
+import tempfile
 
 # Local project module
 from module import convertTimeToSecondsSimple, convertTimeFromSecondsNoDate
 from module import convertTimeToSecondsNoDate, convertTimeToSeconds
 from module import convertTimeFromSeconds, convertDateToOtherDate
+from module import getConnectionPool, closeConnectionPools
+from module import RadarSweepIngest, TrajectoryPredictor, InterceptSolver
+from module import AttackerClient, TickScheduler
+from module import FireDispatcher, fireDispatchTableSQL
+from module import ThreatZoneCache
+from module import placeNewBatteries, batteryCoverageReport
+from module import exportTables
+from module import SimulationClock, timeOfDayToEpoch, timeOfDaySeconds
 #from module import missiledbmanager
 
 
@@ -134,6 +148,19 @@ from module import convertTimeFromSeconds, convertDateToOtherDate
 #                             for persistent storage across simulations.
 ##  Columns:                  text attack_address. Also
 ##                            has a serial key.
+# threat_zones:               Every city buffered by a missile class's blast
+#                             radius and unioned together, rebuilt each time
+#                             the region is loaded.
+##  Columns:                  TEXT missile_type, FLOAT radius in degrees,
+##                            Geometry zone.
+# fire_dispatches:            Fire solutions waiting to be sent to an
+#                             attacker, or already sent, with whether the
+#                             attacker acknowledged them.
+##  Columns:                  INT intercept_id, INT missile_id, TEXT url,
+##                            JSONB payload, TEXT status, INT attempts,
+##                            TEXT last_error, TEXT response, and the
+##                            queued_at and finished_at times. Also
+##                            has a serial key.
 ##############################################################################
 
 ### These all would be better not as globals
@@ -157,6 +184,10 @@ athenaIP = None
 # Keeps track of what the simulation timestamp will be.
 simulationTime = 0
 simulationDone = False
+# Background task running the simulation control loop, and the
+# error that stopped it if there was one.
+simulationTask = None
+simulationError = None
 
 # Keeps track of whether this is running as defender, attacker, or athena
 # as well as general team information
@@ -177,8 +208,26 @@ shootEarliest = False
 safetyMargin = 3
 # Determines how many seconds to plan in advance
 predictionCap = 1000
+# Determines how missile paths are predicted from two radar pings.
+# "linear" keeps the measured velocity, "ballistic" adds gravity.
+motionModel = "linear"
+# Number of batteries to place and how to place them. "greedy" covers
+# the most cities, "kmeans" centers on groups of cities, and
+# "cardinal" is the centroid and border layout. Cities within
+# batteryCoverage meters of a battery count as covered.
+batteryCount = 5
+batteryStrategy = "greedy"
+batteryCoverage = 100000
 
 # Simulation internal logic configuration variables
+# Seconds between simulation ticks, and seconds to wait on an attacker
+tickInterval = 1
+attackerTimeout = 5
+# Where simulation time comes from. "local" uses this machine's clock,
+# "attacker" syncs with the first attacker's GET_CLOCK every
+# clockSyncInterval seconds.
+clockSource = "local"
+clockSyncInterval = 5
 # Simulation conversion in meters
 simCatSpeedConversion = 500
 simCatRadiusConversion = 100
@@ -201,38 +250,50 @@ confPath = confDirectory + confPath
 class DatabaseCursor(object):
 
     def __init__(self, conn_config_file):
-        with open(conn_config_file) as config_file:
-            self.conn_config = json.load(config_file)
+        # Config is only parsed the first time the pool is created
+        self.pool = getConnectionPool(conn_config_file)
 
-    # Load object from information from the config file
+    # Check out a pooled connection that already has the schema set
     def __enter__(self):
-        self.conn = psycopg2.connect(
-            "dbname='"
-            + self.conn_config["dbname"]
-            + "' "
-            + "user='"
-            + self.conn_config["user"]
-            + "' "
-            + "host='"
-            + self.conn_config["dbhost"]
-            + "' "
-            + "password='"
-            + self.conn_config["password"]
-            + "' "
-            + "port="
-            + self.conn_config["port"]
-            + " "
-        )
+        self.conn = self.pool.getConnection()
         self.cur = self.conn.cursor()
-        self.cur.execute("SET search_path TO " + self.conn_config["schema"])
 
         return self.cur
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # some logic to commit/rollback
-
-        self.conn.commit()
-        self.conn.close()
+        # Commit like before, but hand the connection back to the
+        # pool instead of closing it. If the block raised, or the
+        # commit fails, everything is rolled back so half a change
+        # is never kept and the next borrower gets a clean connection.
+        try:
+            self.cur.close()
+            if exc_type != None:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+        except psycopg2.Error:
+            if not self.conn.closed:
+                self.conn.rollback()
+            raise
+        finally:
+            self.pool.putConnection(self.conn)
+
+
+# Records each radar sweep in bulk and keeps per phase timings.
+radarSweepIngest = RadarSweepIngest()
+# Predicts missile paths in memory with the chosen motion model.
+trajectoryPredictor = TrajectoryPredictor(motionModel, predictionCap)
+# Assigns interceptors to predicted missile paths.
+interceptSolver = InterceptSolver()
+# Keep-alive connections to attackers and the simulation tick.
+attackerClient = AttackerClient(timeout=attackerTimeout)
+tickScheduler = TickScheduler(tickInterval)
+# Sends fire solutions in the background once they are committed.
+fireDispatcher = FireDispatcher(lambda: DatabaseCursor(confPath), attackerClient.send)
+# City threat zones for each missile class, built when the region loads.
+threatZoneCache = ThreatZoneCache()
+# Simulation time from the monotonic clock, synced in the background.
+simulationClock = SimulationClock(syncInterval=clockSyncInterval)
 
 
 description = \
@@ -258,6 +319,145 @@ async def docs_redirect():
         above in the ApiInfo section."""
     return RedirectResponse(url="/docs")
 
+@app.get("/connectionPoolStats")
+def connectionPoolStats():
+    """
+    connectionPoolStats
+    Returns the database connection pool's settings along with
+    checkout wait times and how many connections are in use.
+    Ex. 
+     http://localhost:8081/connectionPoolStats
+    """
+    try:
+        return getConnectionPool(confPath).getStats()
+    except:
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error.")
+        return "Host database configuration error."
+
+@app.get("/radarSweepStats")
+def radarSweepStats():
+    """
+    radarSweepStats
+    Returns how many radar sweeps and pings have been recorded
+    along with the average and latest seconds spent in each
+    phase of a sweep.
+    Ex. 
+     http://localhost:8081/radarSweepStats
+    """
+    return radarSweepIngest.getStats()
+
+@app.get("/fireDispatchStats")
+def fireDispatchStats():
+    """
+    fireDispatchStats
+    Returns how many fire solutions have been queued, are still
+    being sent, were acknowledged, or failed after every retry.
+    Ex. 
+     http://localhost:8081/fireDispatchStats
+    """
+    return fireDispatcher.getStats()
+
+@app.get("/threatZones")
+def threatZones():
+    """
+    threatZones
+    Returns the buffered city threat zone for every missile class
+    as GeoJSON, along with the class's radius in degrees.
+    Ex. 
+     http://localhost:8081/threatZones
+    """
+    try:
+        with DatabaseCursor(confPath) as cur:
+            return threatZoneCache.zones(cur)
+    except:
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error or missing threat zones.")
+        return "Host database configuration error or missing threat zones."
+
+@app.get("/threatZones/{missileType}")
+def threatZone(missileType):
+    """
+    threatZone
+    Returns the buffered city threat zone for one missile class.
+    Ex. 
+     http://localhost:8081/threatZones/Atlas
+    """
+    try:
+        with DatabaseCursor(confPath) as cur:
+            return threatZoneCache.zones(cur, missileType)
+    except:
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error or missing threat zones.")
+        return "Host database configuration error or missing threat zones."
+
+@app.get("/threatZoneStats")
+def threatZoneStats():
+    """
+    threatZoneStats
+    Returns how many cities and missile classes are cached and
+    how many paths have been checked against them.
+    Ex. 
+     http://localhost:8081/threatZoneStats
+    """
+    return threatZoneCache.getStats()
+
+@app.get("/trajectoryStats")
+def trajectoryStats():
+    """
+    trajectoryStats
+    Returns the motion model in use along with how many missiles
+    have had their paths predicted and interceptors assigned, and
+    the time spent doing so.
+    Ex. 
+     http://localhost:8081/trajectoryStats
+    """
+    stats = trajectoryPredictor.getStats()
+    stats["interceptSolver"] = interceptSolver.getStats()
+    return stats
+
+@app.get("/exportPingsGeoPackage")
+def exportPingsGeoPackage():
+    """
+    exportPingsGeoPackage
+    Exports the active and solved missile pings and the logged
+    intercepts as one GeoPackage file that can be opened
+    directly in QGIS for replays. Geometry is kept as WKB and
+    rows are copied in batches, so memory stays flat.
+    Ex. 
+     http://localhost:8081/exportPingsGeoPackage
+    """
+    handle, path = tempfile.mkstemp(suffix = ".gpkg")
+    os.close(handle)
+    # The writer creates the file itself.
+    os.remove(path)
+
+    pool = getConnectionPool(confPath)
+    conn = pool.getConnection()
+    try:
+        exportTables(conn, ["active_missile_pings", "solved_missile_pings", "logged_intercepts"], path)
+    except:
+        if not conn.closed:
+            conn.rollback()
+        if os.path.exists(path):
+            os.remove(path)
+        if(simulationDebugLevel > 0):
+            print("Host database configuration error or invalid column field.")
+        return ("Host database configuration error or invalid column field.")
+    finally:
+        pool.putConnection(conn)
+
+    return FileResponse(path, media_type = "application/geopackage+sqlite3",
+        filename = "pings.gpkg", background = BackgroundTask(os.remove, path))
+
+@app.on_event("shutdown")
+def closeConnectionPool():
+    """
+    closeConnectionPool
+    Closes pooled database connections when the server stops.
+    """
+    closeConnectionPools()
+
 
 
 ##############################################################################
@@ -371,167 +571,58 @@ def createFiveBatteries():
     """
     createFiveBatteries
     Creates a battery on the centroid of the 
-    region. Then creates a batter directly to
-    the four cardinal directions of the centroid.
+    region. Then creates a battery where lines
+    going north, east, south, and west of the
+    centroid cross the border.
 
-    Note: Generates exactly on the
-    border, but probably won't work if the bounding
-    box is too large, and may have undefined 
-    behavior if two points of the geometry border
-    intersect a line going straight
-    from the center of the region for unusual
-    shaped regions.
+    Note: Uses the cardinal strategy of
+    placeBatteries, so the region is only read
+    once. Unusual shaped regions that cross a
+    line more than once get the middle of the
+    crossings.
 
     Ex. 
      http://localhost:8081/createFiveBatteries
     """
+    return placeBatteries(5, "cardinal")
+
+@app.get("/placeBatteries/{count}")
+def placeBatteries(count: int = batteryCount, strategy: str = batteryStrategy):
+    """
+    placeBatteries
+    Replaces the region's batteries with count
+    new ones. The strategy is "greedy" to cover
+    the most cities, "kmeans" to sit in the
+    middle of groups of cities, or "cardinal"
+    for the centroid and border layout. Returns
+    how many cities end up covered.
+
+    Ex. 
+     http://localhost:8081/placeBatteries/8?strategy=kmeans
+    """
     try:
         with DatabaseCursor(confPath) as cur:
-            # Check if at least one missile remains.
-            sql = \
-            f"""
-                /* Center Battery */
-                INSERT INTO points_of_interest (point_id, point_category, point_geometry) VALUES (-1, 'Battery',
-                        ST_SetSRID(ST_MakePoint(ST_X(ST_Centroid((SELECT boundary from assigned_regions LIMIT 1))), ST_Y(ST_Centroid((SELECT boundary from assigned_regions LIMIT 1))), 0), 4326));
-
-                /* North Border Battery */
-                INSERT INTO points_of_interest (point_id, point_category, point_geometry) VALUES (-2, 'Battery',
-                        ST_SetSRID(ST_MakePoint(
-							ST_X(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-												ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)), 
-												90
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 
-							ST_Y(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-												ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)), 
-												90
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 0), 4326));
-
-                /* South Border Battery */
-                INSERT INTO points_of_interest (point_id, point_category, point_geometry) VALUES (-3, 'Battery',
-                        ST_SetSRID(ST_MakePoint(
-							ST_X(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-												ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)), 
-												-90
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 
-							ST_Y(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-												ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)), 
-												-90
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 0), 4326));
-
-                /* East Border Battery */
-                INSERT INTO points_of_interest (point_id, point_category, point_geometry) VALUES (-4, 'Battery',
-                        ST_SetSRID(ST_MakePoint(
-							ST_X(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-                                                ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)) + 180, 
-                                                ST_Y((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1))
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 
-							ST_Y(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-                                                ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)) + 180, 
-                                                ST_Y((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1))
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 0), 4326));
-
-                /* West Border Battery */
-                INSERT INTO points_of_interest (point_id, point_category, point_geometry) VALUES (-5, 'Battery',
-                        ST_SetSRID(ST_MakePoint(
-							ST_X(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-                                                ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)) - 180, 
-                                                ST_Y((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1))
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 
-							ST_Y(
-								(SELECT ST_Centroid(ST_Intersection
-									(
-										ST_Boundary(boundary), 
-										ST_MakeLine
-										(
-											(SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1), 
-											ST_SetSRID(ST_MakePoint
-											(
-                                                ST_X((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1)) - 180, 
-                                                ST_Y((SELECT ST_Centroid(boundary) FROM assigned_regions LIMIT 1))
-											), 4326)
-										)
-									))::Geometry(Point, 4326)
-									FROM assigned_regions LIMIT 1)), 0), 4326));
-            """
+            return placeNewBatteries(cur, count, strategy,
+                metersToDegreesNA(batteryCoverage))
 
-            cur.execute(sql)
+    except:
+        if(simulationDebugLevel > 1):
+            print ("Host database configuration error or invalid region.")
+        return "Host database configuration error or invalid region."
+
+@app.get("/batteryCoverage")
+def getBatteryCoverage():
+    """
+    getBatteryCoverage
+    Returns how many cities are within reach
+    of the batteries already placed.
+
+    Ex. 
+     http://localhost:8081/batteryCoverage
+    """
+    try:
+        with DatabaseCursor(confPath) as cur:
+            return batteryCoverageReport(cur, metersToDegreesNA(batteryCoverage))
 
     except:
         if(simulationDebugLevel > 1):
@@ -542,18 +633,44 @@ def createFiveBatteries():
 def attackerClockRequest():
     """
     attackerClockRequest
-    Sends a request to attacker for the current simulation time.
+    Returns the attacker's current time of day in seconds. When
+    the simulation clock is synced with the attacker, the defender
+    answers from it instead of asking the attacker each time.
     Ex. 
      http://localhost:8081/attackerClockRequest
     """
     # Return current time if attacker
     if(simulationMode == "attacker"):
         return {"time": convertTimeFromSecondsNoDate(simulationTime)}
-    # Defender instead requests time from first attacker
+    # Defender answers from the clock synced with the attacker
+    if(simulationClock.source == attackerClockSeconds):
+        return str(simulationClock.timeOfDay())
+    # Otherwise it asks the first attacker
     url = "http://" + attackerIPs[0] + "/GET_CLOCK"
-    tempTime = json.loads(requests.get(url).content)
+    tempTime = json.loads(attackerClient.send("GET", url))
     return convertTimeToSecondsSimple(tempTime['time'])
 
+def attackerClockSeconds():
+    """
+    attackerClockSeconds
+    Asks the first attacker for its clock and returns it as a
+    POSIX timestamp. Only used by the simulation clock's syncs.
+    """
+    url = "http://" + attackerIPs[0] + "/GET_CLOCK"
+    tempTime = json.loads(attackerClient.send("GET", url))
+    return timeOfDayToEpoch(timeOfDaySeconds(tempTime['time']))
+
+@app.get("/clockStats")
+def clockStats():
+    """
+    clockStats
+    Returns the simulation clock's offset, round trip times, and
+    drift from its last syncs.
+    Ex. 
+     http://localhost:8081/clockStats
+    """
+    return simulationClock.getStats()
+
 
 def metersToDegreesNA(inMeters):
     """
@@ -617,318 +734,190 @@ def radar_sweep():
     Ex. 
      http://localhost:8081/RADAR_SWEEP
     """
+    # Iterate through attackers. An attacker that can't be reached
+    # is skipped so the others are still recorded.
+    radarSweeps = []
+    for index in range(0, len(attackerIPs)):
+        try:
+            # Select attackers to query
+            url = "http://" + attackerIPs[index] + "/RADAR_SWEEP"
+            radarSweeps.append(json.loads(attackerClient.send("GET", url)))
+        except:
+            if(simulationDebugLevel > 0):
+                print("Error contacting attacker server for radar sweep.")
+            radarSweeps.append(None)
+
+    return processRadarSweeps(radarSweeps)
+
+
+def processRadarSweeps(radarSweeps):
+    """
+    processRadarSweeps
+    Records the radar sweeps collected from the attackers and fires
+    at every missile that can now be intercepted. radarSweeps holds
+    one sweep per attacker in the same order as attackerIPs, with
+    None for any attacker that couldn't be reached.
+    """
     if(simulationDebugLevel > 1):
         print("Team ID: ")
         print(teamID)
 
-    shootBuffer = "0"
+    shootBuffer = 0
     if(not shootEarliest):
         shootBuffer = safetyMargin
-        shootOrder = "DESC"
-    else:
-        shootBuffer = "0"
-        shootOrder = "ASC"
 
     # Carry out SQL queries in database.
     try:
         # Iterate through attackers
-        for index in range(0, len(attackerIPs)):
-            radarTuple = ('N/A')
-            try:
-                # Select attackers to query
-                url = "http://" + attackerIPs[index] + "/RADAR_SWEEP"
-                radarTuple =  json.loads(requests.get(url).content)
-            except:
-                if(simulationDebugLevel > 0):
-                    print("Error contacting attacker server for radar sweep.")
-                return "Error contacting attacker server for radar sweep."
+        for index in range(0, len(radarSweeps)):
+            radarTuple = radarSweeps[index]
 
             # Make sure the radar sweep isn't empty
-            if('N/A' in radarTuple):
-                break
+            if(radarTuple == None or 'N/A' in radarTuple):
+                continue
+
+            # The whole sweep is recorded in one transaction. Solved and
+            # new missiles are handled in bulk, and only missiles seen
+            # for the second time are left to plan interceptions for.
+            dispatches = []
+            with DatabaseCursor(confPath) as cur:
+                sweep = radarSweepIngest.ingest(cur, radarTuple['features'])
 
+                if(len(sweep['solvable']) > 0):
+                    if(simulationDebugLevel > 1):
+                        print("Beginning interception planning")
+
+                    # Grab batteries and missile specs once per sweep.
+                    sql = \
+                        f"""
+                            SELECT ST_X(point_geometry), ST_Y(point_geometry), ST_Z(point_geometry)
+                            FROM points_of_interest WHERE point_category = 'Battery';
+                        """
+                    cur.execute(sql)
+                    batteries = cur.fetchall()
 
-            # Iterate through all elements of the returned tuple and process them.
-            for inIndex in range(0, len(radarTuple['features'])):
+                    # Cities don't change during a game, so their threat
+                    # zones are only read in if the server restarted.
+                    # Older databases get the table built here.
+                    if(not threatZoneCache.loaded):
+                        threatZoneCache.load(cur, metersToDegreesNA(simCatRadiusConversion))
 
-                with DatabaseCursor(confPath) as cur:
-                    # Check if this missile was solved
-                    missilesInSolved = 0
                     sql = \
                         f"""
-                            SELECT COUNT(missile_id) FROM solved_missile_pings WHERE missile_id = {str(radarTuple['features'][inIndex]['id'])};
+                            SELECT classification_label, speed_category, radius_category FROM missile_spec_key;
                         """
                     cur.execute(sql)
-                    missilesInSolved = int(cur.fetchone()[0])
+                    missileSpecs = {}
+                    for spec in cur.fetchall():
+                        missileSpecs[spec[0]] = (spec[1], spec[2])
 
-                    # Just ignore and update solved if this missile is already solved. Either it can't be stopped,
-                    # it's not a threat, or an interception is already launched.
-                    if (missilesInSolved > 0):
+                    # Collect interception inventory
+                    sql = \
+                        f"""
+                            SELECT missile_name, missile_count FROM missile_inventory WHERE missile_count > 0 ORDER BY missile_count DESC;
+                        """
+                    cur.execute(sql)
+                    inventory = {}
+                    for item in cur.fetchall():
+                        inventory[item[0]] = int(item[1])
+
+                    # Predict every missile at once, one second at a time.
+                    trajectories = trajectoryPredictor.predict(sweep['solvable'], simulationTime)
+
+                    # Find missiles that will intersect a city.
+                    # Only used if not altruist
+                    threatened = threatZoneCache.threatened(trajectories)
+
+                    # Choose interceptors for every missile at once without
+                    # going over the inventory.
+                    interceptors = {}
+                    for interceptType in inventory:
+                        if(interceptType in missileSpecs):
+                            interceptors[interceptType] = (float(convertSpeedMetersToDegree(missileSpecs[interceptType][0])),
+                                inventory[interceptType])
+                    targets = None
+                    if(altruist == False):
+                        targets = threatened
+                        if(simulationDebugLevel > 1):
+                            print("Ignoring " + str(len(threatened) - int(threatened.sum())) + " low threat hostile missiles.")
+                    assignments = interceptSolver.solve(trajectories, batteries, interceptors,
+                        simulationTime, float(shootBuffer), shootEarliest, targets)
+
+                    for intercept in assignments:
+                        if(simulationDebugLevel > 1):
+                            print("Attempting to fire a missile.")
+
+                        startDate = convertDateToOtherDate(convertTimeFromSeconds(intercept['launch_time']))
+                        endDate = convertDateToOtherDate(convertTimeFromSeconds(intercept['hit_time']))
+
+                        ##############
+                        # Send missile launch to attacker
+                        # USE THE fire solution route
+                        # Create URL, header, and json payload
+                        url = "http://" + attackerIPs[index] + "/FIRE_SOLUTION"
+                        payload = json.dumps({
+                        "team_id": int(teamID), 
+                        "target_missile_id": int(intercept['missile_id']),
+                        "missile_type": str(intercept['interceptor']),
+                        "fired_time": str(startDate),
+                        "firedfrom_lat": float(intercept['battery'][1]),
+                        "firedfrom_lon": float(intercept['battery'][0]),
+                        "aim_lat": float(intercept['point'][1]),
+                        "aim_lon": float(intercept['point'][0]),
+                        "expected_hit_time": str(endDate),
+                        "target_alt": float(degreesToMetersNA(intercept['point'][2]))
+                        })
+
+                        print(payload)
+
+                        # Move missile into logs
                         sql = \
                             f"""
-                                INSERT INTO solved_missile_pings (intersects, time_code, missile_type, missile_id) VALUES 
-                                    (ST_SetSRID(ST_MakePoint({str(radarTuple['features'][inIndex]['geometry']['coordinates'][0])}, {str(radarTuple['features'][inIndex]['geometry']['coordinates'][1])}, {str(metersToDegreesNA(radarTuple['features'][inIndex]['properties']['altitude']))}), 4326), 
-                                    {str(convertTimeToSecondsSimple(radarTuple['features'][inIndex]['properties']['current_time']))}, '{str(radarTuple['features'][inIndex]['properties']['missile_type'])}', {str(radarTuple['features'][inIndex]['id'])});
+                                INSERT INTO logged_intercepts (intersects, time_code, missile_type, missile_id) VALUES 
+                                    (ST_SetSRID(ST_MakePoint(%s, %s, %s), 4326), %s, %s, %s)
+                                RETURNING id;
                             """
-                        cur.execute(sql)
-                    else:
-                        # Check if this missile can now be solved
-                        missilesInActive = 0
+                        cur.execute(sql, (intercept['point'][0], intercept['point'][1], intercept['point'][2],
+                            int(intercept['hit_time']), intercept['interceptor'], intercept['missile_id']))
+                        interceptId = cur.fetchone()[0]
+                        if(simulationDebugLevel > 1):
+                           print("Logged intersection")
+
+                        # Queue the fire solution. It is sent once this
+                        # sweep's transaction commits.
+                        dispatches.append(fireDispatcher.enqueue(cur, interceptId,
+                            intercept['missile_id'], url, payload))
+
+
+                        ##############
+                        # Decrement relevant missile inventory.
                         sql = \
                             f"""
-                                SELECT COUNT(missile_id) FROM active_missile_pings WHERE missile_id = {str(radarTuple['features'][inIndex]['id'])};
+                                UPDATE missile_inventory SET missile_count = missile_count - 1 WHERE missile_name = %s;
                             """
-                        cur.execute(sql)
-                        missilesInActive = int(cur.fetchone()[0])
-
-                        # Check if this missile can now be solved
-                        if(missilesInActive > 0):
-                            if(simulationDebugLevel > 1):
-                                print("Beginning an interception planning")
-                            # Grab info on current location
-                            sql = \
-                                f"""
-                                    SELECT ST_X(intersects), ST_Y(intersects), ST_Z(intersects), time_code, missile_type, missile_id from active_missile_pings;
-                                """
-                            cur.execute(sql)
-                            previousMissileSpot = cur.fetchone()
-                                
-                            # Grab info on current missile type
-                            sql = \
-                                f"""
-                                    SELECT (radius_category * {str(metersToDegreesNA(simCatRadiusConversion))}) FROM missile_spec_key WHERE classification_label = '{str(previousMissileSpot[4])}';
-                                """
-                            cur.execute(sql)
-                            previousMissileType = cur.fetchone()[0]
-                            # Calculate missile velocity vectors
-                            timeDifference = (float(convertTimeToSecondsSimple(radarTuple['features'][inIndex]['properties']['current_time'])) - float(previousMissileSpot[3]))
-                            xSpeed = (float(radarTuple['features'][inIndex]['geometry']['coordinates'][0]) - float(previousMissileSpot[0])) / timeDifference
-                            ySpeed = (float(radarTuple['features'][inIndex]['geometry']['coordinates'][1]) - float(previousMissileSpot[1])) / timeDifference
-                            zSpeed = (metersToDegreesNA(radarTuple['features'][inIndex]['properties']['altitude']) - float(previousMissileSpot[2])) / timeDifference
-
-                            # Collect interception inventory
-                            sql = \
-                                f"""
-                                    SELECT missile_name FROM missile_inventory WHERE missile_count > 0 ORDER BY missile_count DESC;
-                                """
-                            cur.execute(sql)
-                            interceptionMissileTypes = cur.fetchall()
-
-                            # Interpolate points in advance one second at a time.
-                            sql = \
-                                f"""
-                                    DROP TABLE IF EXISTS trajectory_prediction;
-                                    CREATE TABLE trajectory_prediction (id SERIAL PRIMARY KEY, intersects geometry, time_code INT, missile_type TEXT, missile_id INT); 
-                                    DO $$
-                                        DECLARE count INTEGER := 1;
-                                        DECLARE prediction_cap FLOAT := {str(predictionCap)};
-                                        DECLARE geo_x FLOAT := {str(radarTuple['features'][inIndex]['geometry']['coordinates'][0])};
-                                        DECLARE geo_y FLOAT := {str(radarTuple['features'][inIndex]['geometry']['coordinates'][1])};
-                                        DECLARE geo_z FLOAT := {str(metersToDegreesNA(radarTuple['features'][inIndex]['properties']['altitude']))};
-                                        DECLARE delta_x FLOAT := {str(xSpeed)};
-                                        DECLARE delta_y FLOAT := {str(ySpeed)};
-                                        DECLARE delta_z FLOAT := {str(zSpeed)};
-                                    BEGIN
-                                    WHILE (count < prediction_cap) LOOP
-                                            INSERT INTO trajectory_prediction (intersects, time_code, missile_type, missile_id) VALUES 
-                                                (ST_SetSRID(ST_MakePoint(geo_x + (delta_x * count), geo_y + (delta_y * count), geo_z + (delta_z * count)), 4326), 
-                                                {str(simulationTime)} + count, '{str(radarTuple['features'][inIndex]['properties']['missile_type'])}', {str(radarTuple['features'][inIndex]['id'])});
-                                            count := count + 1;
-                                    END LOOP;
-                                    END$$;
-
-                                    /* Insert indices last to not slow point creation by rebuilding. */
-                                    CREATE INDEX trajectory_index
-                                    ON trajectory_prediction 
-                                    USING gist(intersects);
-                                """
-                            cur.execute(sql)
-
-                            # Ignore missile if it won't intersect a city.
-                            # Only if not altruist
-                            intersectsCharge = 1
-                            sql = \
-                                f"""
-                                    SELECT count(points_of_interest.point_geometry)
-                                        FROM 
-                                            points_of_interest, trajectory_prediction
-                                        WHERE
-                                            point_category != 'Battery' AND
-                                            ST_Intersects(ST_Buffer(points_of_interest.point_geometry, 
-                                                {str(metersToDegreesNA(simCatRadiusConversion))} * 
-                                                (SELECT radius_category FROM missile_spec_key WHERE missile_spec_key.classification_label = 
-                                                '{str(radarTuple['features'][inIndex]['properties']['missile_type'])}')), 
-                                                trajectory_prediction.intersects);
-                                """
-                            cur.execute(sql)
-
-                            intersectsCharge = cur.fetchone()[0]
-                            if(altruist == False and intersectsCharge == 0):
-                                if(simulationDebugLevel > 1):
-                                    print("Ignoring a low threat hostile missile.")
-                                sql = \
-                                    f"""
-                                        INSERT INTO solved_missile_pings (intersects, time_code, missile_type, missile_id) VALUES 
-                                            (ST_SetSRID(ST_MakePoint({str(radarTuple['features'][inIndex]['geometry']['coordinates'][0])}, {str(radarTuple['features'][inIndex]['geometry']['coordinates'][1])}, {str(metersToDegreesNA(radarTuple['features'][inIndex]['properties']['altitude']))}), 4326), 
-                                            {str(simulationTime)}, '{str(radarTuple['features'][inIndex]['properties']['missile_type'])}', {str(radarTuple['features'][inIndex]['id'])});
-                                        DELETE FROM active_missile_pings WHERE missile_id = {str(radarTuple['features'][inIndex]['id'])}
-                                    """
-                                cur.execute(sql)
-                                break
-
-                            for interIndex in range(0, len(interceptionMissileTypes)):
-                                interceptSpeed = 0
-                                interceptRadius = 0
-                                # Collect interception inventory
-                                sql = \
-                                    f"""
-                                        SELECT speed_category, radius_category * {str(metersToDegreesNA(simCatRadiusConversion))} FROM missile_spec_key WHERE classification_label = '{str(interceptionMissileTypes[interIndex][0])}';
-                                    """
-                                cur.execute(sql)
-                                interceptionMissileSpec = cur.fetchone()
-                                interceptSpeed = convertSpeedMetersToDegree(interceptionMissileSpec[0])
-                                interceptRadius = interceptionMissileSpec[1]
-
-                                if(simulationDebugLevel > 1):
-                                    print("Queried possible missile specs.")
-
-                                ##############
-                                # Calculate intersects
-                                # Returns row in this order (Final Long, Final Lat, Final Alt, Launch Time, Explosion Time, targeted missile id)
-                                sql = \
-                                    f"""
-                                        SELECT ST_X(trajectory_prediction.intersects), ST_Y(trajectory_prediction.intersects),ST_Z(trajectory_prediction.intersects), 
-                                            trajectory_prediction.time_code - (ST_3DDistance(
-                                                (SELECT point_geometry FROM points_of_interest WHERE point_category = 'Battery' 
-                                                    ORDER BY ST_3DDistance(point_geometry, trajectory_prediction.intersects) ASC LIMIT 1), 
-                                                trajectory_prediction.intersects) /  {str(interceptSpeed)}),
-											trajectory_prediction.time_code, trajectory_prediction.missile_id
-                                        FROM trajectory_prediction 
-										WHERE 
-                                            /* Ensure missile is above ground */
-                                            ST_Z(trajectory_prediction.intersects) >= 0
-                                            AND
-                                            /* Ensure missile wouldn't have passed by this time. */
-                                            (trajectory_prediction.time_code - {str(simulationTime)} - {str(shootBuffer)}) >= 
-                                            (ST_3DDistance(
-                                                (SELECT point_geometry FROM points_of_interest WHERE point_category = 'Battery' 
-                                                    ORDER BY ST_3DDistance(point_geometry, trajectory_prediction.intersects) ASC LIMIT 1), 
-                                                trajectory_prediction.intersects) 
-                                                / {str(interceptSpeed)})
-                                        ORDER BY time_code {shootOrder} LIMIT 1;
-                                    """
-                                cur.execute(sql)
-                                missileCoordinate = cur.fetchone()
-
-                                # Send this missile if it will work, missiles are checked in preference to send, preferring high quantity first
-                                if(missileCoordinate != None):
-                                    # Returns row in this order (Initial intercept Long, Initial intercept Lat)
-                                    sql = \
-                                        f"""
-                                            SELECT ST_X(points_of_interest.point_geometry), ST_Y(points_of_interest.point_geometry)
-                                            FROM points_of_interest 
-                                            WHERE 
-                                                /* Ensure missile is above ground */
-                                                points_of_interest.point_category = 'Battery'
-                                                ORDER BY ST_3DDistance(points_of_interest.point_geometry, 
-                                                    ST_SetSRID(ST_MakePoint({str(missileCoordinate[0])}, 
-                                                        {str(missileCoordinate[1])}, 
-                                                        {str(missileCoordinate[2])}), 4326)) ASC LIMIT 1;
-                                        """
-                                    cur.execute(sql)
-                                    interceptBaseCoordinate = cur.fetchone()
-
-                                    if(simulationDebugLevel > 1):
-                                        print("Attempting to fire a missile.")
-
-                                    startDate = convertDateToOtherDate(convertTimeFromSeconds(missileCoordinate[3]))
-                                    endDate = convertDateToOtherDate(convertTimeFromSeconds(missileCoordinate[4]))
-
-                                    ##############
-                                    # Send missile launch to attacker
-                                    # USE THE fire solution route
-                                    # Create URL, header, and json payload
-                                    url = "http://" + attackerIPs[index] + "/FIRE_SOLUTION"
-                                    payload = json.dumps({
-                                    "team_id": int(teamID), 
-                                    "target_missile_id": int(missileCoordinate[5]),
-                                    "missile_type": str(interceptionMissileTypes[interIndex][0]),
-                                    "fired_time": str(startDate),
-                                    "firedfrom_lat": float(interceptBaseCoordinate[1]),
-                                    "firedfrom_lon": float(interceptBaseCoordinate[0]),
-                                    "aim_lat": float(missileCoordinate[1]),
-                                    "aim_lon": float(missileCoordinate[0]),
-                                    "expected_hit_time": str(endDate),
-                                    "target_alt": float(degreesToMetersNA(missileCoordinate[2]))
-                                    })
-
-                                    headers = {
-                                    'Content-Type': 'application/json'
-                                    }
-                                    print(payload)
-
-                                    # Send request
-                                    response = requests.request("POST", url, headers=headers, data=payload).content
-
-
-                                    if(simulationDebugLevel > 1):
-                                        print("Missile notification sent to attacker.")
-                                        print(response)
-
-                                    # Move missile into logs
-                                    sql = \
-                                        f"""
-                                            INSERT INTO logged_intercepts (intersects, time_code, missile_type, missile_id) VALUES 
-                                                (ST_SetSRID(ST_MakePoint({str(missileCoordinate[0])}, {str(missileCoordinate[1])}, {str(missileCoordinate[2])}), 4326), 
-                                                {str(missileCoordinate[4])}, '{str(interceptionMissileTypes[interIndex][0])}', {str(missileCoordinate[5])});
-                                        """
-                                    cur.execute(sql)
-                                    if(simulationDebugLevel > 1):
-                                       print("Logged intersection")
-
-
-                                    ##############
-                                    # Decrement relevant missile inventory and break loop.
-                                    sql = \
-                                        f"""
-                                            UPDATE missile_inventory SET missile_count = missile_count - 1 WHERE missile_name = '{str(interceptionMissileTypes[interIndex][0])}';
-                                        """
-                                    cur.execute(sql)
-                                    interIndex = len(interceptionMissileTypes) + 1
-                                    break
-
-                            # Move missile into solved and delete old records from active missile database.
-                            sql = \
-                                f"""
-                                    INSERT INTO solved_missile_pings (intersects, time_code, missile_type, missile_id) VALUES 
-                                        (ST_SetSRID(ST_MakePoint({str(radarTuple['features'][inIndex]['geometry']['coordinates'][0])}, {str(radarTuple['features'][inIndex]['geometry']['coordinates'][1])}, {str(metersToDegreesNA(radarTuple['features'][inIndex]['properties']['altitude']))}), 4326), 
-                                        {str(convertTimeToSecondsSimple(radarTuple['features'][inIndex]['properties']['current_time']))}, '{str(radarTuple['features'][inIndex]['properties']['missile_type'])}', {str(radarTuple['features'][inIndex]['id'])});
-                                    DELETE FROM active_missile_pings WHERE missile_id = {str(radarTuple['features'][inIndex]['id'])}
-                                """
-                            cur.execute(sql)
-                            
-                        else:
-                            # Nothing more can be done yet but record this missile as active.
-                            sql = \
-                                f"""
-                                    INSERT INTO active_missile_pings (intersects, time_code, missile_type, missile_id) VALUES 
-                                        (ST_SetSRID(ST_MakePoint({str(radarTuple['features'][inIndex]['geometry']['coordinates'][0])}, {str(radarTuple['features'][inIndex]['geometry']['coordinates'][1])}, {str(metersToDegreesNA(radarTuple['features'][inIndex]['properties']['altitude']))}), 4326), 
-                                        {str(convertTimeToSecondsSimple(radarTuple['features'][inIndex]['properties']['current_time']))}, '{str(radarTuple['features'][inIndex]['properties']['missile_type'])}', {str(radarTuple['features'][inIndex]['id'])});
-                                """
-                            cur.execute(sql)
+                        cur.execute(sql, (intercept['interceptor'],))
+
+                # Move every planned missile into solved and delete old
+                # records from active missile database at once.
+                radarSweepIngest.settle(cur, [missile['missile_id'] for missile in sweep['solvable']],
+                    sweep['timings'])
+
+            # Send this sweep's fire solutions to the attacker now that
+            # they are committed.
+            fireDispatcher.submit(dispatches)
+            if(simulationDebugLevel > 1):
+                print("Missile notifications queued for attacker.")
 
-            # Execute final constructed statement to add to database.
-            #cur.execute(sql)
             if(simulationDebugLevel > 1):
                 print("Radar sweep processed")
-            return "Radar sweep processed."
+                print(sweep['timings'])
+        return "Radar sweep processed."
     except:
         if(simulationDebugLevel > 0):
             print("Error in generating reponse to radar sweep.")
         return ("Host database configuration error, connection error, or invalid column field.")
 
 
-
 @app.get("/defenderSimulationDoneCheck")
 def defenderSimulationDoneCheck():
     """
@@ -959,47 +948,164 @@ def defenderSimulationDoneCheck():
         print ("Host database configuration error or invalid column field. Ending simulation.")
 
 
-@app.get("/simulationControlLoop")
-async def simulationControlLoop():
+async def runSimulationLoop():
     """
-    simulationControlLoop
-    Repeats simulation control loop until athena says end simulation
-    Example syntax: 
-     http://localhost:8081/simulationControlLoop
+    runSimulationLoop
+    Runs the simulation as a background task until the arsenal is
+    depleted or the simulation is stopped. Every tick asks all
+    attackers for their radar sweeps at once, then records them
+    and fires on a worker thread so the event loop stays free.
     """
+    global simulationTime
+    global simulationDone
+    global simulationError
+    simulationDone = False
+    simulationError = None
+
     # Send attackers the simulation begin signal.
     if(simulationDebugLevel > 1):
         print("Beginning simulation session.")
-    for index in range(0, len(attackerIPs)):
-        url = "http://" + attackerIPs[index] + "/START/" + str(teamID)
-        requests.get(url)
-
-    while (defenderSimulationDoneCheck() == False):
-        # Grab updated time
-        global simulationTime
-        #simulationTime = attackerClockRequest()
-        simulationTime = convertTimeToSeconds(str(datetime.datetime.now()))
-        if(simulationDebugLevel > 1):
-            print(simulationTime)
+    await attackerClient.getAll(["http://" + address + "/START/" + str(teamID) for address in attackerIPs])
 
-        # Iterate through attackers to process radar sweeps
-        for index in range(0, len(attackerIPs)):
-            radar_sweep()
-            pass
+    # Keep the clock synced in the background for the whole run.
+    simulationClock.source = None
+    if(clockSource == "attacker" and len(attackerIPs) > 0):
+        simulationClock.source = attackerClockSeconds
+    # Sync once up front so the first ticks don't use a stale offset
+    await asyncio.to_thread(simulationClock.sync)
+    clockTask = asyncio.create_task(simulationClock.run())
 
-        # Sleep one second
-        time.sleep(1)
-
-    # Send attackers the simulation end signal.
-    for index in range(0, len(attackerIPs)):
-        url = "http://" + attackerIPs[index] + "/QUIT/" + str(teamID)
-        requests.get(url)
+    tickScheduler.start()
+    try:
+        while (await asyncio.to_thread(defenderSimulationDoneCheck) == False):
+            # Grab updated time
+            simulationTime = simulationClock.now()
+            if(simulationDebugLevel > 1):
+                print(simulationTime)
+
+            # Ask every attacker for its radar sweep at the same time
+            responses = await attackerClient.getAll(["http://" + address + "/RADAR_SWEEP" for address in attackerIPs])
+            radarSweeps = []
+            for response in responses:
+                if(isinstance(response, Exception)):
+                    if(simulationDebugLevel > 0):
+                        print("Error contacting attacker server for radar sweep.")
+                    radarSweeps.append(None)
+                else:
+                    radarSweeps.append(json.loads(response))
+
+            # Process radar sweeps from every attacker
+            await asyncio.to_thread(processRadarSweeps, radarSweeps)
+
+            # Wait for the next tick
+            await tickScheduler.wait()
+    except asyncio.CancelledError:
+        if(simulationDebugLevel > 1):
+            print("Simulation stopped.")
+        raise
+    except Exception as error:
+        simulationError = str(error)
+        if(simulationDebugLevel > 0):
+            print("Simulation control loop failure.")
+    finally:
+        clockTask.cancel()
+        # Send attackers the simulation end signal.
+        simulationDone = True
+        await attackerClient.getAll(["http://" + address + "/QUIT/" + str(teamID) for address in attackerIPs])
 
     if(simulationDebugLevel > 1):
         print("Finished simulation session.")
     return "Finished simulation."
 
 
+@app.get("/startSimulation")
+async def startSimulation():
+    """
+    startSimulation
+    Starts the simulation control loop in the background and
+    returns right away. The loop runs until athena says end
+    simulation, the arsenal runs out, or stopSimulation is called.
+    Example syntax: 
+     http://localhost:8081/startSimulation
+    """
+    global simulationTask
+    if(simulationTask != None and not simulationTask.done()):
+        return "Simulation already running."
+    # Send anything left queued by an earlier run first.
+    try:
+        await asyncio.to_thread(fireDispatcher.resumePending)
+    except:
+        if(simulationDebugLevel > 0):
+            print("Error resuming queued fire solutions.")
+    simulationTask = asyncio.create_task(runSimulationLoop())
+    return "Simulation started."
+
+
+@app.get("/simulationControlLoop")
+async def simulationControlLoop():
+    """
+    simulationControlLoop
+    Repeats simulation control loop until athena says end simulation.
+    Kept for existing instructions, this is the same as startSimulation.
+    Example syntax: 
+     http://localhost:8081/simulationControlLoop
+    """
+    return await startSimulation()
+
+
+@app.get("/stopSimulation")
+async def stopSimulation():
+    """
+    stopSimulation
+    Stops a running simulation control loop and sends attackers
+    the simulation end signal.
+    Example syntax: 
+     http://localhost:8081/stopSimulation
+    """
+    if(simulationTask == None or simulationTask.done()):
+        return "Simulation not running."
+    simulationTask.cancel()
+    try:
+        await simulationTask
+    except asyncio.CancelledError:
+        pass
+    return "Simulation stopped."
+
+
+@app.get("/simulationStatus")
+async def simulationStatus():
+    """
+    simulationStatus
+    Returns whether the simulation control loop is running along
+    with the simulation time, tick timing, clock sync, and
+    attacker request stats.
+    Example syntax: 
+     http://localhost:8081/simulationStatus
+    """
+    return {
+        "running": simulationTask != None and not simulationTask.done(),
+        "done": simulationDone,
+        "error": simulationError,
+        "simulationTime": simulationTime,
+        "ticks": tickScheduler.getStats(),
+        "clock": simulationClock.getStats(),
+        "attackers": attackerClient.getStats(),
+    }
+
+
+@app.on_event("shutdown")
+async def stopSimulationOnShutdown():
+    """
+    stopSimulationOnShutdown
+    Stops the simulation control loop and closes attacker
+    connections when the server stops.
+    """
+    await stopSimulation()
+    await asyncio.to_thread(fireDispatcher.flush, attackerTimeout)
+    fireDispatcher.close()
+    attackerClient.close()
+
+
 @app.get("/loadPersistentIPs")
 def loadPersistentIPs():
     """
@@ -1079,7 +1185,7 @@ def getRegion(target=teamname):
 
             # Select persistent first attacker address to query
             url = "http://" + attackerIPs[0] + "/REGISTER"
-            regionList = json.loads(requests.get(url).content)
+            regionList = json.loads(attackerClient.send("GET", url))
 
 
             global cid
@@ -1163,8 +1269,12 @@ def getRegion(target=teamname):
             # Execute final constructed statement to add to database.
             cur.execute(sql)
 
-        # Place missile batteries
-        createFiveBatteries()
+            # Buffer the new cities once for every missile class.
+            threatZoneCache.rebuild(cur, metersToDegreesNA(simCatRadiusConversion))
+
+            # Place missile batteries
+            placeNewBatteries(cur, batteryCount, batteryStrategy,
+                metersToDegreesNA(batteryCoverage))
 
 
         return "Assigned region loaded."
@@ -1212,15 +1322,25 @@ async def initializeSimulation():
                     ON active_missile_pings 
                     USING gist(intersects);
 
+                    CREATE INDEX active_missile_id_index
+                    ON active_missile_pings (missile_id);
+
                     DROP TABLE IF EXISTS solved_missile_pings;
                     CREATE TABLE solved_missile_pings (id SERIAL PRIMARY KEY, intersects geometry, time_code INT, missile_type TEXT, missile_id INT); 
                     
                     CREATE INDEX solved_index
                     ON solved_missile_pings 
                     USING gist(intersects);
+
+                    CREATE INDEX solved_missile_id_index
+                    ON solved_missile_pings (missile_id);
                 """
 
             cur.execute(sql)
+
+            # Databases made before the fire dispatch table existed
+            # won't have it, and createTables only runs once.
+            cur.execute(fireDispatchTableSQL)
             return "Simulation databases reset. Simulation ready."
     except:
         if(simulationDebugLevel > 0):
@@ -1484,6 +1604,9 @@ async def createTables():
                     CREATE INDEX active_index
                     ON active_missile_pings 
                     USING gist(intersects);
+
+                    CREATE INDEX active_missile_id_index
+                    ON active_missile_pings (missile_id);
                 """
             cur.execute(sql)
         with DatabaseCursor(confPath) as cur:
@@ -1495,6 +1618,9 @@ async def createTables():
                     CREATE INDEX solved_index
                     ON solved_missile_pings 
                     USING gist(intersects);
+
+                    CREATE INDEX solved_missile_id_index
+                    ON solved_missile_pings (missile_id);
                 """
             cur.execute(sql)
         with DatabaseCursor(confPath) as cur:
@@ -1508,6 +1634,9 @@ async def createTables():
                     USING gist(intersects);
                 """
             cur.execute(sql)
+        with DatabaseCursor(confPath) as cur:
+            # Create fire solution dispatch table
+            cur.execute(fireDispatchTableSQL)
 
         return "Necessary missing tables created."
     except:
@@ -1610,6 +1739,18 @@ async def destroyTables():
                     DROP TABLE IF EXISTS logged_intercepts;
                 """
             cur.execute(sql)
+        with DatabaseCursor(confPath) as cur:
+            sql = \
+                f"""
+                    DROP TABLE IF EXISTS fire_dispatches;
+                """
+            cur.execute(sql)
+        with DatabaseCursor(confPath) as cur:
+            sql = \
+                f"""
+                    DROP TABLE IF EXISTS threat_zones;
+                """
+            cur.execute(sql)
 
         return "Necessary missing tables destroyed."
     except:
@@ -1712,6 +1853,12 @@ async def tableMaintenance():
                     VACUUM ANALYZE logged_intercepts;
                 """
             cur.execute(sql)
+        with DatabaseCursor(confPath) as cur:
+            sql = \
+                f"""
+                    VACUUM ANALYZE fire_dispatches;
+                """
+            cur.execute(sql)
 
             return "Maintenance on tables complete."
     except:
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+##############################################################################
+# Author: Caleb Sneath
+# Assignment: P01 - Project Setup
+# Date: September 8, 2022
+# Python 3.9.5
+# Project Version: 0.1.0
+#
+# Description: Benchmarks findClosest. Loads filtered_cities.csv into its
+# own table with a GiST index on geom::geography, then measures queries
+# per second for the original MIN subquery and for the KNN query at
+# k = 1, 10, and 100, one point per query and in batches.
+#
+# Running Instructions:
+# Fill out .config.json the same way as for spatialapi.py, then run
+# "python3 benchmark_closest.py [queries]" in this directory.
+# Warning: Replaces the benchmark_cities table.
+##############################################################################
+
+import random
+import sys
+import time
+
+from spatialapi import DatabaseCursor, nearestNeighborSQL
+
+tableName = "benchmark_cities"
+
+
+def loadCities(cur):
+    """
+    loadCities
+    Copies filtered_cities.csv into the benchmark table and
+    indexes it the same way as SQL Statements.txt.
+    """
+    cur.execute(
+        f"""
+        DROP TABLE IF EXISTS {tableName};
+        CREATE TABLE {tableName} (id INT, latitude FLOAT, longitude FLOAT,
+            name VARCHAR(64), abbreviation VARCHAR(4), territory VARCHAR(64),
+            PRIMARY KEY (id));
+        """)
+    with open("filtered_cities.csv") as csvFile:
+        cur.copy_expert(f"""COPY {tableName} (id, latitude, longitude, name,
+            abbreviation, territory) FROM STDIN WITH (FORMAT csv)""", csvFile)
+    cur.execute(
+        f"""
+        ALTER TABLE {tableName} ADD COLUMN geom geometry(Point, 4326);
+        UPDATE {tableName} SET geom = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326);
+        CREATE INDEX {tableName}_geography_index ON {tableName} USING gist((geom::geography));
+        ANALYZE {tableName};
+        SELECT COUNT(*) FROM {tableName};
+        """)
+    return cur.fetchone()[0]
+
+
+def randomPoints(count):
+    """
+    randomPoints
+    Returns count (longitude, latitude) points over the
+    continental United States.
+    """
+    return [(random.uniform(-124, -67), random.uniform(25, 49)) for point in range(0, count)]
+
+
+def runOriginal(cur, points):
+    """
+    runOriginal
+    The original findClosest query, one point at a time.
+    """
+    for longitude, latitude in points:
+        cur.execute(
+            f"""
+            SELECT * FROM {tableName}
+              WHERE ((ST_Distance(geom, ST_SetSRID(ST_MakePoint({longitude}, {latitude}), 4326))) =
+                (SELECT MIN(ST_Distance(geom, ST_SetSRID(ST_MakePoint({longitude}, {latitude}), 4326)))
+                    FROM {tableName}));
+            """)
+        cur.fetchone()
+
+
+def runNearest(cur, points, k, batchSize):
+    """
+    runNearest
+    The KNN query, sending batchSize points per query.
+    """
+    sql = nearestNeighborSQL(tableName)
+    for first in range(0, len(points), batchSize):
+        batch = points[first:first + batchSize]
+        cur.execute(sql, {
+            "longitudes": [point[0] for point in batch],
+            "latitudes": [point[1] for point in batch],
+            "k": k,
+            "radius": None,
+        })
+        cur.fetchall()
+
+
+def queriesPerSecond(function, points):
+    """
+    queriesPerSecond
+    Times function over points and returns points per second.
+    """
+    start = time.perf_counter()
+    function(points)
+    return len(points) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    queries = 500
+    if len(sys.argv) > 1:
+        queries = int(sys.argv[1])
+
+    random.seed(5443)
+    with DatabaseCursor(".config.json") as cur:
+        print(f"Loaded {loadCities(cur)} cities.")
+        points = randomPoints(queries)
+
+        # The full scan is slow, so it only gets a sample.
+        original = queriesPerSecond(lambda sample: runOriginal(cur, sample),
+            points[:max(1, queries // 10)])
+        print(f"{'Query':<24} {'k':>5} {'Queries/s':>12} {'Speedup':>9}")
+        print(f"{'Original MIN subquery':<24} {1:>5} {original:12.1f} {1.0:8.1f}x")
+
+        for k in [1, 10, 100]:
+            for label, batchSize in [("KNN", 1), ("KNN batch of 100", 100)]:
+                rate = queriesPerSecond(lambda sample: runNearest(cur, sample, k, batchSize), points)
+                print(f"{label:<24} {k:>5} {rate:12.1f} {rate / original:8.1f}x")
+
+        cur.execute(f"DROP TABLE IF EXISTS {tableName};")
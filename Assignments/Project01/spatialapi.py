@@ -9,15 +9,24 @@
 # Description: A simple Python database API created for educational purposes.
 # Contains three initial functions: 
 # findOne: Takes the passed in attribute and value, then returns the
-# first matching row in the table.
+# first matching row in the table. Runs a statement prepared once per
+# column, and caches recent lookups.
 # Example syntax: 
 # http://localhost:8081/findOne/abbreviation=TX
-# findAll: Returns the contents of every row in the table.
+# findAll: Returns the contents of every row in the table, optionally
+# one page at a time, streamed as NDJSON or GeoJSON, only some fields,
+# or with simplified geometry.
 # Example syntax: 
 # http://localhost:8081/findAll/
-# findClosest: 
+# http://localhost:8081/findAll/?limit=100&after=2228&fields=id,name
+# findClosest: Returns the closest row to a point, or the k closest
+# within an optional radius in meters.
 # Example syntax: 
 # http://localhost:8081/findClosest/longitude=-150.0&latitude=65.0
+# findClosestBatch: Returns the k closest rows for each of many points
+# posted as a list of [longitude, latitude] pairs.
+# Example syntax: 
+# POST http://localhost:8081/findClosestBatch/?k=3
 #
 # Building: Requires Python (Tested for 3.9.5), FastAPI, and psycopg2.
 # To install the last two, simply run in the terminal:
@@ -47,7 +56,7 @@
 
 # Libraries for FastAPI
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
@@ -59,6 +68,37 @@ from math import radians, degrees, cos, sin, asin, sqrt, pow, atan2
 import os
 import json
 import sys
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+def connectDatabase(conn_config):
+    """
+    connectDatabase
+    Opens a connection from the settings in a loaded config
+    file, with the search path set to its schema.
+    """
+    conn = psycopg2.connect(
+        "dbname='"
+        + conn_config["dbname"]
+        + "' "
+        + "user='"
+        + conn_config["user"]
+        + "' "
+        + "host='"
+        + conn_config["host"]
+        + "' "
+        + "password='"
+        + conn_config["password"]
+        + "' "
+        + "port="
+        + conn_config["port"]
+        + " "
+    )
+    cur = conn.cursor()
+    cur.execute("SET search_path TO " + conn_config["schema"])
+    cur.close()
+    return conn
 
 class DatabaseCursor(object):
     """
@@ -73,31 +113,21 @@ class DatabaseCursor(object):
     enter-and-exit
     """
 
-    def __init__(self, conn_config_file):
+    def __init__(self, conn_config_file, name = None):
         with open(conn_config_file) as config_file:
             self.conn_config = json.load(config_file)
+        # A name makes a server side cursor that fetches rows in
+        # batches as they are iterated instead of all at once.
+        self.name = name
 
     # Load object from information from the config file
     def __enter__(self):
-        self.conn = psycopg2.connect(
-            "dbname='"
-            + self.conn_config["dbname"]
-            + "' "
-            + "user='"
-            + self.conn_config["user"]
-            + "' "
-            + "host='"
-            + self.conn_config["host"]
-            + "' "
-            + "password='"
-            + self.conn_config["password"]
-            + "' "
-            + "port="
-            + self.conn_config["port"]
-            + " "
-        )
-        self.cur = self.conn.cursor()
-        self.cur.execute("SET search_path TO " + self.conn_config["schema"])
+        self.conn = connectDatabase(self.conn_config)
+        if self.name != None:
+            self.cur = self.conn.cursor(name=self.name)
+            self.cur.itersize = streamBatchSize
+        else:
+            self.cur = self.conn.cursor()
 
         return self.cur
 
@@ -107,6 +137,173 @@ class DatabaseCursor(object):
         self.conn.commit()
         self.conn.close()
 
+# Rows a streaming cursor fetches from the server at a time.
+streamBatchSize = 2000
+
+# Settings from .config.json and the layout of its table, read once
+# on first use instead of on every request.
+configAttributes = None
+tableInfo = None
+
+def getConfig():
+    """
+    getConfig
+    Returns the settings from .config.json, reading the
+    file only the first time.
+    """
+    global configAttributes
+    if configAttributes == None:
+        with open(".config.json") as config_file:
+            configAttributes = json.load(config_file)
+    return configAttributes
+
+def getTableInfo(cur):
+    """
+    getTableInfo
+    Returns the configured table's name, its columns in 
+    order, which of them are geometry, and its primary key
+    column, looking them up only the first time.
+    """
+    global tableInfo
+    if tableInfo == None:
+        tableName = getConfig()["table"]
+        cur.execute(
+            """
+            SELECT column_name, udt_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+            ORDER BY ordinal_position;
+            """, (tableName,))
+        columns = cur.fetchall()
+        cur.execute(
+            """
+            SELECT attribute.attname FROM pg_index AS tableIndex
+            JOIN pg_attribute AS attribute ON attribute.attrelid = tableIndex.indrelid
+                AND attribute.attnum = ANY(tableIndex.indkey)
+            WHERE tableIndex.indrelid = %s::regclass AND tableIndex.indisprimary;
+            """, (tableName,))
+        keys = cur.fetchall()
+        tableInfo = {
+            "table": tableName,
+            "columns": [column[0] for column in columns],
+            "geometry": [column[0] for column in columns if column[1] in ("geometry", "geography")],
+            # Keyset paging needs a single column key.
+            "primaryKey": keys[0][0] if len(keys) == 1 else None,
+        }
+    return tableInfo
+
+def quoteIdentifier(name):
+    """
+    quoteIdentifier
+    Double quotes a column or table name for SQL.
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+class LookupQueries(object):
+    """
+    LookupQueries
+    Answers findOne lookups over one long lived connection.
+    The table's columns are read once, and a statement is 
+    prepared for each non geometry column so lookups only 
+    bind a value instead of being parsed and planned again.
+    Recent results are kept in a least recently used cache.
+    """
+
+    def __init__(self, conn_config_file, cacheSize = 1024):
+        self.conn_config_file = conn_config_file
+        self.cacheSize = cacheSize
+        self.conn = None
+        self.statements = {}
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        """
+        connect
+        Opens the connection and prepares one statement per
+        column that may be looked up.
+        """
+        with open(self.conn_config_file) as config_file:
+            conn_config = json.load(config_file)
+        self.conn = connectDatabase(conn_config)
+        # Each lookup stands alone, so a bad value can't leave
+        # the connection in a failed transaction.
+        self.conn.autocommit = True
+        cur = self.conn.cursor()
+        info = getTableInfo(cur)
+        self.statements = {}
+        for index, column in enumerate(info["columns"]):
+            if column in info["geometry"]:
+                continue
+            name = "find_one_" + str(index)
+            cur.execute(f"""PREPARE {name} AS SELECT * FROM {quoteIdentifier(info['table'])}
+                WHERE {quoteIdentifier(column)} = $1 LIMIT 1""")
+            self.statements[column] = name
+        cur.close()
+
+    def findOne(self, attribute, value):
+        """
+        findOne
+        Returns the first row where attribute equals value, or
+        None. Like an unquoted column name in SQL, attribute is
+        matched without regard to case. Raises KeyError for
+        columns that can't be looked up.
+        """
+        with self.lock:
+            if self.conn == None or self.conn.closed:
+                self.connect()
+            if attribute not in self.statements:
+                attribute = attribute.lower()
+            statement = self.statements[attribute]
+
+            if (attribute, value) in self.cache:
+                self.cache.move_to_end((attribute, value))
+                self.hits += 1
+                return self.cache[(attribute, value)]
+
+            cur = self.conn.cursor()
+            try:
+                cur.execute(f"EXECUTE {statement} (%s)", (value,))
+                queryTuple = cur.fetchone()
+            finally:
+                cur.close()
+
+            self.misses += 1
+            self.cache[(attribute, value)] = queryTuple
+            if len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+            return queryTuple
+
+    def open(self):
+        """
+        open
+        Connects and prepares the statements ahead of the first
+        lookup.
+        """
+        with self.lock:
+            if self.conn == None or self.conn.closed:
+                self.connect()
+
+    def getStats(self):
+        with self.lock:
+            return {
+                "columns": list(self.statements.keys()),
+                "cached": len(self.cache),
+                "cacheSize": self.cacheSize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def close(self):
+        with self.lock:
+            if self.conn != None and not self.conn.closed:
+                self.conn.close()
+            self.conn = None
+            self.cache.clear()
+
+lookupQueries = LookupQueries(".config.json")
+
 
 description = \
 """
@@ -135,6 +332,8 @@ async def docs_redirect():
 findOne
 Returns a single tuple based on a column name (attribute) 
 and value (e.g id=1299 , or name=texas).
+Note: Only the table's non geometry columns can be used,
+and repeated lookups are answered from a cache.
 Example syntax: 
  http://localhost:8081/findOne/abbreviation=TX
 """
@@ -143,7 +342,6 @@ async def findOne(target):
     # Declare variables with proper scope
     attribute = ""
     value = ""
-    tableName = ""
 
     try:
         # Extract our two fields from the URL 
@@ -155,61 +353,227 @@ async def findOne(target):
         return ("Invalid URL field.")
 
     try:
-        with DatabaseCursor(".config.json") as cur:
-            with open(".config.json") as config_file:
-                # Try to grab table name from the config file.
-                configAttributes = json.load(config_file)
-                tableName = configAttributes["table"]
-
-            # Construct proper SQL query
-            sql = f"""SELECT * from {tableName} 
-                    WHERE {attribute} = '{value}' LIMIT 5"""
-            cur.execute(sql)
-            queryTuple = cur.fetchone()
-            return queryTuple
+        return lookupQueries.findOne(attribute, value)
+    except KeyError:
+        return ("Invalid column field.")
     except:
         return ("Host database configuration error or invalid column field.")
 
+"""
+findOneStats
+Returns the columns findOne can use and how often its
+cache has been hit.
+Example syntax: 
+ http://localhost:8081/findOneStats/
+"""
+@app.get("/findOneStats/")
+async def findOneStats():
+    return lookupQueries.getStats()
+
+@app.on_event("startup")
+def openLookupQueries():
+    # Read the columns and prepare the lookups before the first
+    # request. If the database isn't up yet, findOne connects
+    # on first use instead.
+    try:
+        lookupQueries.open()
+    except:
+        pass
+
+@app.on_event("shutdown")
+def closeLookupQueries():
+    lookupQueries.close()
+
 """
 findAll
-Returns all the tuples from your table
+Returns all the tuples from your table.
+Optionally:
+ fields: Comma separated columns to return instead of all.
+ limit and after: Returns one page of at most limit rows
+  ordered by the primary key, starting after the key value
+  given. The result holds the "rows" and the "next" value
+  of after, which is null on the last page.
+ tolerance: Simplifies geometry columns by this many units
+  at the database before they are sent.
+ format: "json" by default. "ndjson" streams one JSON object
+  per line and "geojson" streams a FeatureCollection, both
+  from a server side cursor with geometry as GeoJSON.
 Example syntax: 
  http://localhost:8081/findAll/
+ http://localhost:8081/findAll/?limit=100&after=2228&fields=id,name
+ http://localhost:8081/findAll/?format=geojson&tolerance=0.01
 """
 @app.get("/findAll/")
-async def findAll():
-    tableName = ""
-
+async def findAll(fields: Optional[str] = None, after: Optional[str] = None,
+    limit: Optional[int] = None, tolerance: Optional[float] = None,
+    format: str = "json"):
     try:
         with DatabaseCursor(".config.json") as cur:
-            with open(".config.json") as config_file:
-                # Try to grab table name from the config file.
-                configAttributes = json.load(config_file)
-                tableName = configAttributes["table"]
-
-            # Construct proper SQL query statement
-            sql = f"""SELECT * FROM {tableName}"""
-            cur.execute(sql)
-            queryTuple = cur.fetchall()
-            return queryTuple
+            info = getTableInfo(cur)
     except:
         return ("Host database configuration error or invalid column field.")
 
+    # Only columns that exist in the table may be selected.
+    columns = info["columns"]
+    if fields != None:
+        columns = [field.strip() for field in fields.split(",") if field.strip() != ""]
+        if len(columns) == 0 or any(column not in info["columns"] for column in columns):
+            return ("Invalid column field.")
+    if format not in ("json", "ndjson", "geojson"):
+        return ("Invalid format field.")
+    paged = after != None or limit != None
+    if paged and info["primaryKey"] == None:
+        return ("Table has no single column primary key to page by.")
+
+    # Geometry is simplified at the database when asked, and turned
+    # into GeoJSON there for the streamed formats.
+    selections = []
+    for column in columns:
+        selection = quoteIdentifier(column)
+        if column in info["geometry"]:
+            if tolerance != None:
+                selection = f"ST_SimplifyPreserveTopology({selection}, %(tolerance)s)"
+            if format != "json":
+                selection = f"ST_AsGeoJSON({selection})::json"
+        selections.append(selection)
+
+    sql = f"SELECT {', '.join(selections)} FROM {quoteIdentifier(info['table'])}"
+    if paged:
+        key = quoteIdentifier(info["primaryKey"])
+        sql = f"SELECT {key}, {', '.join(selections)} FROM {quoteIdentifier(info['table'])}"
+        if after != None:
+            sql += f" WHERE {key} > %(after)s"
+        sql += f" ORDER BY {key}"
+        if limit != None:
+            sql += " LIMIT %(limit)s"
+    parameters = {"after": after, "limit": max(0, limit or 0), "tolerance": tolerance}
+
+    if format == "json":
+        try:
+            with DatabaseCursor(".config.json") as cur:
+                cur.execute(sql, parameters)
+                queryTuple = cur.fetchall()
+        except:
+            return ("Host database configuration error or invalid column field.")
+        if not paged:
+            return queryTuple
+        nextKey = None
+        if limit != None and len(queryTuple) == limit and len(queryTuple) > 0:
+            nextKey = queryTuple[-1][0]
+        return {"rows": [row[1:] for row in queryTuple], "next": nextKey}
+
+    return StreamingResponse(streamRows(sql, parameters, columns, info, paged, format),
+        media_type="application/x-ndjson" if format == "ndjson" else "application/geo+json")
+
+def streamRows(sql, parameters, columns, info, paged, format):
+    """
+    streamRows
+    Yields the rows of a findAll query as NDJSON lines or as
+    pieces of a GeoJSON FeatureCollection, pulling them from a
+    server side cursor a batch at a time. The first geometry
+    column becomes each feature's geometry.
+    """
+    geometryColumn = next((column for column in columns if column in info["geometry"]), None)
+    if format == "geojson":
+        yield '{"type": "FeatureCollection", "features": [\n'
+
+    first = True
+    with DatabaseCursor(".config.json", name="findAll") as cur:
+        cur.execute(sql, parameters)
+        for row in cur:
+            if paged:
+                row = row[1:]
+            record = dict(zip(columns, row))
+            if format == "ndjson":
+                yield json.dumps(record, default=str) + "\n"
+                continue
+
+            geometry = record.pop(geometryColumn, None)
+            feature = {"type": "Feature", "geometry": geometry, "properties": record}
+            yield ("" if first else ",\n") + json.dumps(feature, default=str)
+            first = False
+
+    if format == "geojson":
+        yield "\n]}\n"
+
+# Most neighbours one query point may ask for.
+maxNeighbors = 1000
+
+def nearestNeighborSQL(tableName, radius = None):
+    """
+    nearestNeighborSQL
+    Builds the nearest neighbour query shared by findClosest and
+    findClosestBatch. Every query point is joined LATERAL to its
+    own KNN search, which walks the GiST index on 
+    geom::geography with the <-> operator instead of measuring
+    every row. Distances are in meters on the spheroid, and a 
+    radius in meters limits the search when given.
+    Parameters: longitudes, latitudes, k, and radius.
+    """
+    radiusFilter = ""
+    if radius != None:
+        radiusFilter = \
+            "WHERE ST_DWithin(candidate.geom::geography, query.point, %(radius)s)"
+
+    return \
+        f"""
+        SELECT query.ordinal, nearest.* FROM
+            (SELECT ordinal, ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography AS point
+                FROM unnest(%(longitudes)s::float8[], %(latitudes)s::float8[])
+                WITH ORDINALITY AS points (longitude, latitude, ordinal)) AS query
+        CROSS JOIN LATERAL
+            (SELECT candidate.*, ST_Distance(candidate.geom::geography, query.point) AS distance
+                FROM {tableName} AS candidate
+                {radiusFilter}
+                ORDER BY candidate.geom::geography <-> query.point
+                LIMIT %(k)s) AS nearest
+        ORDER BY query.ordinal, nearest.distance;
+        """
+
+def findNearest(points, k, radius):
+    """
+    findNearest
+    Runs one nearest neighbour query for a list of 
+    (longitude, latitude) points. Returns a list with the
+    matching rows for each point, closest first, and the
+    distance in meters added as the last column.
+    """
+    k = max(1, min(int(k), maxNeighbors))
+
+    with DatabaseCursor(".config.json") as cur:
+        cur.execute(nearestNeighborSQL(getConfig()["table"], radius), {
+            "longitudes": [float(point[0]) for point in points],
+            "latitudes": [float(point[1]) for point in points],
+            "k": k,
+            "radius": radius,
+        })
+
+        # Group the rows back up by the point that asked for them.
+        results = [[] for point in points]
+        for row in cur.fetchall():
+            results[row[0] - 1].append(row[1:])
+        return results
+
 """
 findClosest
 Returns a single tuple which contains the closest geometry 
-to the one passed in (e.g. lon=-123.63454&lat=34.74645).
+to the one passed in (e.g. lon=-123.63454&lat=34.74645),
+with its distance in meters as the last column.
+Optionally, k returns a list of the k closest instead, and
+radius only considers rows within that many meters.
 Note: Longitude parameter must be first and latitude second
 for correct usage, and geometry must be named, "geom".
+A GiST index on (geom::geography) keeps this fast, see
+SQL Statements.txt.
 Example syntax: 
  http://localhost:8081/findClosest/longitude=-150.0&latitude=65.0
+ http://localhost:8081/findClosest/longitude=-98.5&latitude=33.9?k=10&radius=50000
 """
 @app.get("/findClosest/{target}")
-async def findClosest(target):
+async def findClosest(target, k: int = 1, radius: Optional[float] = None):
     # Declare variables with proper scope
     value1 = ""
     value2 = ""
-    tableName = ""
     
     try:
         # Extract our four fields from the URL 
@@ -218,30 +582,40 @@ async def findClosest(target):
         targetSplit = (target.replace('&', '=')).split("=")
         #attribute1 = targetSplit[0]
         #attribute2 = targetSplit[2]
-        value1 = str(targetSplit[1])
-        value2 = str(targetSplit[3])
+        value1 = float(targetSplit[1])
+        value2 = float(targetSplit[3])
     except:
         return ("Invalid URL field.")
 
     try:
-        with DatabaseCursor(".config.json") as cur:
-            with open(".config.json") as config_file:
-                # Try to grab table name from the config file.
-                configAttributes = json.load(config_file)
-                tableName = configAttributes["table"]
-
-            # Construct proper SQL query statement
-            sql = \
-                f"""
-                SELECT * FROM {tableName}
-                  WHERE ((ST_Distance(geom, ST_SetSRID(ST_MakePoint({value1}, {value2}), 4326))) =
-	                (SELECT MIN(ST_Distance(geom, ST_SetSRID(ST_MakePoint({value1}, {value2}), 4326)))
-	  	                FROM {tableName}));
-                """
-            print(sql)
-            cur.execute(sql)
-            queryTuple = cur.fetchone()
-            return queryTuple
+        nearest = findNearest([(value1, value2)], k, radius)[0]
+        if k == 1:
+            if len(nearest) == 0:
+                return None
+            return nearest[0]
+        return nearest
+    except:
+        return ("Host database configuration error or invalid column field.")
+
+"""
+findClosestBatch
+Finds the closest geometries to many points in one request.
+The body is a list of [longitude, latitude] pairs, and the
+result is a list holding the k closest tuples for each pair
+in the same order, with distances in meters as the last 
+column.
+Example syntax: 
+ POST http://localhost:8081/findClosestBatch/?k=3
+ [[-150.0, 65.0], [-98.5, 33.9]]
+"""
+@app.post("/findClosestBatch/")
+async def findClosestBatch(points: List[List[float]], k: int = 1, radius: Optional[float] = None):
+    # Each point must be exactly a longitude and a latitude.
+    if any(len(point) != 2 for point in points):
+        return ("Invalid point list.")
+
+    try:
+        return findNearest(points, k, radius)
     except:
         return ("Host database configuration error or invalid column field.")
 